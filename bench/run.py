@@ -0,0 +1,327 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench import synth
+from network import filters
+from network.classifier import FrameClassifier
+from network.flows import FlowTable
+from network.reassembly import FragmentReassembler, StreamReassembler
+from network.sampling import FlowSampler
+from network.compact import CompactEthernetFrameParser
+from network.lazy import LazyEthernetFrameParser
+from network.render import FrameRenderer
+from network.parsers import EthernetFrameParser, Ipv6FrameParser, Ipv4FrameParser, TcpFrameParser, UdpFrameParser
+from network.stats import TrafficStatistics
+from saver.columnar import ColumnarSaver
+from saver.index import IndexedPcapSaver, IndexWriter
+from saver.pcap import PcapSaver
+
+try:
+    from network import batch
+except ImportError:  # numpy is optional
+    batch = None
+
+# Each benchmark gets list of raw frames and returns (items, func, packets per item),
+# func is called for every item and its time and allocations are measured.
+BENCHMARKS = {}
+
+_ALLOCATION_SAMPLE = 2000
+_DECODE_BATCH = 1024
+_SNAPLEN = 96
+FILTER = 'tcp and dst port 443 and src net 10.0.0.0/8 and not syn'
+
+_temporary = contextlib.ExitStack()
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _eager_parser():
+    tcp = TcpFrameParser()
+    udp = UdpFrameParser()
+
+    return EthernetFrameParser(Ipv4FrameParser(tcp, udp), Ipv6FrameParser(tcp, udp))
+
+
+@benchmark('classify')
+def _classify(frames):
+    return frames, FrameClassifier().classify, 1
+
+
+@benchmark('filter')
+def _filter(frames):
+    return frames, filters.compile_predicate(FILTER), 1
+
+
+@benchmark('filter-protocol')
+def _filter_protocol(frames):
+    return frames, filters.compile_predicate('tcp'), 1
+
+
+@benchmark('parse')
+def _parse(frames):
+    return frames, _eager_parser().parse, 1
+
+
+@benchmark('parse-lazy')
+def _parse_lazy(frames):
+    return frames, LazyEthernetFrameParser().parse, 1
+
+
+@benchmark('parse-compact')
+def _parse_compact(frames):
+    return frames, CompactEthernetFrameParser().parse, 1
+
+
+@benchmark('parse-pool')
+def _parse_pool(frames):
+    return frames, CompactEthernetFrameParser(pool_size=64).parse, 1
+
+
+@benchmark('describe')
+def _describe(frames):
+    parser = _eager_parser()
+    parsed = [frame for frame in map(parser.parse, frames) if frame is not None]
+
+    return parsed, lambda frame: frame.get_description(), 1
+
+
+@benchmark('render-compact')
+def _render_compact(frames):
+    parser = _eager_parser()
+    parsed = [frame for frame in map(parser.parse, frames) if frame is not None]
+
+    return parsed, FrameRenderer(compact=True).render, 1
+
+
+@benchmark('render-headers')
+def _render_headers(frames):
+    parser = _eager_parser()
+    parsed = [frame for frame in map(parser.parse, frames) if frame is not None]
+
+    return parsed, FrameRenderer(payload=0).render, 1
+
+
+@benchmark('flows')
+def _flows(frames):
+    parser = _eager_parser()
+    parsed = [frame for frame in map(parser.parse, frames) if frame is not None]
+
+    for i, frame in enumerate(parsed):
+        frame.timestamp = i * 1000
+
+    return parsed, FlowTable().update, 1
+
+
+@benchmark('streams')
+def _streams(frames):
+    return frames, StreamReassembler().update, 1
+
+
+@benchmark('defragment')
+def _defragment(frames):
+    return frames, FragmentReassembler().feed, 1
+
+
+@benchmark('sample-flows')
+def _sample_flows(frames):
+    return frames, FlowSampler(8).keep, 1
+
+
+@benchmark('stats')
+def _stats(frames):
+    return frames, TrafficStatistics().update, 1
+
+
+@benchmark('pcap-save')
+def _pcap_save(frames):
+    s = PcapSaver(os.devnull)
+
+    return frames, s.save, 1
+
+
+@benchmark('pcap-save-indexed')
+def _pcap_save_indexed(frames):
+    s = IndexedPcapSaver(PcapSaver(os.devnull), IndexWriter(os.devnull))
+
+    return frames, s.save, 1
+
+
+@benchmark('pcap-save-gzip')
+def _pcap_save_gzip(frames):
+    directory = _temporary.enter_context(tempfile.TemporaryDirectory())
+    s = _temporary.enter_context(PcapSaver(os.path.join(directory, 'frames.pcap.gz')))
+
+    return frames, s.save, 1
+
+
+@benchmark('columnar-save')
+def _columnar_save(frames):
+    directory = _temporary.enter_context(tempfile.TemporaryDirectory())
+    s = _temporary.enter_context(ColumnarSaver(os.path.join(directory, 'frames.col')))
+
+    return frames, s.save, 1
+
+
+@benchmark('pcap-save-snaplen')
+def _pcap_save_snaplen(frames):
+    s = PcapSaver(os.devnull, snaplen=_SNAPLEN)
+
+    return frames, s.save, 1
+
+
+if batch is not None:
+    @benchmark('decode-batch')
+    def _decode_batch(frames):
+        size = min(len(frames), _DECODE_BATCH)
+
+        return [frames[i:i + size] for i in range(0, len(frames) - size + 1, size)], batch.decode_frames, size
+
+
+@benchmark('sniffer')
+def _sniffer(frames):
+    from saver.output import OutputOptions
+    from sniffer import Sniffer, SnifferOptions
+
+    directory = _temporary.enter_context(tempfile.TemporaryDirectory())
+    filename = os.path.join(directory, 'frames.pcap')
+    synth.write_pcap(filename, frames)
+
+    def run(path):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            Sniffer(SnifferOptions(read=path, output=OutputOptions(filename=os.devnull))).run()
+
+    return [filename], run, len(frames)
+
+
+def measure(setup, frames, repeat):
+    items, func, scale = setup(frames)
+    best = None
+
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter_ns()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    packets = len(items) * scale
+    sample = items[:_ALLOCATION_SAMPLE]
+    allocated = 0
+
+    tracemalloc.start()
+    for item in sample:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func(item)
+        allocated += tracemalloc.get_traced_memory()[1] - before
+
+    # memory still held when results of func are kept, e.g. frames kept for flow analysis
+    kept = []
+    before = tracemalloc.get_traced_memory()[0]
+    for item in sample:
+        kept.append(func(item))
+    retained = tracemalloc.get_traced_memory()[0] - before
+    del kept
+    tracemalloc.stop()
+
+    return {
+        'packets': packets,
+        'seconds': best / 1e9,
+        'pps': packets / (best / 1e9) if best else None,
+        'ns_per_packet': best / packets if packets else None,
+        # peak of traced memory while processing a packet, approximates bytes allocated per packet
+        'alloc_bytes_per_packet': allocated / (len(sample) * scale) if sample else None,
+        'retained_bytes_per_packet': retained / (len(sample) * scale) if sample else None,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(names, count, seed, repeat, mix=None):
+    frames = synth.make_frames(count, seed, mix)
+
+    with _temporary:
+        results = {name: measure(BENCHMARKS[name], frames, repeat) for name in names}
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'frames': count,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+
+        if old is None or not old['pps'] or not result['pps']:
+            print(f'{name:<16} {result["pps"]:>14,.0f} pps')
+            continue
+
+        print(f'{name:<16} {result["pps"]:>14,.0f} pps  x{result["pps"] / old["pps"]:.2f} '
+              f'{result["alloc_bytes_per_packet"]:>10.1f} B/pkt (was {old["alloc_bytes_per_packet"]:.1f})')
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Benchmarks of parsing, rendering and saving of synthetic frames. '
+                                                 'Needs neither superuser privileges nor network interface.')
+
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}')
+    parser.add_argument('-n', '--number', help='number of synthetic frames', default=10000, type=int)
+    parser.add_argument('--seed', help='seed of frame generator', default=0, type=int)
+    parser.add_argument('--repeat', help='number of runs, best one is reported', default=3, type=int)
+    parser.add_argument('-o', '--out', help='file to save results in json format')
+    parser.add_argument('-c', '--compare', help='json file with results to compare with')
+
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            raise SystemExit(f'Unknown benchmark: {name}')
+
+    report = run(args.names or list(BENCHMARKS), args.number, args.seed, args.repeat)
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
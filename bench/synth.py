@@ -0,0 +1,91 @@
+import random
+import struct
+
+from saver.pcap import PcapSaver
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+SMALL = 'small'
+LARGE = 'large'
+JUMBO = 'jumbo'
+_PAYLOAD_SIZES = {SMALL: (0, 64), LARGE: (512, 1460), JUMBO: (8000, 8960)}
+
+# share of each kind of frame in the default mix, roughly like a busy server link
+DEFAULT_MIX = [
+    (('ipv4', 'tcp', SMALL), 30),
+    (('ipv4', 'tcp', LARGE), 25),
+    (('ipv4', 'udp', SMALL), 15),
+    (('ipv4', 'udp', LARGE), 5),
+    (('ipv6', 'tcp', SMALL), 8),
+    (('ipv6', 'tcp', LARGE), 5),
+    (('ipv6', 'udp', SMALL), 5),
+    (('ipv4', 'tcp', JUMBO), 2),
+    (('ipv6', 'udp', JUMBO), 1),
+    (('malformed', None, None), 4),
+]
+
+
+def ethernet(type_, payload, src=b'\x02\x00\x00\x00\x00\x01', dst=b'\x02\x00\x00\x00\x00\x02'):
+    return dst + src + struct.pack('! H', type_) + payload
+
+
+def ipv4(protocol, payload, src=b'\x0a\x00\x00\x01', dst=b'\x0a\x00\x00\x02', identifier=0, flags_offset=0x4000):
+    return struct.pack('! B B H H H B B H 4s 4s', 0x45, 0, 20 + len(payload), identifier, flags_offset,
+                       64, protocol, 0, src, dst) + payload
+
+
+def ipv6(next_header, payload, src=b'\xfd' + b'\x00' * 14 + b'\x01', dst=b'\xfd' + b'\x00' * 14 + b'\x02'):
+    return struct.pack('! I H B B 16s 16s', 6 << 28, len(payload), next_header, 64, src, dst) + payload
+
+
+def tcp(src_port, dst_port, payload=b'', seq=0, ack=0, flags=0x18, window=65535):
+    return struct.pack('! H H I I H H H H', src_port, dst_port, seq, ack, (5 << 12) | flags, window, 0, 0) + payload
+
+
+def udp(src_port, dst_port, payload=b''):
+    return struct.pack('! H H H H', src_port, dst_port, 8 + len(payload), 0) + payload
+
+
+def make_frame(rnd, internet, transport, size):
+    if internet == 'malformed':
+        frame = make_frame(rnd, 'ipv4', 'tcp', SMALL)
+        kind = rnd.randrange(3)
+
+        if kind == 0:
+            return frame[:rnd.randrange(1, 40)]  # truncated headers
+        if kind == 1:
+            return frame[:14] + b'\x65' + frame[15:]  # wrong IP version
+        return ethernet(0x0806, bytes(28))  # ARP, not parsed
+
+    payload = rnd.randbytes(rnd.randint(*_PAYLOAD_SIZES[size]))
+    src_port = rnd.randrange(1024, 65536)
+    dst_port = rnd.choice((53, 80, 443, 8080, rnd.randrange(1024, 65536)))
+
+    if transport == 'tcp':
+        segment = tcp(src_port, dst_port, payload, seq=rnd.getrandbits(32), ack=rnd.getrandbits(32))
+        protocol = _TCP_TYPE
+    else:
+        segment = udp(src_port, dst_port, payload)
+        protocol = _UDP_TYPE
+
+    if internet == 'ipv4':
+        return ethernet(_IPV4_TYPE, ipv4(protocol, segment, src=rnd.randbytes(4), dst=rnd.randbytes(4),
+                                         identifier=rnd.randrange(65536)))
+
+    return ethernet(_IPV6_TYPE, ipv6(protocol, segment, src=rnd.randbytes(16), dst=rnd.randbytes(16)))
+
+
+def make_frames(n, seed=0, mix=None):
+    rnd = random.Random(seed)
+    kinds, weights = zip(*(mix or DEFAULT_MIX))
+
+    return [make_frame(rnd, *kind) for kind in rnd.choices(kinds, weights, k=n)]
+
+
+def write_pcap(filename, frames, start=1500000000 * 1000000000, step=1000):
+    with PcapSaver(filename, nanoseconds=True) as s:
+        for i, frame in enumerate(frames):
+            s.save(frame, start + i * step)
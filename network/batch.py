@@ -0,0 +1,152 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from saver.pcap import PcapReader
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8, 0x9100)
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+# enough for ethernet header with two vlan tags, ipv4 header with options and start of tcp header
+_HEADER_SLAB = 96
+_INTERNET_HEADER = 40
+_TRANSPORT_HEADER = 14
+_BATCH_SIZE = 65536
+
+HEADER_DTYPE = np.dtype([
+    ('timestamp', np.int64),
+    ('length', np.uint32),
+    ('captured', np.uint32),
+    ('ethertype', np.uint16),
+    ('ip_version', np.uint8),
+    ('protocol', np.uint8),
+    ('src_hi', np.uint64),
+    ('src_lo', np.uint64),
+    ('dst_hi', np.uint64),
+    ('dst_lo', np.uint64),
+    ('src_port', np.uint16),
+    ('dst_port', np.uint16),
+    ('tcp_flags', np.uint16),
+    ('has_ports', np.bool_),
+])
+
+
+def _field(rows, start, dtype):
+    # big endian field at the same column of every row
+    return np.ascontiguousarray(rows[:, start:start + np.dtype(dtype).itemsize]).view(dtype)[:, 0]
+
+
+def _align(slab, offsets, width):
+    # rows of width bytes starting at per row offsets, there are only a few distinct offsets,
+    # so each of them is one slice instead of gathering every byte separately
+    result = np.zeros((len(slab), width), dtype=np.uint8)
+
+    for offset in np.flatnonzero(np.bincount(offsets)):
+        rows = offsets == offset
+        part = slab[rows, offset:offset + width]
+        result[rows, :part.shape[1]] = part
+
+    return result
+
+
+def _headers(data, offsets, captured):
+    # (n, _HEADER_SLAB) matrix of first bytes of every frame, zero past captured length
+    padded = np.concatenate((data, np.zeros(_HEADER_SLAB, dtype=np.uint8)))
+    slab = sliding_window_view(padded, _HEADER_SLAB)[offsets]
+    short = np.flatnonzero(captured < _HEADER_SLAB)
+
+    if len(short):
+        slab[short] *= np.arange(_HEADER_SLAB) < captured[short, None]
+
+    return slab
+
+
+def decode_buffer(buffer, offsets, captured, timestamps=None, lengths=None):
+    # Decodes frames stored in one buffer at given offsets into structured array of HEADER_DTYPE.
+    # Addresses are 128 bit integers split into hi and lo halves, ipv4 ones are in lo.
+    # Fields which frame does not have are zero.
+    offsets = np.asarray(offsets, dtype=np.int64)
+    captured = np.asarray(captured, dtype=np.int64)
+    n = len(offsets)
+    result = np.zeros(n, dtype=HEADER_DTYPE)
+
+    if n == 0:
+        return result
+
+    slab = _headers(np.frombuffer(buffer, dtype=np.uint8), offsets, captured)
+
+    result['timestamp'] = 0 if timestamps is None else timestamps
+    result['captured'] = captured
+    result['length'] = captured if lengths is None else lengths
+
+    l3 = np.full(n, 14, dtype=np.int64)
+    ethertype = _field(slab, 12, '>u2').astype(np.uint16)
+
+    for _ in range(2):
+        tagged = np.isin(ethertype, _VLAN_TYPES)
+
+        if not tagged.any():
+            break
+
+        inner = _field(_align(slab, l3 + 2, 2), 0, '>u2')
+        ethertype = np.where(tagged, inner, ethertype)
+        l3 += tagged * 4
+
+    result['ethertype'] = ethertype
+
+    internet = _align(slab, l3, _INTERNET_HEADER)
+    version = internet[:, 0] >> 4
+    ipv4 = (ethertype == _IPV4_TYPE) & (version == 4) & (captured >= l3 + 20)
+    ipv6 = (ethertype == _IPV6_TYPE) & (version == 6) & (captured >= l3 + 40)
+    fragment = ipv4 & ((_field(internet, 6, '>u2') & 0x1FFF) != 0)
+    protocol = np.where(ipv4, internet[:, 9], np.where(ipv6, internet[:, 6], 0))
+
+    result['ip_version'] = np.where(ipv4, 4, np.where(ipv6, 6, 0))
+    result['protocol'] = protocol
+    result['src_lo'] = np.where(ipv4, _field(internet, 12, '>u4'), np.where(ipv6, _field(internet, 16, '>u8'), 0))
+    result['dst_lo'] = np.where(ipv4, _field(internet, 16, '>u4'), np.where(ipv6, _field(internet, 32, '>u8'), 0))
+    result['src_hi'] = np.where(ipv6, _field(internet, 8, '>u8'), 0)
+    result['dst_hi'] = np.where(ipv6, _field(internet, 24, '>u8'), 0)
+
+    l4 = np.where(ipv4, l3 + (internet[:, 0] & 0xF).astype(np.int64) * 4, l3 + 40)
+    ports = (ipv4 | ipv6) & ((protocol == _TCP_TYPE) | (protocol == _UDP_TYPE)) & ~fragment & (captured >= l4 + 4)
+    tcp = ports & (protocol == _TCP_TYPE) & (captured >= l4 + 14)
+    transport = _align(slab, np.where(ports, l4, 0), _TRANSPORT_HEADER)
+
+    result['has_ports'] = ports
+    result['src_port'] = np.where(ports, _field(transport, 0, '>u2'), 0)
+    result['dst_port'] = np.where(ports, _field(transport, 2, '>u2'), 0)
+    result['tcp_flags'] = np.where(tcp, _field(transport, 12, '>u2') & 0x1FF, 0)
+
+    return result
+
+
+def decode_frames(packages, timestamps=None, lengths=None):
+    # packages is list of raw frames, e.g. output of recv_batch with timestamps of the generator,
+    # only their first bytes are copied into one buffer
+    heads = [package[:_HEADER_SLAB] for package in packages]
+    captured = np.fromiter(map(len, packages), dtype=np.int64, count=len(packages))
+    offsets = np.zeros(len(packages), dtype=np.int64)
+    np.cumsum(np.minimum(captured[:-1], _HEADER_SLAB), out=offsets[1:])
+
+    return decode_buffer(b''.join(heads), offsets, captured, timestamps, lengths)
+
+
+def decode_pcap(filename, batch_size=_BATCH_SIZE):
+    # yields structured arrays for consecutive batches of records of pcap file
+    with PcapReader(filename) as reader:
+        packages, timestamps, lengths = [], [], []
+
+        for timestamp, package, orig_len in reader:
+            packages.append(package)
+            timestamps.append(timestamp)
+            lengths.append(orig_len)
+
+            if len(packages) == batch_size:
+                yield decode_frames(packages, timestamps, lengths)
+                packages, timestamps, lengths = [], [], []
+
+        if packages:
+            yield decode_frames(packages, timestamps, lengths)
@@ -0,0 +1,225 @@
+import ctypes
+import itertools
+import socket
+import struct
+
+from network import filters
+
+# constants from /usr/include/linux/filter.h
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LD_B_IND = 0x50
+BPF_LDX_B_MSH = 0xB1
+BPF_AND_K = 0x54
+BPF_JEQ_K = 0x15
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+
+SO_ATTACH_FILTER = 26  # constant from /usr/include/asm-generic/socket.h
+MAX_SNAPLEN = 262144
+
+# offsets in frames without vlan tags, the kernel passes tags to packet sockets separately
+_ETH_TYPE_OFFSET = 12
+_IPV4_OFFSET = 14
+_IPV4_FRAGMENT_OFFSET = 14 + 6
+_IPV4_PROTO_OFFSET = 14 + 9
+_IPV4_SRC_OFFSET = 14 + 12
+_IPV4_DST_OFFSET = 14 + 16
+_IPV6_NEXT_HEADER_OFFSET = 14 + 6
+_IPV6_SRC_OFFSET = 14 + 8
+_IPV6_DST_OFFSET = 14 + 24
+_IPV6_TRANSPORT_OFFSET = 14 + 40
+_TCP_FLAGS_OFFSET = 13
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_ACCEPT = 'accept'
+_DROP = 'drop'
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_uint16), ('jt', ctypes.c_uint8), ('jf', ctypes.c_uint8), ('k', ctypes.c_uint32)]
+
+
+def assemble(items):
+    # items are (code, jt, jf, k) tuples, where jt and jf may be label names,
+    # and plain strings which mark position of the label
+    labels = {}
+    instructions = []
+
+    for item in items:
+        if isinstance(item, str):
+            labels[item] = len(instructions)
+        else:
+            instructions.append(item)
+
+    program = []
+
+    for i, (code, jt, jf, k) in enumerate(instructions):
+        if isinstance(jt, str):
+            jt = labels[jt] - i - 1
+        if isinstance(jf, str):
+            jf = labels[jf] - i - 1
+        if not 0 <= jt <= 255 or not 0 <= jf <= 255:
+            raise ValueError('Jump is too long for classic BPF')
+
+        program.append((code, jt, jf, k))
+
+    return program
+
+
+class _Lowering:
+    # Emits code of filter tree, which jumps to label true when the frame matches and to label false otherwise.
+    # All jumps are forward, because labels of a subtree are placed after its code.
+
+    def __init__(self):
+        self.__labels = (f'l{i}' for i in itertools.count())
+        self.items = []
+
+    def emit(self, tree, true, false):
+        kind = tree[0]
+
+        if kind == 'and':
+            middle = next(self.__labels)
+            self.emit(tree[1], middle, false)
+            self.items.append(middle)
+            self.emit(tree[2], true, false)
+        elif kind == 'or':
+            middle = next(self.__labels)
+            self.emit(tree[1], true, middle)
+            self.items.append(middle)
+            self.emit(tree[2], true, false)
+        elif kind == 'not':
+            self.emit(tree[1], false, true)
+        elif kind == 'ethertype':
+            self.items += [(BPF_LD_H_ABS, 0, 0, _ETH_TYPE_OFFSET), (BPF_JEQ_K, true, false, tree[1])]
+        elif kind == 'protocol':
+            self.__internet(lambda offset: [(BPF_LD_B_ABS, 0, 0, offset), (BPF_JEQ_K, true, false, tree[1])], false)
+        elif kind == 'net':
+            self.__net(tree[1], tree[2], true, false)
+        elif kind == 'port':
+            self.__port(tree[1], tree[2], true, false)
+        elif kind == 'flag':
+            self.__flag(tree[1], true, false)
+        else:
+            raise ValueError(f'Unknown filter node: {kind}')
+
+    def __internet(self, code, false):
+        # code gets offset of ipv4 protocol or ipv6 next header and returns instructions run for this version
+        ipv6 = next(self.__labels)
+
+        self.items += [(BPF_LD_H_ABS, 0, 0, _ETH_TYPE_OFFSET), (BPF_JEQ_K, 0, ipv6, _IPV4_TYPE)]
+        self.items += code(_IPV4_PROTO_OFFSET)
+        self.items += [ipv6, (BPF_JEQ_K, 0, false, _IPV6_TYPE)]
+        self.items += code(_IPV6_NEXT_HEADER_OFFSET)
+
+    def __net(self, direction, network, true, false):
+        if network.version == 4:
+            ethertype, offsets = _IPV4_TYPE, {'src': _IPV4_SRC_OFFSET, 'dst': _IPV4_DST_OFFSET}
+        else:
+            ethertype, offsets = _IPV6_TYPE, {'src': _IPV6_SRC_OFFSET, 'dst': _IPV6_DST_OFFSET}
+
+        address = network.network_address.packed
+        netmask = network.netmask.packed
+        words = [(struct.unpack_from('! I', address, i)[0], struct.unpack_from('! I', netmask, i)[0])
+                 for i in range(0, len(address), 4)]
+        words = [(i, word, mask) for i, (word, mask) in enumerate(words) if mask]
+
+        if not words:
+            self.items += [(BPF_LD_H_ABS, 0, 0, _ETH_TYPE_OFFSET), (BPF_JEQ_K, true, false, ethertype)]
+            return
+
+        self.items += [(BPF_LD_H_ABS, 0, 0, _ETH_TYPE_OFFSET), (BPF_JEQ_K, 0, false, ethertype)]
+        fields = [direction] if direction is not None else ['src', 'dst']
+
+        for n, field in enumerate(fields):
+            mismatch = false if n == len(fields) - 1 else next(self.__labels)
+
+            for j, (i, word, mask) in enumerate(words):
+                self.items.append((BPF_LD_W_ABS, 0, 0, offsets[field] + 4 * i))
+                if mask != 0xFFFFFFFF:
+                    self.items.append((BPF_AND_K, 0, 0, mask))
+                self.items.append((BPF_JEQ_K, true if j == len(words) - 1 else 0, mismatch, word))
+
+            if mismatch != false:
+                self.items.append(mismatch)
+
+    def __transport(self, code, false):
+        # code gets (load instruction, offset) of transport header and returns instructions run for it,
+        # ipv4 header length is in register x and fragments without transport header are skipped
+        ipv6 = next(self.__labels)
+
+        self.items += [(BPF_LD_H_ABS, 0, 0, _ETH_TYPE_OFFSET), (BPF_JEQ_K, 0, ipv6, _IPV4_TYPE),
+                       (BPF_LD_H_ABS, 0, 0, _IPV4_FRAGMENT_OFFSET), (BPF_JSET_K, false, 0, 0x1FFF),
+                       (BPF_LDX_B_MSH, 0, 0, _IPV4_OFFSET)]
+        self.items += code(BPF_LD_H_IND, BPF_LD_B_IND, _IPV4_OFFSET)
+        self.items += [ipv6, (BPF_JEQ_K, 0, false, _IPV6_TYPE)]
+        self.items += code(BPF_LD_H_ABS, BPF_LD_B_ABS, _IPV6_TRANSPORT_OFFSET)
+
+    def __port(self, direction, port, true, false):
+        fields = [direction] if direction is not None else ['src', 'dst']
+
+        def code(load_h, load_b, offset):
+            items = []
+            for n, field in enumerate(fields):
+                items += [(load_h, 0, 0, offset + (0 if field == 'src' else 2)),
+                          (BPF_JEQ_K, true, false if n == len(fields) - 1 else 0, port)]
+            return items
+
+        self.__protocols((_TCP_TYPE, _UDP_TYPE), false)
+        self.__transport(code, false)
+
+    def __flag(self, bit, true, false):
+        self.__protocols((_TCP_TYPE,), false)
+        self.__transport(lambda load_h, load_b, offset: [(load_b, 0, 0, offset + _TCP_FLAGS_OFFSET),
+                                                          (BPF_JSET_K, true, false, bit)], false)
+
+    def __protocols(self, protocols, false):
+        # drops frames whose transport protocol is not one of protocols, falls through otherwise
+        passed = next(self.__labels)
+
+        def code(offset):
+            items = [(BPF_LD_B_ABS, 0, 0, offset)]
+            for n, protocol in enumerate(protocols):
+                items.append((BPF_JEQ_K, passed, false if n == len(protocols) - 1 else 0, protocol))
+            return items
+
+        self.__internet(code, false)
+        self.items.append(passed)
+
+
+def compile_filter(filter_='', snaplen=0):
+    # Filter expression of network.filters is lowered to classic BPF, which runs in kernel before frames are copied,
+    # frames are checked by the user space predicate of the expression after it anyway.
+    # As in tcpdump, kernel drops frames too short for a field which the program loads.
+    # Program which does not fit into classic BPF jumps accepts everything and leaves filtering to user space.
+    accept = snaplen if 0 < snaplen < MAX_SNAPLEN else MAX_SNAPLEN
+
+    if filter_ == '':
+        return [(BPF_RET_K, 0, 0, accept)]
+
+    lowering = _Lowering()
+    lowering.emit(filters.parse(filter_), _ACCEPT, _DROP)
+    items = lowering.items + [
+        _ACCEPT,
+        (BPF_RET_K, 0, 0, accept),
+        _DROP,
+        (BPF_RET_K, 0, 0, 0),
+    ]
+
+    try:
+        return assemble(items)
+    except ValueError:
+        return [(BPF_RET_K, 0, 0, accept)]
+
+
+def attach_filter(conn, program):
+    filters = (_SockFilter * len(program))(*program)
+    fprog = struct.pack('@ H P', len(program), ctypes.addressof(filters))
+
+    conn.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
@@ -0,0 +1,77 @@
+import struct
+from collections import namedtuple
+from typing import Optional
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8, 0x9100)
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_ETHERNET_HEADER_LENGTH = 14
+_VLAN_TAG_LENGTH = 4
+_IPV6_HEADER_LENGTH = 40
+
+_ETHER_TYPE = struct.Struct('! H')
+_IPV4_HEADER = struct.Struct('! B 5x H 1x B 2x 4s 4s')
+_IPV6_HEADER = struct.Struct('! 6x B 1x 16s 16s')
+_PORTS = struct.Struct('! H H')
+_TCP_FLAGS = struct.Struct('! H')
+
+FrameClass = namedtuple('FrameClass', ['ethertype', 'protocol', 'src', 'dst', 'src_port', 'dst_port', 'flags'])
+
+
+class FrameClassifier:
+    # reads only the header fields needed for filtering and counting,
+    # fields which are absent or truncated in the frame are None
+
+    def classify(self, data) -> Optional[FrameClass]:
+        size = len(data)
+
+        if size < _ETHERNET_HEADER_LENGTH:
+            return None
+
+        offset = _ETHERNET_HEADER_LENGTH
+        ethertype, = _ETHER_TYPE.unpack_from(data, offset - 2)
+
+        while ethertype in _VLAN_TYPES:
+            if size < offset + _VLAN_TAG_LENGTH:
+                return None
+            ethertype, = _ETHER_TYPE.unpack_from(data, offset + 2)
+            offset += _VLAN_TAG_LENGTH
+
+        if ethertype == _IPV4_TYPE:
+            if size < offset + _IPV4_HEADER.size:
+                return FrameClass(ethertype, None, None, None, None, None, None)
+
+            version_header_length, flags_offset, protocol, src, dst = _IPV4_HEADER.unpack_from(data, offset)
+
+            if version_header_length >> 4 != 4:
+                return FrameClass(ethertype, None, None, None, None, None, None)
+
+            if flags_offset & 0x1FFF:
+                return FrameClass(ethertype, protocol, src, dst, None, None, None)
+
+            offset += (version_header_length & 0xF) * 4
+
+        elif ethertype == _IPV6_TYPE:
+            if size < offset + _IPV6_HEADER_LENGTH:
+                return FrameClass(ethertype, None, None, None, None, None, None)
+
+            protocol, src, dst = _IPV6_HEADER.unpack_from(data, offset)
+            offset += _IPV6_HEADER_LENGTH
+
+        else:
+            return FrameClass(ethertype, None, None, None, None, None, None)
+
+        if (protocol != _TCP_TYPE and protocol != _UDP_TYPE) or size < offset + _PORTS.size:
+            return FrameClass(ethertype, protocol, src, dst, None, None, None)
+
+        src_port, dst_port = _PORTS.unpack_from(data, offset)
+
+        if protocol == _TCP_TYPE and size >= offset + 14:
+            flags = _TCP_FLAGS.unpack_from(data, offset + 12)[0] & 0x1FF
+        else:
+            flags = None
+
+        return FrameClass(ethertype, protocol, src, dst, src_port, dst_port, flags)
@@ -0,0 +1,369 @@
+import struct
+from typing import Optional
+
+from network.frames import *
+from network.lazy import LazyEthernetFrameParser
+
+_IPV4_TYPE = 0x0800
+_TCP_TYPE = 6
+
+_ETHERNET_HEADER_LENGTH = 14
+_IPV6_HEADER_LENGTH = 40
+_TCP_HEADER_LENGTH = 20
+_UDP_HEADER_LENGTH = 8
+
+_U16 = struct.Struct('! H')
+_U32 = struct.Struct('! I')
+
+
+# Compact frames have __slots__ and share one buffer of the whole frame, every layer is just (buffer, offset).
+# Only the ethernet frame is kept per packet, the other layers are created when they are accessed,
+# and raw and data are memoryviews of the buffer instead of copies.
+# They are registered as virtual subclasses of the eager frames and have the same public properties
+# plus the *_value properties of the lazy frames.
+
+class _CompactFrame:
+    __slots__ = ('_buf', '_offset')
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        self._offset = offset
+
+    @property
+    def raw(self):
+        return memoryview(self._buf)[self._offset:]
+
+    @property
+    def timestamp(self):
+        return None
+
+    def _u8(self, offset):
+        return self._buf[self._offset + offset]
+
+    def _u16(self, offset):
+        return _U16.unpack_from(self._buf, self._offset + offset)[0]
+
+    def _u32(self, offset):
+        return _U32.unpack_from(self._buf, self._offset + offset)[0]
+
+    def _bytes(self, offset, size):
+        start = self._offset + offset
+        return self._buf[start:start + size]
+
+
+class CompactTcpFrame(_CompactFrame):
+    __slots__ = ()
+    layer = 'transport'
+    protocol = 'tcp'
+    get_description = TcpFrame.get_description
+
+    @property
+    def src(self):
+        return self._u16(0)
+
+    @property
+    def dst(self):
+        return self._u16(2)
+
+    @property
+    def sequence_number_value(self):
+        return self._u32(4)
+
+    @property
+    def ack_number_value(self):
+        return self._u32(8)
+
+    @property
+    def sequence_number(self):
+        return get_bytes_str(self._bytes(4, 4))
+
+    @property
+    def ack_number(self):
+        return get_bytes_str(self._bytes(8, 4))
+
+    @property
+    def data_offset(self):
+        return (self._u8(12) >> 4) * 4
+
+    @property
+    def flags_value(self):
+        return self._u16(12) & 0x1FF
+
+    @property
+    def urg(self):
+        return (self._u8(13) & 32) >> 5
+
+    @property
+    def ack(self):
+        return (self._u8(13) & 16) >> 4
+
+    @property
+    def psh(self):
+        return (self._u8(13) & 8) >> 3
+
+    @property
+    def rst(self):
+        return (self._u8(13) & 4) >> 2
+
+    @property
+    def syn(self):
+        return (self._u8(13) & 2) >> 1
+
+    @property
+    def fin(self):
+        return self._u8(13) & 1
+
+    @property
+    def window_size(self):
+        return self._u16(14)
+
+    @property
+    def urgent_pointer(self):
+        return self._u16(18)
+
+    @property
+    def data(self):
+        return memoryview(self._buf)[self._offset + self.data_offset:]
+
+
+class CompactUdpFrame(_CompactFrame):
+    __slots__ = ()
+    layer = 'transport'
+    protocol = 'udp'
+    get_description = UdpFrame.get_description
+
+    @property
+    def source_port(self):
+        return self._u16(0)
+
+    @property
+    def destination_port(self):
+        return self._u16(2)
+
+    @property
+    def length(self):
+        return self._u16(4)
+
+    @property
+    def data(self):
+        return memoryview(self._buf)[self._offset + _UDP_HEADER_LENGTH:]
+
+
+def _transport_frame(buf, offset, protocol):
+    if protocol == _TCP_TYPE:
+        return CompactTcpFrame(buf, offset) if len(buf) - offset >= _TCP_HEADER_LENGTH else None
+
+    return CompactUdpFrame(buf, offset) if len(buf) - offset >= _UDP_HEADER_LENGTH else None
+
+
+class CompactIpv4Frame(_CompactFrame):
+    __slots__ = ()
+    layer = 'internet'
+    protocol = 'ipv4'
+    get_description = Ipv4Frame.get_description
+
+    @property
+    def header_length(self):
+        return (self._u8(0) & 0xF) * 4
+
+    @property
+    def size(self):
+        return self._u16(2)
+
+    @property
+    def identifier(self):
+        return self._u16(4)
+
+    @property
+    def flags_value(self):
+        return self._u16(6)
+
+    @property
+    def flags(self):
+        return to_hexed_int(self.flags_value, 4)
+
+    @property
+    def ttl(self):
+        return self._u8(8)
+
+    @property
+    def protocol_value(self):
+        return self._u8(9)
+
+    @property
+    def src_value(self):
+        return self._u32(12)
+
+    @property
+    def dst_value(self):
+        return self._u32(16)
+
+    @property
+    def src(self):
+        return to_ipv4_address(self._bytes(12, 4))
+
+    @property
+    def dst(self):
+        return to_ipv4_address(self._bytes(16, 4))
+
+    @property
+    def transport_frame(self):
+        return _transport_frame(self._buf, self._offset + self.header_length, self.protocol_value)
+
+
+class CompactIpv6Frame(_CompactFrame):
+    __slots__ = ()
+    layer = 'internet'
+    protocol = 'ipv6'
+    get_description = Ipv6Frame.get_description
+
+    @property
+    def traffic_class_value(self):
+        return (self._u32(0) >> 20) & 0xFF
+
+    @property
+    def traffic_class(self):
+        return to_hexed_int(self.traffic_class_value, 1)
+
+    @property
+    def flow_label_value(self):
+        return self._u32(0) & 0xFFFFF
+
+    @property
+    def flow_label(self):
+        return to_hexed_int(self.flow_label_value, 3)
+
+    @property
+    def payload_length(self):
+        return self._u16(4)
+
+    @property
+    def next_header_value(self):
+        return self._u8(6)
+
+    @property
+    def next_header(self):
+        return to_hexed_int(self.next_header_value, 1)
+
+    @property
+    def hop_limit(self):
+        return self._u8(7)
+
+    @property
+    def source_value(self):
+        return int.from_bytes(self._bytes(8, 16), 'big')
+
+    @property
+    def destination_value(self):
+        return int.from_bytes(self._bytes(24, 16), 'big')
+
+    @property
+    def source(self):
+        return to_ipv6_address(self._bytes(8, 16))
+
+    @property
+    def destination(self):
+        return to_ipv6_address(self._bytes(24, 16))
+
+    @property
+    def transport_frame(self):
+        return _transport_frame(self._buf, self._offset + _IPV6_HEADER_LENGTH, self.next_header_value)
+
+
+class CompactEthernetFrame:
+    __slots__ = ('_buf', '_type', '_timestamp', '_orig_len')
+    layer = 'link'
+    protocol = 'ethernet'
+    get_description = EthernetFrame.get_description
+
+    def __init__(self, buf, type_value):
+        self._buf = buf
+        self._type = type_value
+        self._timestamp = None
+        self._orig_len = None
+
+    @property
+    def raw(self):
+        return self._buf
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self._timestamp = value
+
+    @property
+    def orig_len(self):
+        return len(self._buf) if self._orig_len is None else self._orig_len
+
+    @orig_len.setter
+    def orig_len(self, value):
+        self._orig_len = value
+
+    @property
+    def type_value(self):
+        return self._type
+
+    @property
+    def destination(self):
+        return to_mac_address(self._buf[0:6])
+
+    @property
+    def source(self):
+        return to_mac_address(self._buf[6:12])
+
+    @property
+    def type(self):
+        return to_hexed_int(self._type, 4)
+
+    @property
+    def data(self):
+        return memoryview(self._buf)[_ETHERNET_HEADER_LENGTH:]
+
+    @property
+    def internet_frame(self):
+        if self._type == _IPV4_TYPE:
+            return CompactIpv4Frame(self._buf, _ETHERNET_HEADER_LENGTH)
+
+        return CompactIpv6Frame(self._buf, _ETHERNET_HEADER_LENGTH)
+
+
+TcpFrame.register(CompactTcpFrame)
+UdpFrame.register(CompactUdpFrame)
+Ipv4Frame.register(CompactIpv4Frame)
+Ipv6Frame.register(CompactIpv6Frame)
+EthernetFrame.register(CompactEthernetFrame)
+
+
+class CompactEthernetFrameParser(LazyEthernetFrameParser):
+    # Accepts the same frames as the other parsers. Every frame gets its own copy of the bytes
+    # unless pool_size is given: then frames are taken in turn from a pool of pool_size objects and point
+    # to the received buffer itself, so a frame stays valid only until pool_size more frames are parsed
+    # and until the receiver reuses its buffer. It suits consumers which handle frames one batch at a time.
+
+    def __init__(self, pool_size=0):
+        self.__pool = [CompactEthernetFrame(b'', 0) for _ in range(pool_size)]
+        self.__next = 0
+
+    def parse(self, data) -> Optional[CompactEthernetFrame]:
+        if not self.__pool and not isinstance(data, bytes):
+            data = bytes(data)
+
+        type_ = self._check(data)
+
+        if type_ is None:
+            return None
+
+        if not self.__pool:
+            return CompactEthernetFrame(data, type_)
+
+        frame = self.__pool[self.__next]
+        self.__next = (self.__next + 1) % len(self.__pool)
+        frame._buf = data
+        frame._type = type_
+        frame._timestamp = None
+        frame._orig_len = None
+
+        return frame
@@ -0,0 +1,280 @@
+import argparse
+import ipaddress
+import re
+import struct
+
+# Filter expressions in a subset of tcpdump syntax, e.g. 'tcp and dst port 443 and src net 10.0.0.0/8 and not syn':
+#
+#   expression := term (('or' | '||') term)*
+#   term       := factor (('and' | '&&') factor)*
+#   factor     := ('not' | '!') factor | '(' expression ')' | primitive
+#   primitive  := 'ip' | 'ipv4' | 'ip6' | 'ipv6' | 'arp' | 'tcp' | 'udp' | 'icmp' | 'icmp6' | 'proto' NUMBER
+#               | ['src' | 'dst'] ('host' ADDRESS | 'net' NETWORK | 'port' NUMBER)
+#               | 'fin' | 'syn' | 'rst' | 'psh' | 'ack' | 'urg' | 'ece' | 'cwr'
+#
+# Expression is parsed into tree of tuples:
+#   ('and', left, right), ('or', left, right), ('not', operand),
+#   ('ethertype', value), ('protocol', value), ('net', direction, network), ('port', direction, value), ('flag', bit)
+# where direction is 'src', 'dst' or None for any of them, host is a network with full prefix.
+# Tcp flags match tcp segments having the flag set.
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8, 0x9100)
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_ETHER_TYPES = {'ip': _IPV4_TYPE, 'ipv4': _IPV4_TYPE, 'ip6': _IPV6_TYPE, 'ipv6': _IPV6_TYPE, 'arp': 0x0806}
+_PROTOCOLS = {'tcp': _TCP_TYPE, 'udp': _UDP_TYPE, 'icmp': 1, 'icmp6': 58}
+TCP_FLAGS = {'fin': 0x01, 'syn': 0x02, 'rst': 0x04, 'psh': 0x08, 'ack': 0x10, 'urg': 0x20, 'ece': 0x40, 'cwr': 0x80}
+_DIRECTIONS = ('src', 'dst')
+
+_TOKEN = re.compile(r'\s*(?:(&&|\|\||[()!])|([^\s()!&|]+))')
+
+_ETHER_TYPE = struct.Struct('! H')
+_IPV4_HEADER = struct.Struct('! B 5x H 1x B 2x 4s 4s')
+_IPV6_HEADER = struct.Struct('! 6x B 1x 16s 16s')
+_PORTS = struct.Struct('! H H')
+_TCP_FLAGS = struct.Struct('! 13x B')
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+
+        if match is None or match.end() == position:
+            raise ValueError(f'Unexpected character in filter at {position}: {expression[position:]}')
+
+        tokens.append(match.group(1) or match.group(2).lower())
+        position = match.end()
+
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression):
+        self.__tokens = _tokenize(expression)
+        self.__position = 0
+
+    def parse(self):
+        if not self.__tokens:
+            raise ValueError('Empty filter')
+
+        tree = self.__expression()
+
+        if self.__peek() is not None:
+            raise ValueError(f'Unexpected token in filter: {self.__peek()}')
+
+        return tree
+
+    def __peek(self):
+        return self.__tokens[self.__position] if self.__position < len(self.__tokens) else None
+
+    def __next(self):
+        token = self.__peek()
+
+        if token is None:
+            raise ValueError('Unexpected end of filter')
+
+        self.__position += 1
+        return token
+
+    def __expression(self):
+        tree = self.__term()
+
+        while self.__peek() in ('or', '||'):
+            self.__next()
+            tree = ('or', tree, self.__term())
+
+        return tree
+
+    def __term(self):
+        tree = self.__factor()
+
+        while self.__peek() in ('and', '&&'):
+            self.__next()
+            tree = ('and', tree, self.__factor())
+
+        return tree
+
+    def __factor(self):
+        token = self.__next()
+
+        if token in ('not', '!'):
+            return 'not', self.__factor()
+
+        if token == '(':
+            tree = self.__expression()
+
+            if self.__next() != ')':
+                raise ValueError('Missing closing parenthesis in filter')
+
+            return tree
+
+        return self.__primitive(token)
+
+    def __primitive(self, token):
+        if token in _ETHER_TYPES:
+            return 'ethertype', _ETHER_TYPES[token]
+        if token in _PROTOCOLS:
+            return 'protocol', _PROTOCOLS[token]
+        if token in TCP_FLAGS:
+            return 'flag', TCP_FLAGS[token]
+        if token == 'proto':
+            return 'protocol', self.__number(255)
+
+        direction = None
+
+        if token in _DIRECTIONS:
+            direction = token
+            token = self.__next()
+
+        if token == 'host':
+            return 'net', direction, self.__network(self.__next(), host=True)
+        if token == 'net':
+            return 'net', direction, self.__network(self.__next(), host=False)
+        if token == 'port':
+            return 'port', direction, self.__number(65535)
+
+        raise ValueError(f'Unknown filter primitive: {token}')
+
+    def __number(self, maximum):
+        token = self.__next()
+
+        if not token.isdigit() or int(token) > maximum:
+            raise ValueError(f'Expected number up to {maximum} in filter, got: {token}')
+
+        return int(token)
+
+    @staticmethod
+    def __network(token, host):
+        try:
+            if host:
+                return ipaddress.ip_network(ipaddress.ip_address(token))
+            return ipaddress.ip_network(token)
+        except ValueError as e:
+            raise ValueError(f'Bad address in filter: {e}') from None
+
+
+def parse(expression):
+    return _Parser(expression).parse()
+
+
+def expression_argument(value):
+    # argparse type of filter expression options, empty expression means no filter
+    if value == '':
+        return value
+
+    try:
+        parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+    return value
+
+
+def _walk(tree):
+    yield tree
+
+    if tree[0] in ('and', 'or'):
+        yield from _walk(tree[1])
+        yield from _walk(tree[2])
+    elif tree[0] == 'not':
+        yield from _walk(tree[1])
+
+
+def _address_test(field, network):
+    if network.prefixlen == network.max_prefixlen:
+        return f'{field} == {network.network_address.packed!r}'
+
+    size = len(network.network_address.packed)
+    mask = int(network.netmask)
+
+    return f'({field} is not None and len({field}) == {size} and ' \
+           f'int.from_bytes({field}, "big") & {mask} == {int(network.network_address)})'
+
+
+def _python(tree):
+    kind = tree[0]
+
+    if kind == 'and' or kind == 'or':
+        return f'({_python(tree[1])} {kind} {_python(tree[2])})'
+    if kind == 'not':
+        return f'(not {_python(tree[1])})'
+    if kind == 'ethertype':
+        return f'ethertype == {tree[1]}'
+    if kind == 'protocol':
+        return f'protocol == {tree[1]}'
+    if kind == 'flag':
+        return f'(flags is not None and flags & {tree[1]} != 0)'
+
+    kind, direction, value = tree
+    fields = (direction,) if direction is not None else _DIRECTIONS
+
+    if kind == 'net':
+        tests = [_address_test(field, value) for field in fields]
+    else:
+        tests = [f'{field}_port == {value}' for field in fields]
+
+    return tests[0] if len(tests) == 1 else f'({" or ".join(tests)})'
+
+
+def _source(tree):
+    kinds = {node[0] for node in _walk(tree)}
+    flags = 'flag' in kinds
+    ports = flags or 'port' in kinds
+    internet = ports or 'net' in kinds or 'protocol' in kinds
+
+    lines = ['def predicate(data):',
+             '    size = len(data)',
+             '    if size < 14:',
+             '        return False',
+             '    ethertype, = _ETHER_TYPE(data, 12)',
+             '    offset = 14',
+             '    while ethertype in _VLAN_TYPES:',
+             '        if size < offset + 4:',
+             '            return False',
+             '        ethertype, = _ETHER_TYPE(data, offset + 2)',
+             '        offset += 4']
+
+    if internet:
+        lines += ['    protocol = src = dst = None',
+                  '    transport = False',
+                  f'    if ethertype == {_IPV4_TYPE} and size >= offset + 20:',
+                  '        version_header_length, flags_offset, protocol, src, dst = _IPV4_HEADER(data, offset)',
+                  '        if not flags_offset & 0x1FFF:',
+                  '            offset += (version_header_length & 0xF) * 4',
+                  '            transport = True',
+                  f'    elif ethertype == {_IPV6_TYPE} and size >= offset + 40:',
+                  '        protocol, src, dst = _IPV6_HEADER(data, offset)',
+                  '        offset += 40',
+                  '        transport = True']
+
+    if ports:
+        lines += ['    src_port = dst_port = flags = None',
+                  f'    if transport and (protocol == {_TCP_TYPE} or protocol == {_UDP_TYPE}) and size >= offset + 4:',
+                  '        src_port, dst_port = _PORTS(data, offset)']
+
+    if flags:
+        lines += [f'        if protocol == {_TCP_TYPE} and size >= offset + 14:',
+                  '            flags, = _TCP_FLAGS(data, offset)']
+
+    lines.append(f'    return {_python(tree)}')
+
+    return '\n'.join(lines)
+
+
+def compile_predicate(expression):
+    # Returns function of raw frame which tells whether frame matches the expression.
+    # It is generated for the expression, so it unpacks only the headers which the expression needs.
+    namespace = {'_ETHER_TYPE': _ETHER_TYPE.unpack_from, '_VLAN_TYPES': _VLAN_TYPES,
+                 '_IPV4_HEADER': _IPV4_HEADER.unpack_from, '_IPV6_HEADER': _IPV6_HEADER.unpack_from,
+                 '_PORTS': _PORTS.unpack_from, '_TCP_FLAGS': _TCP_FLAGS.unpack_from}
+
+    exec(compile(_source(parse(expression)), f'<filter {expression}>', 'exec'), namespace)
+
+    return namespace['predicate']
@@ -0,0 +1,202 @@
+import time
+from collections import OrderedDict
+
+from network.frames import EthernetFrame, Ipv4Frame, TcpFrame
+
+NEW = 'new'
+SYN_SENT = 'syn-sent'
+SYN_RECEIVED = 'syn-received'
+ESTABLISHED = 'established'
+CLOSING = 'closing'
+CLOSED = 'closed'
+RESET = 'reset'
+
+_TERMINAL_STATES = (CLOSED, RESET)
+
+TIMEOUT = 60.0
+CLOSED_TIMEOUT = 5.0
+MAX_FLOWS = 1000000
+
+
+class Flow:
+    # key is (protocol, address a, port a, address b, port b) with endpoints sorted,
+    # so both directions of the connection are one flow; forward direction is the one of the first packet
+    __slots__ = ('key', 'src', 'src_port', 'first_seen', 'last_seen', 'packets', 'bytes',
+                 'forward_packets', 'forward_bytes', 'state', 'fins')
+
+    def __init__(self, key, src, src_port, timestamp):
+        self.key = key
+        self.src = src
+        self.src_port = src_port
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.packets = 0
+        self.bytes = 0
+        self.forward_packets = 0
+        self.forward_bytes = 0
+        self.state = NEW if key[0] == 'tcp' else None
+        self.fins = 0
+
+    @property
+    def protocol(self):
+        return self.key[0]
+
+    @property
+    def dst(self):
+        return self.key[3] if (self.key[1], self.key[2]) == (self.src, self.src_port) else self.key[1]
+
+    @property
+    def dst_port(self):
+        return self.key[4] if (self.key[1], self.key[2]) == (self.src, self.src_port) else self.key[2]
+
+    @property
+    def duration(self):
+        return (self.last_seen - self.first_seen) / 1e9
+
+    def get_description(self):
+        state = '' if self.state is None else f' state={self.state}'
+
+        return f'Flow {self.protocol} {self.src}:{self.src_port} -> {self.dst}:{self.dst_port} ' \
+               f'packets={self.packets} ({self.forward_packets} forward) ' \
+               f'bytes={self.bytes} ({self.forward_bytes} forward) ' \
+               f'duration={self.duration:.3f}s{state}'
+
+
+def _flow_endpoints(frame: EthernetFrame):
+    internet = frame.internet_frame
+    transport = internet.transport_frame
+
+    if transport is None:
+        return None
+
+    if isinstance(internet, Ipv4Frame):
+        src, dst = internet.src, internet.dst
+    else:
+        src, dst = internet.source, internet.destination
+
+    if isinstance(transport, TcpFrame):
+        return 'tcp', src, transport.src, dst, transport.dst
+
+    return transport.protocol, src, transport.source_port, dst, transport.destination_port
+
+
+def _next_state(flow, transport, forward):
+    state = flow.state
+
+    if transport.rst:
+        return RESET
+
+    if transport.fin:
+        flow.fins |= 1 if forward else 2
+        return CLOSED if flow.fins == 3 else CLOSING
+
+    if transport.syn:
+        return SYN_RECEIVED if transport.ack else SYN_SENT
+
+    if state in (SYN_SENT, SYN_RECEIVED, NEW) and transport.ack:
+        return ESTABLISHED
+
+    return state
+
+
+class FlowTable:
+    # Flows live in two dicts ordered by last seen time, so expiring is popping from the front.
+    # Closed and reset tcp connections move to the second one and expire after closed_timeout.
+    # When there are more than max_flows flows the least recently seen one is evicted.
+    # Each evicted flow is passed to on_evict.
+
+    def __init__(self, timeout=TIMEOUT, closed_timeout=CLOSED_TIMEOUT, max_flows=MAX_FLOWS, on_evict=None):
+        self.__timeout = int(timeout * 1e9)
+        self.__closed_timeout = int(closed_timeout * 1e9)
+        self.__max_flows = max_flows
+        self.__on_evict = on_evict
+        self.__active = OrderedDict()
+        self.__closed = OrderedDict()
+        self.__last_expire = None
+        self.__evicted = 0
+
+    def __len__(self):
+        return len(self.__active) + len(self.__closed)
+
+    def __iter__(self):
+        yield from self.__active.values()
+        yield from self.__closed.values()
+
+    @property
+    def evicted(self):
+        return self.__evicted
+
+    def update(self, frame: EthernetFrame):
+        endpoints = _flow_endpoints(frame)
+
+        if endpoints is None:
+            return None
+
+        protocol, src, src_port, dst, dst_port = endpoints
+        timestamp = frame.timestamp if frame.timestamp is not None else time.time_ns()
+
+        if (src, src_port) <= (dst, dst_port):
+            key = endpoints
+        else:
+            key = protocol, dst, dst_port, src, src_port
+
+        flow = self.__active.get(key)
+
+        if flow is not None:
+            self.__active.move_to_end(key)
+        else:
+            flow = self.__closed.get(key)
+
+            if flow is not None:
+                self.__closed.move_to_end(key)
+            else:
+                flow = Flow(key, src, src_port, timestamp)
+                self.__active[key] = flow
+
+                if len(self) > self.__max_flows:
+                    self.__evict(self.__closed if self.__closed else self.__active)
+
+        size = frame.orig_len
+        forward = src == flow.src and src_port == flow.src_port
+        flow.last_seen = timestamp
+        flow.packets += 1
+        flow.bytes += size
+
+        if forward:
+            flow.forward_packets += 1
+            flow.forward_bytes += size
+
+        if flow.state is not None:
+            flow.state = _next_state(flow, frame.internet_frame.transport_frame, forward)
+
+            if flow.state in _TERMINAL_STATES and key in self.__active:
+                self.__closed[key] = self.__active.pop(key)
+
+        if self.__last_expire is None:
+            self.__last_expire = timestamp
+        elif timestamp - self.__last_expire >= self.__closed_timeout:
+            self.expire(timestamp)
+
+        return flow
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time_ns()
+
+        self.__last_expire = now
+
+        for flows, timeout in ((self.__active, self.__timeout), (self.__closed, self.__closed_timeout)):
+            while flows and now - next(iter(flows.values())).last_seen >= timeout:
+                self.__evict(flows)
+
+    def flush(self):
+        for flows in (self.__active, self.__closed):
+            while flows:
+                self.__evict(flows)
+
+    def __evict(self, flows):
+        key, flow = flows.popitem(last=False)
+        self.__evicted += 1
+
+        if self.__on_evict is not None:
+            self.__on_evict(flow)
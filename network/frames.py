@@ -7,9 +7,12 @@ class Frame:
         self.__layer = layer
         self.__protocol = protocol
         self.__raw = raw
+        self.__timestamp = None
+        self.__orig_len = None
 
     @abstractmethod
-    def get_description(self, tab):
+    def get_description(self, tab, payload=None):
+        # payload is number of data bytes in hex dump, None for all of them, 0 for headers only
         raise NotImplementedError
 
     @property
@@ -24,6 +27,23 @@ class Frame:
     def raw(self):
         return self.__raw
 
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.__timestamp = value
+
+    @property
+    def orig_len(self):
+        # length of the frame on the wire, raw is shorter when capture was truncated by snap length
+        return len(self.raw) if self.__orig_len is None else self.__orig_len
+
+    @orig_len.setter
+    def orig_len(self, value):
+        self.__orig_len = value
+
 
 class TransportFrame(Frame, ABC):
     def __init__(self, protocol, raw):
@@ -124,7 +144,7 @@ class TcpFrame(TransportFrame):
     def data(self):
         return self.__data
 
-    def get_description(self, tab):
+    def get_description(self, tab, payload=None):
         return \
             f'{tab}Transmission Control Protocol (TCP)\n' \
             f'{tab}Source Port: {self.src}\n' \
@@ -135,7 +155,7 @@ class TcpFrame(TransportFrame):
             f'{tab}Flags: URG={self.urg} ACK={self.ack} PSH={self.psh} RST={self.rst} SYN={self.syn} FIN={self.fin}\n' \
             f'{tab}Window size: {self.window_size}\n' \
             f'{tab}Urgent pointer: {self.urgent_pointer}\n' \
-            f'{to_hex_dump(self.data, tab=tab)}'
+            f'{"" if payload == 0 else to_hex_dump(self.data, tab=tab, max_length=payload)}'
 
 
 class UdpFrame(TransportFrame):
@@ -162,13 +182,13 @@ class UdpFrame(TransportFrame):
     def data(self):
         return self.__data
 
-    def get_description(self, tab):
+    def get_description(self, tab, payload=None):
         return \
             f'{tab}User Datagram Protocol (UDP)\n'\
-            f'{tab}Source Port: {self.__src_port}\n'\
-            f'{tab}Destination Port: {self.__dst_port}\n'\
-            f'{tab}Length: {self.__length}\n'\
-            f'{to_hex_dump(self.data, tab=tab)}'
+            f'{tab}Source Port: {self.source_port}\n'\
+            f'{tab}Destination Port: {self.destination_port}\n'\
+            f'{tab}Length: {self.length}\n'\
+            f'{"" if payload == 0 else to_hex_dump(self.data, tab=tab, max_length=payload)}'
 
 
 class Ipv4Frame(InternetFrame):
@@ -205,7 +225,7 @@ class Ipv4Frame(InternetFrame):
     def size(self):
         return self.__size
 
-    def get_description(self, tab):
+    def get_description(self, tab, payload=None):
         return \
             f'{tab}Internet IPv4 Frame\n' \
             f'{tab}Source: {self.src}\n' \
@@ -214,7 +234,7 @@ class Ipv4Frame(InternetFrame):
             f'{tab}Flags: {self.flags}\n' \
             f'{tab}TTL: {self.ttl}\n' \
             f'{tab}Size: {self.size}\n' \
-            f'{"" if self.transport_frame is None else self.transport_frame.get_description(tab + " ")}'
+            f'{"" if self.transport_frame is None else self.transport_frame.get_description(tab + " ", payload)}'
 
 
 class Ipv6Frame(InternetFrame):
@@ -257,7 +277,7 @@ class Ipv6Frame(InternetFrame):
     def destination(self):
         return self.__dst
 
-    def get_description(self, tab):
+    def get_description(self, tab, payload=None):
         return \
             f'{tab}Internet IPv6 Frame\n' \
             f'{tab}Traffic class: {self.traffic_class}\n' \
@@ -267,7 +287,7 @@ class Ipv6Frame(InternetFrame):
             f'{tab}Hop limit: {self.hop_limit}\n' \
             f'{tab}Source: {self.source}\n' \
             f'{tab}Destination: {self.destination}\n' \
-            f'{self.transport_frame.get_description(tab + " ")}'
+            f'{"" if self.transport_frame is None else self.transport_frame.get_description(tab + " ", payload)}'
 
 
 class EthernetFrame(LinkFrame):
@@ -294,12 +314,12 @@ class EthernetFrame(LinkFrame):
     def data(self):
         return self.__data
 
-    def get_description(self, tab=''):
+    def get_description(self, tab='', payload=None):
         return tab + 'Ethernet frame:\n' \
             f'{tab}Destination: {self.destination}\n' \
             f'{tab}Source: {self.source}\n' \
             f'{tab}Type: {self.type}\n' \
-            f'{self.internet_frame.get_description(tab + " ")}'
+            f'{self.internet_frame.get_description(tab + " ", payload)}'
 
 
 link_frame_classes = LinkFrame.__subclasses__()
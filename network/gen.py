@@ -1,22 +1,228 @@
-from typing import Iterable
+import asyncio
+from collections import deque
+from typing import Iterable, List
 
 from network.frames import EthernetFrame
 from network.parsers import EthernetFrameParser
 from network.raw import RawFrameGenerator
 
+MAX_PENDING = 4096
+
+
+def _defragment(defragmenter, package, timestamp, orig_len):
+    # rebuilt datagram is a new frame, its original length is its own
+    datagram = defragmenter.feed(package, timestamp)
+
+    return datagram, orig_len if datagram is package else None
+
 
 class FrameGenerator:
-    def __init__(self, raw: RawFrameGenerator, ethernet_parser: EthernetFrameParser):
+    # defragmenter (network.reassembly.FragmentReassembler) gets packages before the filter,
+    # so fragments are filtered and parsed only as whole datagrams.
+    # sampler (network.sampling) drops packages after defragmenter, before they cost filtering and parsing
+
+    def __init__(self, raw: RawFrameGenerator, ethernet_parser: EthernetFrameParser, raw_filter=None,
+                 defragmenter=None, sampler=None):
         self.__raw = raw
         self.__ethernet = ethernet_parser
+        self.__raw_filter = raw_filter
+        self.__defragmenter = defragmenter
+        self.__sampler = sampler
 
     def get_next(self) -> EthernetFrame:
         while True:
-            frame = self.__ethernet.parse(self.__raw.recv_next())
+            package = self.__raw.recv_next()
+            orig_len = self.__raw.orig_len
+
+            if self.__defragmenter is not None:
+                package, orig_len = _defragment(self.__defragmenter, package, self.__raw.timestamp, orig_len)
+                if package is None:
+                    continue
+
+            if self.__sampler is not None and not self.__sampler.keep(package, self.__raw.timestamp):
+                continue
+
+            if self.__raw_filter is not None and not self.__raw_filter(package):
+                continue
+
+            frame = self.__ethernet.parse(package)
 
             if frame is not None:
+                frame.timestamp = self.__raw.timestamp
+                frame.orig_len = orig_len
                 return frame
 
     def get_all(self) -> Iterable[EthernetFrame]:
         while True:
             yield self.get_next()
+
+    def get_batch(self, n=64) -> List[EthernetFrame]:
+        frames = []
+
+        packages = self.__raw.recv_batch(n)
+
+        for package, timestamp, orig_len in zip(packages, self.__raw.timestamps, self.__raw.orig_lens):
+            if self.__defragmenter is not None:
+                package, orig_len = _defragment(self.__defragmenter, package, timestamp, orig_len)
+                if package is None:
+                    continue
+
+            if self.__sampler is not None and not self.__sampler.keep(package, timestamp):
+                continue
+
+            if self.__raw_filter is not None and not self.__raw_filter(package):
+                continue
+
+            frame = self.__ethernet.parse(package)
+
+            if frame is not None:
+                frame.timestamp = timestamp
+                frame.orig_len = orig_len
+                frames.append(frame)
+
+        return frames
+
+
+class AsyncFrameGenerator:
+    # Asynchronous counterpart of FrameGenerator: socket of the raw generator is watched by the event loop,
+    # every wakeup receives all frames which are ready and `async for frame in frames` never blocks the loop,
+    # so one process can capture on several interfaces and do other io.
+    # When max_pending frames wait for the consumer the socket is not read until half of them are taken,
+    # meanwhile the kernel buffers frames and then drops them, which raw.get_statistics shows.
+    # Cancelled consumer stops reading as well, the next wait starts it again.
+    # Socket receiving is needed, ring of RingFrameGenerator is not supported.
+    # defragmenter and sampler are used as in FrameGenerator.
+
+    def __init__(self, raw: RawFrameGenerator, ethernet_parser: EthernetFrameParser, raw_filter=None,
+                 defragmenter=None, sampler=None, max_pending=MAX_PENDING):
+        if max_pending <= 0:
+            raise ValueError('Maximum number of pending frames must be positive')
+
+        self.__raw = raw
+        self.__ethernet = ethernet_parser
+        self.__raw_filter = raw_filter
+        self.__defragmenter = defragmenter
+        self.__sampler = sampler
+        self.__max_pending = max_pending
+        self.__frames = deque()
+        self.__loop = None
+        self.__waiter = None
+        self.__reading = False
+        self.__closed = False
+        self.__error = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> EthernetFrame:
+        await self.__wait()
+
+        frame = self.__frames.popleft()
+        self.__resume_if_drained()
+
+        return frame
+
+    @property
+    def pending(self):
+        return len(self.__frames)
+
+    async def get_batch(self, n=64) -> List[EthernetFrame]:
+        # waits for at least one frame and returns up to n of them
+        await self.__wait()
+
+        frames = self.__frames
+        batch = [frames.popleft() for _ in range(min(n, len(frames)))]
+        self.__resume_if_drained()
+
+        return batch
+
+    def close(self):
+        # stops reading, consumer waiting for frame gets StopAsyncIteration, socket stays open and non-blocking
+        self.__closed = True
+        self.__pause()
+        self.__wake()
+
+    async def __wait(self):
+        while not self.__frames:
+            if self.__error is not None:
+                error, self.__error = self.__error, None
+                raise error
+            if self.__closed:
+                raise StopAsyncIteration
+
+            if self.__loop is None:
+                self.__loop = asyncio.get_running_loop()
+                self.__raw.socket.setblocking(False)
+
+            self.__resume()
+            self.__waiter = self.__loop.create_future()
+
+            try:
+                await self.__waiter
+            except asyncio.CancelledError:
+                self.__pause()
+                raise
+            finally:
+                self.__waiter = None
+
+    def __on_readable(self):
+        raw = self.__raw
+        frames = self.__frames
+
+        try:
+            while len(frames) < self.__max_pending:
+                package = raw.recv_next()
+                orig_len = raw.orig_len
+
+                if self.__defragmenter is not None:
+                    package, orig_len = _defragment(self.__defragmenter, package, raw.timestamp, orig_len)
+                    if package is None:
+                        continue
+
+                if self.__sampler is not None and not self.__sampler.keep(package, raw.timestamp):
+                    continue
+
+                if self.__raw_filter is not None and not self.__raw_filter(package):
+                    continue
+
+                frame = self.__ethernet.parse(package)
+
+                if frame is not None:
+                    frame.timestamp = raw.timestamp
+                    frame.orig_len = orig_len
+                    frames.append(frame)
+
+            self.__pause()
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self.__error = e
+            self.__pause()
+
+        if frames or self.__error is not None:
+            self.__wake()
+
+    def __resume_if_drained(self):
+        if not self.__reading and not self.__closed and self.__loop is not None \
+                and len(self.__frames) <= self.__max_pending // 2:
+            self.__resume()
+
+    def __resume(self):
+        if not self.__reading:
+            self.__loop.add_reader(self.__raw.socket.fileno(), self.__on_readable)
+            self.__reading = True
+
+    def __pause(self):
+        if self.__reading:
+            self.__loop.remove_reader(self.__raw.socket.fileno())
+            self.__reading = False
+
+    def __wake(self):
+        if self.__waiter is not None and not self.__waiter.done():
+            self.__waiter.set_result(None)
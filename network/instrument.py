@@ -0,0 +1,128 @@
+import time
+from typing import Optional
+
+from network.frames import EthernetFrame
+from network.parsers import LinkFrameParser
+from tools.metrics import Metrics
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_ETHERNET_HEADER_LENGTH = 14
+_IPV4_HEADER_LENGTH = 20
+_IPV6_HEADER_LENGTH = 40
+
+
+# Measured wrappers take the place of the receiver, parser and filter only when instrumentation is on,
+# so the capture loop itself has no checks and costs the same when it is off.
+
+def rejected_layer(data):
+    # layer at which parsers reject the frame: link for short or not ip frames,
+    # internet for broken ip header, transport for protocols other than tcp and udp
+    size = len(data)
+
+    if size < _ETHERNET_HEADER_LENGTH:
+        return 'link'
+
+    type_ = (data[12] << 8) | data[13]
+
+    if type_ == _IPV4_TYPE:
+        if size < _ETHERNET_HEADER_LENGTH + _IPV4_HEADER_LENGTH or data[14] >> 4 != 4:
+            return 'internet'
+        protocol = data[_ETHERNET_HEADER_LENGTH + 9]
+    elif type_ == _IPV6_TYPE:
+        if size < _ETHERNET_HEADER_LENGTH + _IPV6_HEADER_LENGTH or data[14] >> 4 != 6:
+            return 'internet'
+        protocol = data[_ETHERNET_HEADER_LENGTH + 6]
+    else:
+        return 'link'
+
+    return 'transport' if protocol != _TCP_TYPE and protocol != _UDP_TYPE else 'internet'
+
+
+class MeasuredReceiver:
+    # counts received packets and their bytes on the wire and times receive calls,
+    # everything else is passed to the wrapped generator
+
+    def __init__(self, raw, metrics: Metrics):
+        self.__raw = raw
+        self.__timer = metrics.timer('recv')
+        self.__packets = metrics.counter('packets', 'received packets')
+        self.__bytes = metrics.counter('bytes', 'received bytes on the wire')
+
+        if hasattr(raw, 'get_statistics'):
+            # read from the export thread, get_statistics is safe to call from it and returns totals
+            metrics.gauge('kernel_drops', lambda: raw.get_statistics()[1], 'packets dropped by kernel')
+
+    def __getattr__(self, name):
+        return getattr(self.__raw, name)
+
+    def recv_next(self):
+        start = time.perf_counter_ns()
+
+        try:
+            package = self.__raw.recv_next()
+        finally:
+            self.__timer.add(time.perf_counter_ns() - start)
+
+        self.__packets.add()
+        self.__bytes.add(self.__raw.orig_len)
+
+        return package
+
+    def recv_batch(self, n=64):
+        start = time.perf_counter_ns()
+
+        try:
+            batch = self.__raw.recv_batch(n)
+        finally:
+            self.__timer.add(time.perf_counter_ns() - start)
+
+        self.__packets.add(len(batch))
+        self.__bytes.add(sum(self.__raw.orig_lens))
+
+        return batch
+
+
+class MeasuredParser(LinkFrameParser):
+    def __init__(self, parser: LinkFrameParser, metrics: Metrics):
+        self.__parser = parser
+        self.__metrics = metrics
+        self.__timer = metrics.timer('parse')
+        self.__failures = {}
+
+    def parse(self, data) -> Optional[EthernetFrame]:
+        start = time.perf_counter_ns()
+        frame = self.__parser.parse(data)
+        self.__timer.add(time.perf_counter_ns() - start)
+
+        if frame is None:
+            layer = rejected_layer(data)
+            counter = self.__failures.get(layer)
+
+            if counter is None:
+                counter = self.__failures[layer] = self.__metrics.counter('parse_failures',
+                                                                          'frames rejected by parser', layer=layer)
+
+            counter.add()
+
+        return frame
+
+
+def measured_filter(raw_filter, metrics: Metrics):
+    timer = metrics.timer('filter')
+    filtered = metrics.counter('filtered_frames', 'frames dropped by filter')
+
+    def measured(package):
+        start = time.perf_counter_ns()
+        passed = raw_filter(package)
+        timer.add(time.perf_counter_ns() - start)
+
+        if not passed:
+            filtered.add()
+
+        return passed
+
+    return measured
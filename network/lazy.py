@@ -0,0 +1,357 @@
+import struct
+from functools import cached_property
+from typing import Optional
+
+from network.frames import *
+from network.parsers import LinkFrameParser
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_ETHERNET_HEADER = struct.Struct('! 6s 6s H')
+_IPV4_HEADER = struct.Struct('! B 1x H H H B B 2x 4s 4s')
+_IPV6_HEADER = struct.Struct('! I H B B 16s 16s')
+_TCP_HEADER = struct.Struct('! H H I I H H 2x H')
+_UDP_HEADER = struct.Struct('! H H H 2x')
+
+_ETHERNET_HEADER_LENGTH = _ETHERNET_HEADER.size
+_IPV4_HEADER_LENGTH = _IPV4_HEADER.size
+_IPV6_HEADER_LENGTH = _IPV6_HEADER.size
+_TCP_HEADER_LENGTH = _TCP_HEADER.size
+_UDP_HEADER_LENGTH = _UDP_HEADER.size
+
+
+# Lazy frames keep a single memoryview of the whole frame and the offset of their layer.
+# Fields are decoded on first access and cached, so untouched fields cost nothing.
+# Formatted properties match the eager frames, *_value properties give plain numbers.
+
+class LazyTcpFrame(TcpFrame):
+    def __init__(self, buf, offset):
+        TransportFrame.__init__(self, 'tcp', None)
+        self.__buf = buf
+        self.__offset = offset
+
+    @cached_property
+    def _header(self):
+        return _TCP_HEADER.unpack_from(self.__buf, self.__offset)
+
+    @cached_property
+    def raw(self):
+        return self.__buf[self.__offset:]
+
+    @cached_property
+    def src(self):
+        return self._header[0]
+
+    @cached_property
+    def dst(self):
+        return self._header[1]
+
+    @cached_property
+    def sequence_number_value(self):
+        return self._header[2]
+
+    @cached_property
+    def ack_number_value(self):
+        return self._header[3]
+
+    @cached_property
+    def sequence_number(self):
+        return get_bytes_str(self.sequence_number_value.to_bytes(4, 'big'))
+
+    @cached_property
+    def ack_number(self):
+        return get_bytes_str(self.ack_number_value.to_bytes(4, 'big'))
+
+    @cached_property
+    def data_offset(self):
+        return (self._header[4] >> 12) * 4
+
+    @cached_property
+    def flags_value(self):
+        return self._header[4] & 0x1FF
+
+    @property
+    def urg(self):
+        return (self.flags_value & 32) >> 5
+
+    @property
+    def ack(self):
+        return (self.flags_value & 16) >> 4
+
+    @property
+    def psh(self):
+        return (self.flags_value & 8) >> 3
+
+    @property
+    def rst(self):
+        return (self.flags_value & 4) >> 2
+
+    @property
+    def syn(self):
+        return (self.flags_value & 2) >> 1
+
+    @property
+    def fin(self):
+        return self.flags_value & 1
+
+    @cached_property
+    def window_size(self):
+        return self._header[5]
+
+    @cached_property
+    def urgent_pointer(self):
+        return self._header[6]
+
+    @cached_property
+    def data(self):
+        return self.__buf[self.__offset + self.data_offset:]
+
+
+class LazyUdpFrame(UdpFrame):
+    def __init__(self, buf, offset):
+        TransportFrame.__init__(self, 'udp', None)
+        self.__buf = buf
+        self.__offset = offset
+
+    @cached_property
+    def _header(self):
+        return _UDP_HEADER.unpack_from(self.__buf, self.__offset)
+
+    @cached_property
+    def raw(self):
+        return self.__buf[self.__offset:]
+
+    @cached_property
+    def source_port(self):
+        return self._header[0]
+
+    @cached_property
+    def destination_port(self):
+        return self._header[1]
+
+    @cached_property
+    def length(self):
+        return self._header[2]
+
+    @cached_property
+    def data(self):
+        return self.__buf[self.__offset + _UDP_HEADER_LENGTH:]
+
+
+def _transport_frame(buf, offset, protocol):
+    if protocol == _TCP_TYPE:
+        return LazyTcpFrame(buf, offset) if len(buf) - offset >= _TCP_HEADER_LENGTH else None
+
+    return LazyUdpFrame(buf, offset) if len(buf) - offset >= _UDP_HEADER_LENGTH else None
+
+
+class LazyIpv4Frame(Ipv4Frame):
+    def __init__(self, buf, offset):
+        InternetFrame.__init__(self, 'ipv4', None, None)
+        self.__buf = buf
+        self.__offset = offset
+
+    @cached_property
+    def _header(self):
+        return _IPV4_HEADER.unpack_from(self.__buf, self.__offset)
+
+    @cached_property
+    def raw(self):
+        return self.__buf[self.__offset:]
+
+    @cached_property
+    def header_length(self):
+        return (self._header[0] & 0xF) * 4
+
+    @cached_property
+    def size(self):
+        return self._header[1]
+
+    @cached_property
+    def identifier(self):
+        return self._header[2]
+
+    @cached_property
+    def flags_value(self):
+        return self._header[3]
+
+    @cached_property
+    def flags(self):
+        return to_hexed_int(self.flags_value, 4)
+
+    @cached_property
+    def ttl(self):
+        return self._header[4]
+
+    @cached_property
+    def protocol_value(self):
+        return self._header[5]
+
+    @cached_property
+    def src_value(self):
+        return int.from_bytes(self._header[6], 'big')
+
+    @cached_property
+    def dst_value(self):
+        return int.from_bytes(self._header[7], 'big')
+
+    @cached_property
+    def src(self):
+        return to_ipv4_address(self._header[6])
+
+    @cached_property
+    def dst(self):
+        return to_ipv4_address(self._header[7])
+
+    @cached_property
+    def transport_frame(self):
+        return _transport_frame(self.__buf, self.__offset + self.header_length, self.protocol_value)
+
+
+class LazyIpv6Frame(Ipv6Frame):
+    def __init__(self, buf, offset):
+        InternetFrame.__init__(self, 'ipv6', None, None)
+        self.__buf = buf
+        self.__offset = offset
+
+    @cached_property
+    def _header(self):
+        return _IPV6_HEADER.unpack_from(self.__buf, self.__offset)
+
+    @cached_property
+    def raw(self):
+        return self.__buf[self.__offset:]
+
+    @cached_property
+    def traffic_class_value(self):
+        return (self._header[0] >> 20) & 0xFF
+
+    @cached_property
+    def traffic_class(self):
+        return to_hexed_int(self.traffic_class_value, 1)
+
+    @cached_property
+    def flow_label_value(self):
+        return self._header[0] & 0xFFFFF
+
+    @cached_property
+    def flow_label(self):
+        return to_hexed_int(self.flow_label_value, 3)
+
+    @cached_property
+    def payload_length(self):
+        return self._header[1]
+
+    @cached_property
+    def next_header_value(self):
+        return self._header[2]
+
+    @cached_property
+    def next_header(self):
+        return to_hexed_int(self.next_header_value, 1)
+
+    @cached_property
+    def hop_limit(self):
+        return self._header[3]
+
+    @cached_property
+    def source_value(self):
+        return int.from_bytes(self._header[4], 'big')
+
+    @cached_property
+    def destination_value(self):
+        return int.from_bytes(self._header[5], 'big')
+
+    @cached_property
+    def source(self):
+        return to_ipv6_address(self._header[4])
+
+    @cached_property
+    def destination(self):
+        return to_ipv6_address(self._header[5])
+
+    @cached_property
+    def transport_frame(self):
+        return _transport_frame(self.__buf, self.__offset + _IPV6_HEADER_LENGTH, self.next_header_value)
+
+
+class LazyEthernetFrame(EthernetFrame):
+    def __init__(self, buf, type_value):
+        LinkFrame.__init__(self, 'ethernet', buf, None)
+        self.__buf = buf
+        self.__type_value = type_value
+
+    @cached_property
+    def _header(self):
+        return _ETHERNET_HEADER.unpack_from(self.__buf)
+
+    @property
+    def type_value(self):
+        return self.__type_value
+
+    @cached_property
+    def destination(self):
+        return to_mac_address(self._header[0])
+
+    @cached_property
+    def source(self):
+        return to_mac_address(self._header[1])
+
+    @cached_property
+    def type(self):
+        return to_hexed_int(self.__type_value, 4)
+
+    @cached_property
+    def data(self):
+        return self.__buf[_ETHERNET_HEADER_LENGTH:]
+
+    @cached_property
+    def internet_frame(self):
+        if self.__type_value == _IPV4_TYPE:
+            return LazyIpv4Frame(self.__buf, _ETHERNET_HEADER_LENGTH)
+
+        return LazyIpv6Frame(self.__buf, _ETHERNET_HEADER_LENGTH)
+
+
+class LazyEthernetFrameParser(LinkFrameParser):
+    # checks only what eager parsers check to accept the frame,
+    # everything else is decoded by the frame on demand;
+    # transport frame is None when its header was cut off by snap length
+
+    def parse(self, data) -> Optional[LazyEthernetFrame]:
+        buf = memoryview(data)
+        type_ = self._check(buf)
+
+        return None if type_ is None else LazyEthernetFrame(buf, type_)
+
+    @staticmethod
+    def _check(buf) -> Optional[int]:
+        # ethernet type of acceptable frame or None
+        size = len(buf)
+
+        if size < _ETHERNET_HEADER_LENGTH:
+            return None
+
+        type_ = (buf[12] << 8) | buf[13]
+
+        if type_ == _IPV4_TYPE:
+            if size < _ETHERNET_HEADER_LENGTH + _IPV4_HEADER_LENGTH or buf[14] >> 4 != 4:
+                return None
+            protocol = buf[_ETHERNET_HEADER_LENGTH + 9]
+            if protocol != _TCP_TYPE and protocol != _UDP_TYPE:
+                return None
+
+        elif type_ == _IPV6_TYPE:
+            if size < _ETHERNET_HEADER_LENGTH + _IPV6_HEADER_LENGTH or buf[14] >> 4 != 6:
+                return None
+            protocol = buf[_ETHERNET_HEADER_LENGTH + 6]
+            if protocol != _TCP_TYPE and protocol != _UDP_TYPE:
+                return None
+
+        else:
+            return None
+
+        return type_
@@ -115,15 +115,13 @@ class Ipv6FrameParser(InternetFrameParser):
             flow_label = to_hexed_int(ver_tc_fw & 0xFFFFF, 3)
 
             if next_header == _TCP_TYPE:
-                transport_frame = self.__tcp.parse(raw[payload_length:])
+                transport_frame = self.__tcp.parse(raw[40:])
             elif next_header == _UDP_TYPE:
-                transport_frame = self.__udp.parse(raw[payload_length:])
+                transport_frame = self.__udp.parse(raw[40:])
             else:
                 return None
 
-            if transport_frame is None:
-                return None
-
+            # transport frame is None when its header was cut off by snap length
             return Ipv6Frame(traffic_class, flow_label, payload_length, to_hexed_int(next_header, 1), hop_limit,
                              to_ipv6_address(src), to_ipv6_address(dst), raw, transport_frame)
         except struct.error:
@@ -1,21 +1,323 @@
+import mmap
+import select
 import socket
+import struct
+import threading
+import time
+
+from network import bpf
 
 _ETH_P_ALL = 0x0003  # constant from /usr/include/linux/if_ether.h, means get all ethernet packets
 _MTU = 65535
 
+_SO_TIMESTAMPNS = 35  # constant from /usr/include/asm-generic/socket.h
+_TIMESPEC = struct.Struct('@ l l')
+_AUXDATA = struct.Struct('@ I I I H H H H')  # struct tpacket_auxdata: status, len, snaplen, mac, net, vlan
+_ANCILLARY_SIZE = socket.CMSG_SPACE(_TIMESPEC.size) + socket.CMSG_SPACE(_AUXDATA.size)
+
+# constants from /usr/include/linux/if_packet.h
+_SOL_PACKET = 263
+_PACKET_AUXDATA = 8
+_PACKET_RX_RING = 5
+_PACKET_STATISTICS = 6
+_PACKET_VERSION = 10
+_PACKET_FANOUT = 18
+_TPACKET_V3 = 2
+_TP_STATUS_KERNEL = 0
+_TP_STATUS_USER = 1
+
+FANOUT_HASH = 0
+FANOUT_LB = 1
+FANOUT_CPU = 2
+
+_STATISTICS_FMT = '@ I I I'  # struct tpacket_stats_v3, plain tpacket_stats is its prefix
+_TPACKET_REQ3_FMT = '@ I I I I I I I'
+_BLOCK_DESC_FMT = '@ I I I I'  # tpacket_block_desc: version, offset_to_priv, hdr.block_status, hdr.num_pkts
+_BLOCK_FIELD_FMT = '@ I'
+_BLOCK_STATUS_OFFSET = 8  # tpacket_hdr_v1.block_status
+_BLOCK_FIRST_PACKET_OFFSET = 16  # tpacket_hdr_v1.offset_to_first_pkt
+_PACKET_HDR = struct.Struct('@ I I I I I I H')  # tpacket3_hdr up to tp_mac
+
+_BLOCK_SIZE = 1 << 22
+_BLOCK_COUNT = 64
+_FRAME_SIZE = 1 << 11
+_BLOCK_TIMEOUT_MS = 64
+_BATCH_SIZE = 64
+
 
 class RawFrameGenerator:
-    def __init__(self, mtu=_MTU, interface=''):
+    # snaplen limits number of received bytes of each frame, 0 means whole frame up to mtu.
+    # Frames are cut by the kernel when attached filter accepts only snaplen bytes (see bpf.compile_filter),
+    # otherwise by the size of receive buffer. Length of the frame on the wire comes with packet auxdata.
+    # With timeout in seconds recv_batch returns empty batch when no frame arrives within it,
+    # so the caller gets control back on a quiet link, e.g. to flush saved frames.
+
+    def __init__(self, mtu=_MTU, interface='', snaplen=0, timeout=None):
         self.__mtu = mtu
+        self.__size = snaplen if 0 < snaplen < mtu else mtu
         self.__conn = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(_ETH_P_ALL))
+        self.__packets = 0
+        self.__drops = 0
+        self.__statistics_lock = threading.Lock()
+        self.__pool = []
+        self.__timestamp = None
+        self.__timestamps = []
+        self.__orig_len = None
+        self.__orig_lens = []
+        self.__timeout = None if timeout is None else int(timeout * 1000)
+        self.__waiter = None
+        self.__conn.setsockopt(socket.SOL_SOCKET, _SO_TIMESTAMPNS, 1)
+        self.__conn.setsockopt(_SOL_PACKET, _PACKET_AUXDATA, 1)
         if interface != '':
             self.__conn.bind((interface, 0))
+        if timeout is not None:
+            self.__waiter = select.poll()
+            self.__waiter.register(self.__conn.fileno(), select.POLLIN)
 
     @property
     def socket(self):
         return self.__conn
 
+    @property
+    def timeout(self):
+        # milliseconds recv_batch waits for the first frame, None means forever
+        return self.__timeout
+
+    @property
+    def timestamp(self):
+        # kernel receive time in nanoseconds of the frame returned by the last recv_next
+        return self.__timestamp
+
+    @property
+    def timestamps(self):
+        # kernel receive times of the frames returned by the last recv_batch
+        return self.__timestamps
+
+    @property
+    def snaplen(self):
+        return self.__size
+
+    @property
+    def orig_len(self):
+        # length on the wire of the frame returned by the last recv_next
+        return self.__orig_len
+
+    @property
+    def orig_lens(self):
+        # lengths on the wire of the frames returned by the last recv_batch
+        return self.__orig_lens
+
     def recv_next(self):
-        package, addr = self.__conn.recvfrom(self.__mtu)
+        package, ancdata, flags, addr = self.__conn.recvmsg(self.__size, _ANCILLARY_SIZE)
+        self.__timestamp, self.__orig_len = _get_ancillary(ancdata, len(package))
 
         return package
+
+    def recv_batch(self, n=_BATCH_SIZE):
+        # frames are received into the reusable pool of buffers,
+        # so returned views are valid only until the next call
+        while len(self.__pool) < n:
+            self.__pool.append(memoryview(bytearray(self.__size)))
+
+        conn = self.__conn
+        pool = self.__pool
+        batch = []
+        timestamps = []
+        orig_lens = []
+        flags = 0
+
+        if self.__waiter is not None and not self.__waiter.poll(self.__timeout):
+            n = 0  # nothing arrived within timeout
+
+        try:
+            for i in range(n):
+                size, ancdata, msg_flags, addr = conn.recvmsg_into((pool[i],), _ANCILLARY_SIZE, flags)
+                timestamp, orig_len = _get_ancillary(ancdata, size)
+                batch.append(pool[i][:size])
+                timestamps.append(timestamp)
+                orig_lens.append(orig_len)
+                flags = socket.MSG_DONTWAIT
+        except BlockingIOError:
+            pass
+
+        self.__timestamps = timestamps
+        self.__orig_lens = orig_lens
+
+        return batch
+
+    def attach_filter(self, program):
+        bpf.attach_filter(self.__conn, program)
+
+    def join_fanout(self, group_id, mode=FANOUT_HASH):
+        # sockets of the same group share the traffic, hash mode keeps each flow on one socket
+        self.__conn.setsockopt(_SOL_PACKET, _PACKET_FANOUT, (group_id & 0xFFFF) | (mode << 16))
+
+    def get_statistics(self):
+        # Kernel resets counters on each read, so they are accumulated here. Totals are returned,
+        # so callers from several threads (capture loop, metrics export) see all counts and take their own deltas.
+        with self.__statistics_lock:
+            stats = self.__conn.getsockopt(_SOL_PACKET, _PACKET_STATISTICS, struct.calcsize(_STATISTICS_FMT))
+            packets, drops = struct.unpack_from('@ I I', stats)
+            self.__packets += packets
+            self.__drops += drops
+
+            return self.__packets, self.__drops
+
+    def close(self):
+        self.__conn.close()
+
+
+class RingFrameGenerator(RawFrameGenerator):
+    # frames are returned as memoryviews into the ring, they stay valid
+    # until the whole block is consumed and handed back to the kernel
+
+    def __init__(self, interface='', block_size=_BLOCK_SIZE, block_count=_BLOCK_COUNT,
+                 frame_size=_FRAME_SIZE, block_timeout=_BLOCK_TIMEOUT_MS, snaplen=0, timeout=None):
+        if block_size <= 0 or block_size % mmap.PAGESIZE != 0:
+            raise ValueError(f'Block size must be positive multiple of page size ({mmap.PAGESIZE})')
+        if block_count <= 0:
+            raise ValueError('Block count must be positive')
+
+        super().__init__(interface=interface, snaplen=snaplen, timeout=timeout)
+
+        self.__block_size = block_size
+        self.__block_count = block_count
+
+        conn = self.socket
+        conn.setsockopt(_SOL_PACKET, _PACKET_VERSION, _TPACKET_V3)
+        conn.setsockopt(_SOL_PACKET, _PACKET_RX_RING,
+                        struct.pack(_TPACKET_REQ3_FMT, block_size, block_count, frame_size,
+                                    block_size // frame_size * block_count, block_timeout, 0, 0))
+
+        self.__ring = mmap.mmap(conn.fileno(), block_size * block_count,
+                                mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.__view = memoryview(self.__ring)
+        self.__poll = select.poll()
+        self.__poll.register(conn.fileno(), select.POLLIN | select.POLLERR)
+
+        self.__timestamp = None
+        self.__timestamps = []
+        self.__orig_len = None
+        self.__orig_lens = []
+        self.__block = 0
+        self.__block_offset = None
+        self.__packets_left = 0
+        self.__packet_offset = 0
+
+    @property
+    def block_size(self):
+        return self.__block_size
+
+    @property
+    def block_count(self):
+        return self.__block_count
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def timestamps(self):
+        return self.__timestamps
+
+    @property
+    def orig_len(self):
+        return self.__orig_len
+
+    @property
+    def orig_lens(self):
+        return self.__orig_lens
+
+    def recv_next(self):
+        while self.__packets_left == 0:
+            self.__next_block()
+
+        offset = self.__packet_offset
+        next_offset, sec, nsec, snaplen, length, status, mac = _PACKET_HDR.unpack_from(self.__ring, offset)
+
+        self.__packets_left -= 1
+        self.__packet_offset = offset + next_offset
+        self.__timestamp = sec * 1000000000 + nsec
+        self.__orig_len = length
+
+        return self.__view[offset + mac: offset + mac + min(snaplen, self.snaplen)]
+
+    def recv_batch(self, n=_BATCH_SIZE):
+        # never crosses a block boundary, so the whole batch is released at once
+        batch = []
+        timestamps = []
+        orig_lens = []
+
+        while self.__packets_left == 0:
+            if not self.__next_block(self.timeout):
+                n = 0  # no block was filled within timeout
+                break
+
+        for _ in range(min(n, self.__packets_left)):
+            batch.append(self.recv_next())
+            timestamps.append(self.__timestamp)
+            orig_lens.append(self.__orig_len)
+
+        self.__timestamps = timestamps
+        self.__orig_lens = orig_lens
+
+        return batch
+
+    def close(self):
+        try:
+            self.__release_block()
+            self.__view.release()
+
+            try:
+                self.__ring.close()
+            except BufferError:
+                pass  # frames are still referenced, ring is unmapped along with them
+        finally:
+            super().close()
+
+    def __next_block(self, timeout=None):
+        # False when the kernel does not fill the block within timeout milliseconds
+        self.__release_block()
+
+        offset = self.__block * self.__block_size
+
+        while True:
+            version, offset_to_priv, status, packets = struct.unpack_from(_BLOCK_DESC_FMT, self.__ring, offset)
+
+            if status & _TP_STATUS_USER:
+                break
+
+            if not self.__poll.poll(timeout) and timeout is not None:
+                return False
+
+        first, = struct.unpack_from(_BLOCK_FIELD_FMT, self.__ring, offset + _BLOCK_FIRST_PACKET_OFFSET)
+
+        self.__block_offset = offset
+        self.__packets_left = packets
+        self.__packet_offset = offset + first
+
+        return True
+
+    def __release_block(self):
+        if self.__block_offset is None:
+            return
+
+        struct.pack_into(_BLOCK_FIELD_FMT, self.__ring, self.__block_offset + _BLOCK_STATUS_OFFSET, _TP_STATUS_KERNEL)
+
+        self.__block_offset = None
+        self.__block = (self.__block + 1) % self.__block_count
+
+
+def _get_ancillary(ancdata, size):
+    # (receive time in nanoseconds, length of the frame on the wire)
+    timestamp = None
+    orig_len = size
+
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == _SO_TIMESTAMPNS:
+            sec, nsec = _TIMESPEC.unpack_from(data)
+            timestamp = sec * 1000000000 + nsec
+        elif level == _SOL_PACKET and type_ == _PACKET_AUXDATA:
+            orig_len = max(size, _AUXDATA.unpack_from(data)[1])
+
+    return time.time_ns() if timestamp is None else timestamp, orig_len
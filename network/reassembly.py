@@ -0,0 +1,540 @@
+import heapq
+import ipaddress
+import struct
+import time
+from collections import OrderedDict
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8, 0x9100)
+_TCP_TYPE = 6
+_IPV6_FRAGMENT_TYPE = 44
+
+_ETHERNET_HEADER_LENGTH = 14
+_VLAN_TAG_LENGTH = 4
+_IPV6_HEADER_LENGTH = 40
+_IPV6_FRAGMENT_HEADER_LENGTH = 8
+
+_ETHER_TYPE = struct.Struct('! H')
+_IPV4_HEADER = struct.Struct('! B 1x H H H 4x 4s 4s')
+_U16 = struct.Struct('! H')
+_IPV6_HEADER = struct.Struct('! 4x H B 1x 16s 16s')
+_IPV6_FRAGMENT_HEADER = struct.Struct('! B 1x H I')
+_IPV6_LENGTH = struct.Struct('! H B')  # payload length and next header at offset 4
+_TCP_HEADER = struct.Struct('! H H I 4x B B')
+
+_SYN = 0x02
+_FIN = 0x01
+_RST = 0x04
+
+_SEQUENCE_MASK = 0xFFFFFFFF
+_HALF_SEQUENCE = 1 << 31
+
+FRAGMENT_TIMEOUT = 30.0
+MAX_DATAGRAM = 65535
+FRAGMENT_MEMORY = 1 << 24
+
+STREAM_TIMEOUT = 120.0
+STREAM_MEMORY = 1 << 20
+STREAMS_MEMORY = 1 << 26
+MAX_STREAMS = 100000
+
+
+def _network_offset(data):
+    # (ethernet type, offset of network header) after vlan tags or None for too short frame
+    size = len(data)
+
+    if size < _ETHERNET_HEADER_LENGTH:
+        return None
+
+    offset = _ETHERNET_HEADER_LENGTH
+    ethertype, = _ETHER_TYPE.unpack_from(data, offset - 2)
+
+    while ethertype in _VLAN_TYPES:
+        if size < offset + _VLAN_TAG_LENGTH:
+            return None
+        ethertype, = _ETHER_TYPE.unpack_from(data, offset + 2)
+        offset += _VLAN_TAG_LENGTH
+
+    return ethertype, offset
+
+
+def _ipv4_checksum(header):
+    total = sum(struct.unpack(f'! {len(header) // 2}H', header))
+
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+
+    return ~total & 0xFFFF
+
+
+class _Datagram:
+    # intervals are sorted disjoint (start, end) ranges of payload received so far
+    __slots__ = ('prefix', 'network_offset', 'version', 'next_header', 'payload', 'intervals', 'total', 'first_seen')
+
+    def __init__(self, version, timestamp):
+        self.prefix = None
+        self.network_offset = 0
+        self.version = version
+        self.next_header = None
+        self.payload = bytearray()
+        self.intervals = []
+        self.total = None
+        self.first_seen = timestamp
+
+    def add(self, start, data):
+        # overlapping bytes which were received before are kept, only holes are filled
+        end = start + len(data)
+
+        if len(self.payload) < end:
+            self.payload.extend(bytes(end - len(self.payload)))
+
+        position = start
+
+        for first, last in self.intervals:
+            if last <= position:
+                continue
+            if first >= end:
+                break
+            if first > position:
+                self.payload[position:first] = data[position - start:first - start]
+            position = max(position, last)
+
+        if position < end:
+            self.payload[position:end] = data[position - start:]
+
+        merged = []
+
+        for first, last in sorted(self.intervals + [(start, end)]):
+            if merged and first <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+
+        self.intervals = merged
+
+    @property
+    def complete(self):
+        return self.prefix is not None and self.total is not None and self.intervals == [(0, self.total)]
+
+    def build(self):
+        prefix = bytearray(self.prefix)
+        offset = self.network_offset
+
+        if self.version == 4:
+            header_length = len(prefix) - offset
+            flags, = _U16.unpack_from(prefix, offset + 6)
+            _U16.pack_into(prefix, offset + 2, header_length + self.total)
+            _U16.pack_into(prefix, offset + 6, flags & 0x4000)
+            _U16.pack_into(prefix, offset + 10, 0)
+            _U16.pack_into(prefix, offset + 10, _ipv4_checksum(prefix[offset:]))
+        else:
+            _IPV6_LENGTH.pack_into(prefix, offset + 4, self.total, self.next_header)
+
+        return bytes(prefix) + self.payload[:self.total]
+
+
+class FragmentReassembler:
+    # Rebuilds fragmented ipv4 datagrams and ipv6 datagrams whose fragment header follows the fixed header.
+    # feed returns the frame itself when it is not a fragment, None while its datagram is incomplete
+    # and the whole rebuilt frame (headers of the first fragment) with the last fragment.
+    # Datagrams larger than max_datagram are dropped, as well as the oldest ones when all buffered fragments
+    # take more than max_memory bytes and the ones not completed within timeout seconds.
+
+    def __init__(self, timeout=FRAGMENT_TIMEOUT, max_datagram=MAX_DATAGRAM, max_memory=FRAGMENT_MEMORY):
+        self.__timeout = int(timeout * 1e9)
+        self.__max_datagram = max_datagram
+        self.__max_memory = max_memory
+        self.__datagrams = OrderedDict()
+        self.__memory = 0
+        self.__last_expire = None
+        self.__reassembled = 0
+        self.__dropped = 0
+
+    def __len__(self):
+        return len(self.__datagrams)
+
+    @property
+    def memory(self):
+        return self.__memory
+
+    @property
+    def reassembled(self):
+        return self.__reassembled
+
+    @property
+    def dropped(self):
+        return self.__dropped
+
+    def feed(self, data, timestamp=None):
+        located = _network_offset(data)
+
+        if located is None:
+            return data
+
+        ethertype, offset = located
+        size = len(data)
+
+        if ethertype == _IPV4_TYPE:
+            if size < offset + _IPV4_HEADER.size:
+                return data
+
+            version_header_length, length, identifier, flags_offset, src, dst = _IPV4_HEADER.unpack_from(data, offset)
+
+            if version_header_length >> 4 != 4 or not flags_offset & 0x3FFF:
+                return data
+
+            header_length = (version_header_length & 0xF) * 4
+            key = (4, src, dst, data[offset + 9], identifier)
+            start = (flags_offset & 0x1FFF) * 8
+            more = flags_offset & 0x2000
+            end = offset + length
+            next_header = None
+
+        elif ethertype == _IPV6_TYPE:
+            if size < offset + _IPV6_HEADER_LENGTH + _IPV6_FRAGMENT_HEADER_LENGTH:
+                return data
+
+            length, next_header, src, dst = _IPV6_HEADER.unpack_from(data, offset)
+
+            if next_header != _IPV6_FRAGMENT_TYPE:
+                return data
+
+            next_header, offset_flags, identifier = \
+                _IPV6_FRAGMENT_HEADER.unpack_from(data, offset + _IPV6_HEADER_LENGTH)
+            header_length = _IPV6_HEADER_LENGTH + _IPV6_FRAGMENT_HEADER_LENGTH
+            key = (6, src, dst, identifier)
+            start = offset_flags & 0xFFF8
+            more = offset_flags & 1
+            end = offset + _IPV6_HEADER_LENGTH + length
+
+        else:
+            return data
+
+        if size < end:
+            return data  # fragment cut by snap length can not be reassembled
+
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        payload = data[offset + header_length:end]
+
+        if start + len(payload) > self.__max_datagram:
+            self.__drop(key)
+            return None
+
+        datagram = self.__datagrams.get(key)
+
+        if datagram is None:
+            datagram = _Datagram(key[0], timestamp)
+            self.__datagrams[key] = datagram
+
+        if start == 0:
+            # ipv6 fragment header is not copied, the rebuilt frame has plain ipv6 header
+            prefix_end = offset + (header_length if key[0] == 4 else _IPV6_HEADER_LENGTH)
+            datagram.prefix = bytes(data[:prefix_end])
+            datagram.network_offset = offset
+            datagram.next_header = next_header
+
+        if not more:
+            datagram.total = start + len(payload)
+
+        before = len(datagram.payload)
+        datagram.add(start, payload)
+        self.__memory += len(datagram.payload) - before
+
+        if datagram.complete:
+            del self.__datagrams[key]
+            self.__memory -= len(datagram.payload)
+            self.__reassembled += 1
+            return datagram.build()
+
+        while self.__memory > self.__max_memory and self.__datagrams:
+            self.__drop(next(iter(self.__datagrams)))
+
+        if self.__last_expire is None:
+            self.__last_expire = timestamp
+        elif timestamp - self.__last_expire >= self.__timeout:
+            self.expire(timestamp)
+
+        return None
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time_ns()
+
+        self.__last_expire = now
+        datagrams = self.__datagrams
+
+        while datagrams and now - next(iter(datagrams.values())).first_seen >= self.__timeout:
+            self.__drop(next(iter(datagrams)))
+
+    def __drop(self, key):
+        datagram = self.__datagrams.pop(key, None)
+
+        if datagram is not None:
+            self.__memory -= len(datagram.payload)
+            self.__dropped += 1
+
+
+class Stream:
+    # One direction of a tcp connection. position counts bytes of the stream passed to the consumer
+    # including skipped gaps, segments maps stream position of out of order data to its copy.
+    __slots__ = ('key', 'first_seen', 'last_seen', 'next_sequence', 'position', 'segments', 'positions',
+                 'buffered', 'gaps', 'fin')
+
+    def __init__(self, key, sequence, timestamp):
+        self.key = key
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.next_sequence = sequence
+        self.position = 0
+        self.segments = {}
+        self.positions = []
+        self.buffered = 0
+        self.gaps = 0
+        self.fin = None
+
+    @property
+    def src(self):
+        return str(ipaddress.ip_address(self.key[0]))
+
+    @property
+    def src_port(self):
+        return self.key[1]
+
+    @property
+    def dst(self):
+        return str(ipaddress.ip_address(self.key[2]))
+
+    @property
+    def dst_port(self):
+        return self.key[3]
+
+    @property
+    def bytes(self):
+        return self.position - self.gaps
+
+    def get_description(self):
+        return f'Stream tcp {self.src}:{self.src_port} -> {self.dst}:{self.dst_port} ' \
+               f'bytes={self.bytes} gaps={self.gaps} duration={(self.last_seen - self.first_seen) / 1e9:.3f}s'
+
+
+class StreamReassembler:
+    # Orders tcp segments of each direction by sequence number and passes stream data to on_data(stream, data)
+    # as soon as it is contiguous. In order data is passed as a view of the frame itself, valid only during
+    # the call, out of order segments are copied until the missing data arrives.
+    # Bytes which were already passed win over overlapping retransmissions.
+    # When a stream buffers more than max_stream_memory bytes or all of them more than max_memory,
+    # the gap before the first buffered segment is skipped (counted in stream.gaps).
+    # Streams end after fin, rst, timeout seconds of silence or eviction when there are more than max_streams,
+    # buffered data is passed and on_close(stream) is called.
+
+    def __init__(self, on_data=None, on_close=None, timeout=STREAM_TIMEOUT, max_stream_memory=STREAM_MEMORY,
+                 max_memory=STREAMS_MEMORY, max_streams=MAX_STREAMS):
+        self.__on_data = on_data
+        self.__on_close = on_close
+        self.__timeout = int(timeout * 1e9)
+        self.__max_stream_memory = max_stream_memory
+        self.__max_memory = max_memory
+        self.__max_streams = max_streams
+        self.__streams = OrderedDict()
+        self.__buffering = OrderedDict()
+        self.__memory = 0
+        self.__last_expire = None
+
+    def __len__(self):
+        return len(self.__streams)
+
+    def __iter__(self):
+        return iter(self.__streams.values())
+
+    @property
+    def memory(self):
+        return self.__memory
+
+    def update(self, data, timestamp=None):
+        located = _network_offset(data)
+
+        if located is None:
+            return None
+
+        ethertype, offset = located
+        size = len(data)
+
+        if ethertype == _IPV4_TYPE:
+            if size < offset + _IPV4_HEADER.size:
+                return None
+
+            version_header_length, length, identifier, flags_offset, src, dst = _IPV4_HEADER.unpack_from(data, offset)
+
+            if version_header_length >> 4 != 4 or flags_offset & 0x3FFF or data[offset + 9] != _TCP_TYPE:
+                return None
+
+            transport = offset + (version_header_length & 0xF) * 4
+            end = min(size, offset + length)
+
+        elif ethertype == _IPV6_TYPE:
+            if size < offset + _IPV6_HEADER_LENGTH:
+                return None
+
+            length, next_header, src, dst = _IPV6_HEADER.unpack_from(data, offset)
+
+            if next_header != _TCP_TYPE:
+                return None
+
+            transport = offset + _IPV6_HEADER_LENGTH
+            end = min(size, transport + length)
+
+        else:
+            return None
+
+        if end < transport + _TCP_HEADER.size:
+            return None
+
+        src_port, dst_port, sequence, data_offset, flags = _TCP_HEADER.unpack_from(data, transport)
+        payload = memoryview(data)[transport + (data_offset >> 4) * 4:end]
+
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        key = (src, src_port, dst, dst_port)
+        stream = self.__streams.get(key)
+
+        if stream is None:
+            # pure acks and resets after the end of stream do not start a new one
+            if flags & _RST or not payload and not flags & _SYN:
+                return None
+
+            stream = Stream(key, sequence, timestamp)
+            self.__streams[key] = stream
+
+            if len(self.__streams) > self.__max_streams:
+                self.__finish(next(iter(self.__streams.values())))
+        else:
+            self.__streams.move_to_end(key)
+
+        stream.last_seen = timestamp
+
+        if flags & _SYN:
+            if stream.position == 0 and not stream.segments:
+                stream.next_sequence = sequence + 1 & _SEQUENCE_MASK
+            sequence = sequence + 1 & _SEQUENCE_MASK
+
+        if payload:
+            self.__segment(stream, sequence, payload)
+
+        if flags & _RST:
+            self.__finish(stream)
+        else:
+            if flags & _FIN:
+                stream.fin = self.__stream_position(stream, sequence + len(payload))
+
+            if stream.fin is not None and stream.position >= stream.fin and stream.key in self.__streams:
+                self.__finish(stream)
+
+        if self.__last_expire is None:
+            self.__last_expire = timestamp
+        elif timestamp - self.__last_expire >= self.__timeout:
+            self.expire(timestamp)
+
+        return stream
+
+    def expire(self, now=None):
+        if now is None:
+            now = time.time_ns()
+
+        self.__last_expire = now
+        streams = self.__streams
+
+        while streams and now - next(iter(streams.values())).last_seen >= self.__timeout:
+            self.__finish(next(iter(streams.values())))
+
+    def flush(self):
+        while self.__streams:
+            self.__finish(next(iter(self.__streams.values())))
+
+    @staticmethod
+    def __stream_position(stream, sequence):
+        # sequence numbers wrap, the ones less than half of the space behind the next expected are in the past
+        delta = (sequence - stream.next_sequence) & _SEQUENCE_MASK
+
+        if delta >= _HALF_SEQUENCE:
+            return stream.position - ((1 << 32) - delta)
+
+        return stream.position + delta
+
+    def __segment(self, stream, sequence, payload):
+        position = self.__stream_position(stream, sequence)
+
+        if position <= stream.position:
+            skip = stream.position - position
+
+            if skip < len(payload):
+                self.__deliver(stream, payload[skip:])
+                self.__drain(stream)
+            return
+
+        existing = stream.segments.get(position)
+
+        if existing is not None and len(existing) >= len(payload):
+            return
+
+        if existing is None:
+            heapq.heappush(stream.positions, position)
+        else:
+            self.__release(stream, len(existing))
+
+        stream.segments[position] = bytes(payload)
+        stream.buffered += len(payload)
+        self.__memory += len(payload)
+        self.__buffering[stream.key] = stream
+        self.__buffering.move_to_end(stream.key)
+
+        while stream.buffered > self.__max_stream_memory:
+            self.__skip_gap(stream)
+
+        while self.__memory > self.__max_memory and self.__buffering:
+            self.__skip_gap(next(iter(self.__buffering.values())))
+
+    def __deliver(self, stream, data):
+        stream.position += len(data)
+        stream.next_sequence = stream.next_sequence + len(data) & _SEQUENCE_MASK
+
+        if self.__on_data is not None:
+            self.__on_data(stream, data)
+
+    def __drain(self, stream):
+        positions = stream.positions
+
+        while positions and positions[0] <= stream.position:
+            position = heapq.heappop(positions)
+            data = stream.segments.pop(position)
+            self.__release(stream, len(data))
+            skip = stream.position - position
+
+            if skip < len(data):
+                self.__deliver(stream, memoryview(data)[skip:])
+
+        if not stream.segments:
+            self.__buffering.pop(stream.key, None)
+
+    def __skip_gap(self, stream):
+        gap = stream.positions[0] - stream.position
+        stream.gaps += gap
+        stream.position += gap
+        stream.next_sequence = stream.next_sequence + gap & _SEQUENCE_MASK
+        self.__drain(stream)
+
+    def __release(self, stream, size):
+        stream.buffered -= size
+        self.__memory -= size
+
+    def __finish(self, stream):
+        while stream.positions:
+            self.__skip_gap(stream)
+
+        del self.__streams[stream.key]
+
+        if self.__on_close is not None:
+            self.__on_close(stream)
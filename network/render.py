@@ -0,0 +1,103 @@
+import sys
+import time
+
+from network.frames import EthernetFrame, Ipv4Frame, TcpFrame
+
+FLUSH_SIZE = 1 << 16
+FLUSH_INTERVAL = 0.5
+
+_SEPARATOR = '>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>'
+_TCP_FLAGS = (('syn', 'S'), ('fin', 'F'), ('rst', 'R'), ('psh', 'P'), ('urg', 'U'), ('ack', '.'))
+
+
+class ConsoleWriter:
+    # Collects text and writes it to the stream in big chunks, because a write per frame costs more than
+    # formatting the frame. Text is written when flush_size characters are collected, when flush_interval
+    # seconds passed since the last write, on flush and on close.
+
+    def __init__(self, stream=None, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.__stream = sys.stdout if stream is None else stream
+        self.__flush_size = flush_size
+        self.__flush_interval = flush_interval
+        self.__parts = []
+        self.__size = 0
+        self.__last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, text):
+        self.__parts.append(text)
+        self.__size += len(text)
+
+        if self.__size >= self.__flush_size or time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.__parts:
+            self.__stream.write(''.join(self.__parts))
+            self.__parts.clear()
+            self.__size = 0
+
+        self.__stream.flush()
+        self.__last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+
+class FrameRenderer:
+    # Turns frames into text: numbered descriptions of all layers or one line per frame in compact mode.
+    # payload is number of data bytes in hex dumps, None for all of them, 0 for headers only.
+
+    def __init__(self, payload=None, compact=False):
+        self.__payload = payload
+        self.__compact = compact
+        self.__count = 0
+        self.__second = None
+        self.__second_text = ''
+
+    def render(self, frame: EthernetFrame):
+        number = self.__count
+        self.__count += 1
+
+        if self.__compact:
+            return f'{self.__format_time(frame.timestamp)} {_summary(frame)}\n'
+
+        return f'Frame #{number}:\n{frame.get_description(payload=self.__payload)}\n{_SEPARATOR}\n'
+
+    def __format_time(self, timestamp):
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        second, nanoseconds = divmod(timestamp, 1000000000)
+
+        if second != self.__second:
+            self.__second = second
+            self.__second_text = time.strftime('%H:%M:%S', time.localtime(second))
+
+        return f'{self.__second_text}.{nanoseconds // 1000:06}'
+
+
+def _summary(frame: EthernetFrame):
+    # tcpdump like line: addresses with ports, protocol, tcp flags and frame length
+    internet = frame.internet_frame
+    transport = internet.transport_frame
+
+    if isinstance(internet, Ipv4Frame):
+        src, dst = internet.src, internet.dst
+    else:
+        src, dst = internet.source, internet.destination
+
+    if transport is None:
+        return f'{src} > {dst} {internet.protocol} length {frame.orig_len}'
+
+    if isinstance(transport, TcpFrame):
+        flags = ''.join(letter for name, letter in _TCP_FLAGS if getattr(transport, name))
+
+        return f'{src}.{transport.src} > {dst}.{transport.dst} tcp [{flags}] length {frame.orig_len}'
+
+    return f'{src}.{transport.source_port} > {dst}.{transport.destination_port} udp length {frame.orig_len}'
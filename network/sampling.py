@@ -0,0 +1,195 @@
+import time
+import zlib
+from abc import abstractmethod
+
+from network.classifier import FrameClassifier
+
+MAX_RATIO = 1024
+INTERVAL = 1.0
+SETTLE = 5
+
+# load thresholds of adaptive sampling: share of packets dropped by kernel and fill of pipeline queues
+DROP_RATE_HIGH = 0.01
+DROP_RATE_LOW = 0.001
+QUEUE_HIGH = 0.5
+QUEUE_LOW = 0.1
+
+
+class Sampler:
+    # Keeps about 1 of every ratio packages. Every kept package stands for ratio seen ones,
+    # so estimate, sum of ratios the packages were kept with, scales counts of sampled traffic back up.
+    # Changes of ratio are recorded in changes as (timestamp, ratio) and passed to on_change.
+
+    def __init__(self, ratio=1, on_change=None):
+        if ratio < 1:
+            raise ValueError('Sampling ratio must be positive')
+
+        self.__ratio = ratio
+        self.__on_change = on_change
+        self.__changes = []
+        self.__seen = 0
+        self.__kept = 0
+        self.__estimate = 0
+
+    @property
+    def ratio(self):
+        return self.__ratio
+
+    @property
+    def changes(self):
+        return self.__changes
+
+    @property
+    def seen(self):
+        return self.__seen
+
+    @property
+    def kept(self):
+        return self.__kept
+
+    @property
+    def estimate(self):
+        return self.__estimate
+
+    def set_ratio(self, ratio, timestamp=None):
+        if ratio < 1:
+            raise ValueError('Sampling ratio must be positive')
+
+        if ratio == self.__ratio:
+            return
+
+        self.__ratio = ratio
+        self.__changes.append((timestamp, ratio))
+
+        if self.__on_change is not None:
+            self.__on_change(timestamp, ratio)
+
+    def keep(self, package, timestamp=None):
+        self.__seen += 1
+
+        if not self._select(package):
+            return False
+
+        self.__kept += 1
+        self.__estimate += self.__ratio
+
+        return True
+
+    @abstractmethod
+    def _select(self, package):
+        raise NotImplementedError
+
+    def get_description(self):
+        return (f'Sampling {type(self).__name__} 1/{self.__ratio}: kept {self.__kept} of {self.__seen} frames, '
+                f'estimated {self.__estimate}, ratio changes {len(self.__changes)}')
+
+
+class CountSampler(Sampler):
+    # keeps the first package of every ratio ones, so the same input gives the same sample
+
+    def __init__(self, ratio=1, on_change=None):
+        super().__init__(ratio, on_change)
+        self.__position = 0
+
+    def _select(self, package):
+        selected = self.__position == 0
+        self.__position += 1
+
+        if self.__position >= self.ratio:
+            self.__position = 0
+
+        return selected
+
+    def set_ratio(self, ratio, timestamp=None):
+        super().set_ratio(ratio, timestamp)
+        self.__position = 0
+
+
+class FlowSampler(CountSampler):
+    # Keeps all packages of flows whose hash is divisible by ratio. Hash does not depend on direction
+    # and is the same in every process, so workers keep the same flows.
+    # When ratios are powers of two, flows kept after ratio is raised were kept before too.
+    # Non ip frames are sampled by count, fragments without ports by addresses.
+
+    def __init__(self, ratio=1, on_change=None):
+        super().__init__(ratio, on_change)
+        self.__classifier = FrameClassifier()
+
+    def _select(self, package):
+        frame_class = self.__classifier.classify(package)
+
+        if frame_class is None or frame_class.src is None:
+            return super()._select(package)
+
+        a, b = sorted(((frame_class.src, frame_class.src_port or 0), (frame_class.dst, frame_class.dst_port or 0)))
+        key = bytes((frame_class.protocol or 0,)) + a[0] + a[1].to_bytes(2, 'big') + b[0] + b[1].to_bytes(2, 'big')
+
+        return zlib.crc32(key) % self.ratio == 0
+
+
+def drop_rate(statistics):
+    # load of share of packets dropped by kernel since the previous call,
+    # statistics returns accumulated (packets, drops) like RawFrameGenerator.get_statistics,
+    # where packets include dropped ones. Delta is kept here, so other readers of the totals do not change it
+    previous = [0, 0]
+
+    def load():
+        packets, drops = statistics()
+        rate = (drops - previous[1]) / (packets - previous[0]) if packets > previous[0] else 0.0
+        previous[:] = packets, drops
+
+        return rate
+
+    return load
+
+
+def queue_fill(queues):
+    # load of the fullest of queues (tools.pipeline.BoundedQueue)
+    return lambda: max(queue.depth / queue.capacity for queue in queues)
+
+
+class AdaptiveSampler:
+    # Checks load every interval seconds of package timestamps: doubles ratio of the sampler when load is above high,
+    # halves it when load stays at or below low for settle checks in a row, so it does not swing back at once.
+    # Ratio stays between the initial one and max_ratio. Everything else is passed to the wrapped sampler.
+
+    def __init__(self, sampler: Sampler, load, high, low, interval=INTERVAL, max_ratio=MAX_RATIO, settle=SETTLE):
+        self.__sampler = sampler
+        self.__load = load
+        self.__high = high
+        self.__low = low
+        self.__interval = int(interval * 1e9)
+        self.__min_ratio = sampler.ratio
+        self.__max_ratio = max(max_ratio, sampler.ratio)
+        self.__settle = settle
+        self.__calm = 0
+        self.__next_check = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__sampler, name)
+
+    def keep(self, package, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        if timestamp >= self.__next_check:
+            self.__next_check = timestamp + self.__interval
+            self.__adapt(timestamp)
+
+        return self.__sampler.keep(package, timestamp)
+
+    def __adapt(self, timestamp):
+        load = self.__load()
+        ratio = self.__sampler.ratio
+
+        if load > self.__high:
+            self.__calm = 0
+            self.__sampler.set_ratio(min(ratio * 2, self.__max_ratio), timestamp)
+        elif load <= self.__low:
+            self.__calm += 1
+
+            if self.__calm >= self.__settle:
+                self.__calm = 0
+                self.__sampler.set_ratio(max(ratio // 2, self.__min_ratio), timestamp)
+        else:
+            self.__calm = 0
@@ -0,0 +1,114 @@
+import ipaddress
+import time
+from collections import Counter
+
+from network.classifier import FrameClassifier
+from tools.sketch import SpaceSaving
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_PROTOCOL_NAMES = {6: 'tcp', 17: 'udp', 1: 'icmp', 58: 'icmpv6'}
+
+TOP = 10
+CAPACITY = 1000
+
+
+def _protocol_name(frame_class):
+    if frame_class.ethertype == _IPV4_TYPE:
+        internet = 'ipv4'
+    elif frame_class.ethertype == _IPV6_TYPE:
+        internet = 'ipv6'
+    else:
+        return f'0x{frame_class.ethertype:04X}'
+
+    if frame_class.protocol is None:
+        return internet
+
+    return f'{internet}/{_PROTOCOL_NAMES.get(frame_class.protocol, frame_class.protocol)}'
+
+
+class TrafficStatistics:
+    # Counts packets and bytes per protocol and keeps top talkers and ports in Space-Saving sketches,
+    # so memory does not depend on number of distinct addresses and ports seen.
+    # Addresses and ports are ranked by bytes.
+    # weight is the number of packets the package stands for, e.g. ratio of sampling.
+
+    def __init__(self, top=TOP, capacity=CAPACITY):
+        self.__top = top
+        self.__classifier = FrameClassifier()
+        self.__packets = Counter()
+        self.__bytes = Counter()
+        self.__sources = SpaceSaving(capacity)
+        self.__destinations = SpaceSaving(capacity)
+        self.__source_ports = SpaceSaving(capacity)
+        self.__destination_ports = SpaceSaving(capacity)
+        self.__start = None
+        self.__end = None
+
+    @property
+    def start(self):
+        return self.__start
+
+    def update(self, package, timestamp=None, orig_len=None, weight=1):
+        frame_class = self.__classifier.classify(package)
+
+        if frame_class is None:
+            return
+
+        if timestamp is None:
+            timestamp = time.time_ns()
+        if self.__start is None:
+            self.__start = timestamp
+        self.__end = timestamp
+
+        size = (len(package) if orig_len is None else orig_len) * weight
+        protocol = _protocol_name(frame_class)
+        self.__packets[protocol] += weight
+        self.__bytes[protocol] += size
+
+        if frame_class.src is not None:
+            self.__sources.add(frame_class.src, size)
+            self.__destinations.add(frame_class.dst, size)
+
+        if frame_class.src_port is not None:
+            name = _PROTOCOL_NAMES[frame_class.protocol]
+            self.__source_ports.add((name, frame_class.src_port), size)
+            self.__destination_ports.add((name, frame_class.dst_port), size)
+
+    def clear(self):
+        for counter in (self.__packets, self.__bytes, self.__sources, self.__destinations,
+                        self.__source_ports, self.__destination_ports):
+            counter.clear()
+
+        self.__start = None
+        self.__end = None
+
+    def get_description(self):
+        packets = sum(self.__packets.values())
+        total = sum(self.__bytes.values())
+        duration = 0 if self.__start is None else (self.__end - self.__start) / 1e9
+        lines = [f'Statistics for {duration:.1f}s: {packets} packets, {total} bytes',
+                 f'{"Protocol":<16}{"Packets":>12}{"Bytes":>16}{"Share":>8}']
+
+        for protocol, count in self.__packets.most_common():
+            share = self.__bytes[protocol] / total * 100 if total else 0
+            lines.append(f'{protocol:<16}{count:>12}{self.__bytes[protocol]:>16}{share:>7.1f}%')
+
+        for title, sketch, show in (('Top sources', self.__sources, _format_address),
+                                    ('Top destinations', self.__destinations, _format_address),
+                                    ('Top source ports', self.__source_ports, _format_port),
+                                    ('Top destination ports', self.__destination_ports, _format_port)):
+            lines.append(f'{title:<40}{"Bytes":>16}{"Error":>12}')
+
+            for key, count, error in sketch.top(self.__top):
+                lines.append(f'{show(key):<40}{count:>16}{error:>12}')
+
+        return '\n'.join(lines)
+
+
+def _format_address(key):
+    return str(ipaddress.ip_address(key))
+
+
+def _format_port(key):
+    return f'{key[0]}/{key[1]}'
@@ -0,0 +1,241 @@
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+from network.classifier import FrameClassifier
+from saver.saver import Saver
+
+MAGIC = b'SNIFCOL1'
+VERSION = 1
+ROW_GROUP_SIZE = 65536
+
+# name and struct code of the column: integers are stored little endian, '6s' and '16s' are fixed size bytes.
+# Fields absent in the frame are zeros, ipv4 addresses are stored as ipv4 mapped ipv6 addresses.
+COLUMNS = (
+    ('timestamp', 'Q'),
+    ('length', 'I'),
+    ('captured', 'I'),
+    ('dst_mac', '6s'),
+    ('src_mac', '6s'),
+    ('ethertype', 'H'),
+    ('protocol', 'B'),
+    ('src', '16s'),
+    ('dst', '16s'),
+    ('src_port', 'H'),
+    ('dst_port', 'H'),
+    ('tcp_flags', 'H'),
+)
+
+_TRAILER = struct.Struct('< Q 8s')  # footer length, magic
+_IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+_NO_ADDRESS = b'\x00' * 16
+
+
+def _is_bytes(code):
+    return code.endswith('s')
+
+
+def _item_size(code):
+    return int(code[:-1]) if _is_bytes(code) else array(code).itemsize
+
+
+def _address(address):
+    if address is None:
+        return _NO_ADDRESS
+
+    return _IPV4_MAPPED + address if len(address) == 4 else address
+
+
+class ColumnarSaver(Saver):
+    # Writes header fields of frames column by column in row groups of row_group_size frames.
+    # Layout: magic, row groups with one chunk per column, json footer with columns and offsets of the chunks,
+    # footer length and magic again. So readers find the footer at the end and load only the chunks they need.
+    # Chunks are compressed with zlib unless compress is False.
+
+    def __init__(self, filename, row_group_size=ROW_GROUP_SIZE, compress=True):
+        self.__row_group_size = row_group_size
+        self.__compress = compress
+        self.__classifier = FrameClassifier()
+        self.__columns = [bytearray() if _is_bytes(code) else array(code) for name, code in COLUMNS]
+        self.__row_groups = []
+        self.__rows = 0
+        self.__count = 0
+
+        if filename == '' or filename is None:
+            self.__file = None
+        else:
+            self.__file = open(filename, 'wb')
+            self.__file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def count(self):
+        return self.__count
+
+    def save(self, package, timestamp=None, orig_len=None):
+        if self.__file is None:
+            return
+
+        frame_class = self.__classifier.classify(package)
+        size = len(package)
+
+        (timestamp_, length, captured, dst_mac, src_mac, ethertype, protocol, src, dst,
+         src_port, dst_port, tcp_flags) = self.__columns
+
+        timestamp_.append(0 if timestamp is None else timestamp)
+        length.append(size if orig_len is None else max(orig_len, size))
+        captured.append(size)
+        dst_mac += bytes(package[0:6]).ljust(6, b'\x00')
+        src_mac += bytes(package[6:12]).ljust(6, b'\x00')
+
+        if frame_class is None:
+            ethertype.append(0)
+            protocol.append(0)
+            src += _NO_ADDRESS
+            dst += _NO_ADDRESS
+            src_port.append(0)
+            dst_port.append(0)
+            tcp_flags.append(0)
+        else:
+            ethertype.append(frame_class.ethertype)
+            protocol.append(frame_class.protocol or 0)
+            src += _address(frame_class.src)
+            dst += _address(frame_class.dst)
+            src_port.append(frame_class.src_port or 0)
+            dst_port.append(frame_class.dst_port or 0)
+            tcp_flags.append(frame_class.flags or 0)
+
+        self.__rows += 1
+        self.__count += 1
+
+        if self.__rows >= self.__row_group_size:
+            self.flush()
+
+    def flush(self):
+        # writes buffered frames as a row group
+        if self.__file is None or self.__rows == 0:
+            return
+
+        chunks = {}
+
+        for (name, code), column in zip(COLUMNS, self.__columns):
+            if not _is_bytes(code) and sys.byteorder == 'big':
+                column.byteswap()
+
+            data = column if _is_bytes(code) else column.tobytes()
+            data = zlib.compress(data, 1) if self.__compress else data
+            chunks[name] = [self.__file.tell(), len(data)]
+            self.__file.write(data)
+            del column[:]
+
+        self.__row_groups.append({'rows': self.__rows, 'chunks': chunks})
+        self.__rows = 0
+
+    def close(self):
+        if self.__file is None:
+            return
+
+        self.flush()
+
+        footer = json.dumps({
+            'version': VERSION,
+            'codec': 'zlib' if self.__compress else 'none',
+            'columns': [{'name': name, 'type': code} for name, code in COLUMNS],
+            'row_groups': self.__row_groups,
+        }).encode()
+
+        self.__file.write(footer)
+        self.__file.write(_TRAILER.pack(len(footer), MAGIC))
+        self.__file.close()
+        self.__file = None
+
+
+class ColumnarReader:
+    # Reads files of ColumnarSaver: integer columns are returned as arrays, bytes columns as lists of bytes.
+    # Only chunks of the requested columns and row groups are read.
+
+    def __init__(self, filename):
+        self.__file = open(filename, 'rb')
+
+        try:
+            size = self.__file.seek(0, 2)
+
+            if size < len(MAGIC) + _TRAILER.size:
+                raise ValueError(f'{filename} is not a columnar file')
+
+            self.__file.seek(size - _TRAILER.size)
+            footer_length, magic = _TRAILER.unpack(self.__file.read(_TRAILER.size))
+
+            if magic != MAGIC or footer_length > size - len(MAGIC) - _TRAILER.size:
+                raise ValueError(f'{filename} is not a columnar file')
+
+            self.__file.seek(size - _TRAILER.size - footer_length)
+            footer = json.loads(self.__file.read(footer_length))
+        except Exception:
+            self.__file.close()
+            raise
+
+        self.__types = {column['name']: column['type'] for column in footer['columns']}
+        self.__compressed = footer['codec'] == 'zlib'
+        self.__row_groups = footer['row_groups']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def columns(self):
+        return list(self.__types)
+
+    @property
+    def rows(self):
+        return sum(group['rows'] for group in self.__row_groups)
+
+    @property
+    def row_groups(self):
+        return len(self.__row_groups)
+
+    def read(self, columns=None, row_groups=None):
+        # {column name: values} of the given columns (all by default) in the given row groups (all by default)
+        names = self.columns if columns is None else list(columns)
+
+        for name in names:
+            if name not in self.__types:
+                raise ValueError(f'No column {name}')
+
+        groups = self.__row_groups if row_groups is None else [self.__row_groups[i] for i in row_groups]
+        result = {}
+
+        for name in names:
+            code = self.__types[name]
+            data = b''.join(self.__read_chunk(*group['chunks'][name]) for group in groups)
+
+            if _is_bytes(code):
+                item_size = _item_size(code)
+                result[name] = [data[i:i + item_size] for i in range(0, len(data), item_size)]
+            else:
+                values = array(code)
+                values.frombytes(data)
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                result[name] = values
+
+        return result
+
+    def close(self):
+        self.__file.close()
+
+    def __read_chunk(self, offset, size):
+        self.__file.seek(offset)
+        data = self.__file.read(size)
+
+        return zlib.decompress(data) if self.__compressed else data
@@ -0,0 +1,153 @@
+import gzip
+import lzma
+import os
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, .zst files need it
+    zstandard = None
+
+MAX_PENDING = 64
+
+# extension: (magic number at the start of file, default level),
+# default levels are the fast ones, so the thread keeps up with live capture
+CODECS = {
+    '.gz': (b'\x1f\x8b', 1),
+    '.xz': (b'\xfd7zXZ\x00', 0),
+    '.zst': (b'\x28\xb5\x2f\xfd', 3),
+}
+
+
+def codec_of(filename):
+    # extension of the compression chosen for the file name, None for plain files
+    ext = os.path.splitext(filename)[1].lower()
+
+    return ext if ext in CODECS else None
+
+
+def supported(codec):
+    return codec in CODECS and (codec != '.zst' or zstandard is not None)
+
+
+def _compressor(fileobj, codec, level):
+    if codec == '.gz':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level)
+    if codec == '.xz':
+        return lzma.LZMAFile(fileobj, 'wb', preset=level)
+
+    return zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False)
+
+
+def split_extension(filename):
+    # like os.path.splitext, but compression extension stays with the one before it: a.pcap.gz -> a, .pcap.gz
+    root, ext = os.path.splitext(filename)
+
+    if ext.lower() in CODECS:
+        root, inner = os.path.splitext(root)
+        ext = inner + ext
+
+    return root, ext
+
+
+def open_decompressed(fileobj):
+    # stream of decompressed data of the file or None when it is not compressed
+    start = fileobj.read(max(len(magic) for magic, level in CODECS.values()))
+    fileobj.seek(0)
+
+    if start.startswith(CODECS['.gz'][0]):
+        return gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if start.startswith(CODECS['.xz'][0]):
+        return lzma.LZMAFile(fileobj, 'rb')
+    if start.startswith(CODECS['.zst'][0]):
+        if zstandard is None:
+            raise ValueError('zstandard package is needed to read .zst files')
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+
+    return None
+
+
+class CompressedFile:
+    # Write only file which compresses data in the background thread: write just queues the chunk,
+    # so its cost on the capture loop does not depend on the compression.
+    # When max_pending chunks wait for the thread, write blocks until it catches up.
+    # fileno waits for the queued chunks to be written, so the file may be synced after it.
+    # Errors of the thread are raised by the following write or close.
+
+    def __init__(self, filename, codec=None, level=None, max_pending=MAX_PENDING):
+        codec = codec_of(filename) if codec is None else codec
+
+        if codec not in CODECS:
+            raise ValueError(f'Unknown compression of {filename}')
+        if not supported(codec):
+            raise ValueError(f'zstandard package is needed to write {codec} files')
+
+        self.__file = open(filename, 'wb')
+
+        try:
+            self.__stream = _compressor(self.__file, codec, CODECS[codec][1] if level is None else level)
+        except Exception:
+            self.__file.close()
+            raise
+
+        self.__queue = queue.Queue(max_pending)
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__work, name='pcap-compression', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def closed(self):
+        return self.__thread is None
+
+    def write(self, data):
+        self.__check()
+        self.__queue.put(bytes(data))
+
+        return len(data)
+
+    def fileno(self):
+        self.__queue.join()
+        self.__file.flush()
+
+        return self.__file.fileno()
+
+    def close(self):
+        if self.__thread is None:
+            return
+
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__thread = None
+
+        try:
+            self.__stream.close()
+        finally:
+            self.__file.close()
+
+        self.__check()
+
+    def __check(self):
+        if self.__error is not None:
+            error, self.__error = self.__error, None
+            raise error
+
+    def __work(self):
+        while True:
+            chunk = self.__queue.get()
+
+            try:
+                if chunk is None:
+                    return
+                if self.__error is None:
+                    self.__stream.write(chunk)
+            except Exception as e:
+                self.__error = e
+            finally:
+                self.__queue.task_done()
@@ -0,0 +1,403 @@
+import argparse
+import datetime
+import hashlib
+import ipaddress
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from network import filters
+from network.classifier import FrameClassifier
+from saver.pcap import PcapReader, PcapSaver, write_all
+from saver.saver import Saver
+
+MAGIC = b'SNIFIDX1'
+BLOCK_SIZE = 1 << 20
+EXTENSION = '.idx'
+
+# Sidecar index is the magic followed by one record per block of consecutive pcap records:
+# block header, then sorted 64 bit hashes of hosts and flows seen in the block.
+# It is only appended to, so it may be read while the capture is still running,
+# posting lists of hosts and flows are built from it when it is loaded.
+_BLOCK = struct.Struct('< Q Q q q I I')  # offset, end, first timestamp, last timestamp, records, keys
+_PORT = struct.Struct('! H')
+_KEY_SIZE = 8
+
+_PROTOCOLS = {'tcp': 6, 'udp': 17}
+
+Block = namedtuple('Block', ['offset', 'end', 'first', 'last', 'count'])
+
+
+def index_name(filename):
+    return filename + EXTENSION
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=_KEY_SIZE).digest(), 'little')
+
+
+def host_key(address):
+    # address is packed, 4 bytes for ipv4 and 16 for ipv6
+    return _hash(b'h' + address)
+
+
+def flow_key(protocol, src, src_port, dst, dst_port):
+    # both directions of the flow have the same key
+    a, b = sorted(((src, src_port), (dst, dst_port)))
+
+    return _hash(b'f' + bytes([protocol]) + a[0] + _PORT.pack(a[1]) + b[0] + _PORT.pack(b[1]))
+
+
+class IndexWriter:
+    # Collects hosts and flows of records added in file order and appends block record to the index
+    # every block_size bytes of pcap file. Offsets are positions of the records in pcap file,
+    # end is the position right after the record.
+
+    def __init__(self, filename, block_size=BLOCK_SIZE):
+        self.__block_size = block_size
+        self.__classifier = FrameClassifier()
+        self.__hosts = set()
+        self.__flows = set()
+        self.__offset = None
+        self.__end = 0
+        self.__first = 0
+        self.__last = 0
+        self.__count = 0
+        self.__blocks = 0
+
+        self.__file = open(filename, 'wb', buffering=0)
+        write_all(self.__file, MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def blocks(self):
+        return self.__blocks
+
+    def add(self, offset, end, timestamp, package):
+        if self.__offset is None:
+            self.__offset = offset
+            self.__first = self.__last = timestamp
+        elif timestamp < self.__first:
+            self.__first = timestamp
+        elif timestamp > self.__last:
+            self.__last = timestamp
+
+        self.__end = end
+        self.__count += 1
+
+        frame_class = self.__classifier.classify(package)
+
+        if frame_class is not None and frame_class.src is not None:
+            self.__hosts.add(frame_class.src)
+            self.__hosts.add(frame_class.dst)
+
+            if frame_class.src_port is not None:
+                self.__flows.add((frame_class.protocol, frame_class.src, frame_class.src_port,
+                                  frame_class.dst, frame_class.dst_port))
+
+        if end - self.__offset >= self.__block_size:
+            self.flush()
+
+    def flush(self):
+        # writes the current block, even when it is not full
+        if self.__offset is None:
+            return
+
+        keys = array('Q', sorted({host_key(host) for host in self.__hosts} |
+                                 {flow_key(*flow) for flow in self.__flows}))
+
+        if sys.byteorder == 'big':
+            keys.byteswap()
+
+        write_all(self.__file, _BLOCK.pack(self.__offset, self.__end, self.__first, self.__last, self.__count,
+                                           len(keys)) + keys.tobytes())
+
+        self.__hosts.clear()
+        self.__flows.clear()
+        self.__offset = None
+        self.__count = 0
+        self.__blocks += 1
+
+    def close(self):
+        if self.__file is None:
+            return
+
+        self.flush()
+        self.__file.close()
+        self.__file = None
+
+
+class IndexedPcapSaver(Saver):
+    # PcapSaver which writes the index of the file along with it.
+    # Records still buffered by the saver are found by queries once they are flushed.
+    # While no frames arrive the unfinished block is written as well, so queries find the latest records.
+
+    def __init__(self, pcap: PcapSaver, index: IndexWriter):
+        self.__pcap = pcap
+        self.__index = index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def count(self):
+        return self.__pcap.count
+
+    def save(self, package, timestamp=None, orig_len=None):
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        offset = self.__pcap.size
+        self.__pcap.save(package, timestamp, orig_len)
+        self.__index.add(offset, self.__pcap.size, timestamp, package)
+
+    def flush_if_due(self):
+        self.__pcap.flush_if_due()
+        self.__index.flush()
+
+    def close(self):
+        try:
+            self.__pcap.close()
+        finally:
+            self.__index.close()
+
+
+class PcapIndex:
+    # Loads the index of pcap file and finds blocks which may contain records of given time range, host or flow.
+    # Keys are hashes, so found blocks may have no matching records, but blocks with them are never missed.
+
+    def __init__(self, filename):
+        self.__blocks = []
+        self.__postings = {}
+
+        with open(filename, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{filename} is not a pcap index')
+
+            while True:
+                header = file.read(_BLOCK.size)
+
+                if len(header) < _BLOCK.size:
+                    break
+
+                offset, end, first, last, count, size = _BLOCK.unpack(header)
+                data = file.read(size * _KEY_SIZE)
+
+                if len(data) < size * _KEY_SIZE:
+                    break  # block is being written right now
+
+                keys = array('Q')
+                keys.frombytes(data)
+
+                if sys.byteorder == 'big':
+                    keys.byteswap()
+
+                number = len(self.__blocks)
+                self.__blocks.append(Block(offset, end, first, last, count))
+
+                for key in keys:
+                    postings = self.__postings.get(key)
+
+                    if postings is None:
+                        self.__postings[key] = array('I', (number,))
+                    else:
+                        postings.append(number)
+
+    @property
+    def blocks(self):
+        return self.__blocks
+
+    def find(self, start=None, end=None, host=None, flow=None):
+        # blocks in file order, start and end are timestamps in nanoseconds, both inclusive,
+        # host is packed address, flow is (protocol, src, src_port, dst, dst_port)
+        numbers = range(len(self.__blocks))
+
+        if host is not None:
+            numbers = self.__postings.get(host_key(host), ())
+        if flow is not None:
+            flow_numbers = self.__postings.get(flow_key(*flow), ())
+            numbers = flow_numbers if host is None else sorted(set(numbers) & set(flow_numbers))
+
+        return [self.__blocks[number] for number in numbers
+                if (start is None or self.__blocks[number].last >= start) and
+                (end is None or self.__blocks[number].first <= end)]
+
+
+def build(filename, index_filename=None, block_size=BLOCK_SIZE):
+    # indexes existing plain pcap file, returns number of blocks
+    with PcapReader(filename) as reader:
+        if not reader.seekable:
+            raise ValueError(f'{filename} is compressed, only plain pcap files can be indexed')
+
+        with IndexWriter(index_filename or index_name(filename), block_size) as index:
+            while True:
+                offset = reader.offset
+
+                try:
+                    package = reader.recv_next()
+                except EOFError:
+                    break
+
+                index.add(offset, reader.offset, reader.timestamp, package)
+
+    return index.blocks
+
+
+def matcher(start=None, end=None, host=None, flow=None, filter_=''):
+    # predicate of timestamp and record which checks the same conditions exactly
+    classifier = FrameClassifier()
+    predicate = filters.compile_predicate(filter_) if filter_ else None
+
+    if flow is not None:
+        protocol, src, src_port, dst, dst_port = flow
+        endpoints = ((src, src_port, dst, dst_port), (dst, dst_port, src, src_port))
+
+    def match(timestamp, package):
+        if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+            return False
+
+        if host is not None or flow is not None:
+            frame_class = classifier.classify(package)
+
+            if frame_class is None:
+                return False
+            if host is not None and host != frame_class.src and host != frame_class.dst:
+                return False
+            if flow is not None and (frame_class.protocol != protocol or
+                                     (frame_class.src, frame_class.src_port,
+                                      frame_class.dst, frame_class.dst_port) not in endpoints):
+                return False
+
+        return predicate is None or predicate(package)
+
+    return match
+
+
+def extract(filename, out, blocks, match):
+    # copies matching records of the blocks into new pcap file, returns their number
+    count = 0
+
+    with PcapReader(filename) as reader:
+        with PcapSaver(out, nanoseconds=reader.nanoseconds, snaplen=reader.snaplen) as s:
+            for block in blocks:
+                reader.seek(block.offset)
+
+                while reader.offset < block.end:
+                    try:
+                        package = reader.recv_next()
+                    except EOFError:
+                        break  # block of the file which is still written
+
+                    if match(reader.timestamp, package):
+                        s.save(package, reader.timestamp, reader.orig_len)
+                        count += 1
+
+    return count
+
+
+def _timestamp(value):
+    # seconds since epoch or ISO 8601 date and time, local time when zone is not given
+    try:
+        return int(float(value) * 1e9)
+    except ValueError:
+        pass
+
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp() * 1e9)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value} is neither number of seconds nor ISO 8601 time')
+
+
+def _address(value):
+    try:
+        return ipaddress.ip_address(value).packed
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _port(value):
+    port = int(value)
+
+    if not 0 <= port <= 65535:
+        raise ValueError(f'Port of flow is between 0 and 65535, not {value}')
+
+    return port
+
+
+def _flow(values):
+    # raises ValueError for any bad part, like ipaddress and int do
+    protocol, src, src_port, dst, dst_port = values
+
+    if protocol not in _PROTOCOLS:
+        raise ValueError(f'Protocol of flow is tcp or udp, not {protocol}')
+
+    return (_PROTOCOLS[protocol], ipaddress.ip_address(src).packed, _port(src_port),
+            ipaddress.ip_address(dst).packed, _port(dst_port))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Builds sidecar indexes of pcap files and extracts records '
+                                                 'of time range, host or flow into new pcap file '
+                                                 'reading only the blocks which may contain them')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='index existing pcap files')
+    build_parser.add_argument('files', help='plain pcap files, index of each is written next to it', nargs='+')
+    build_parser.add_argument('--block-size', help='number of pcap bytes in each indexed block',
+                              default=BLOCK_SIZE, type=int)
+
+    query_parser = commands.add_parser('query', help='extract matching records, index is built when it is missing')
+    query_parser.add_argument('file', help='indexed pcap file')
+    query_parser.add_argument('-o', '--out', help='file to save matching records', required=True)
+    query_parser.add_argument('--start', help='first timestamp, seconds since epoch or ISO 8601 time',
+                              type=_timestamp)
+    query_parser.add_argument('--end', help='last timestamp, seconds since epoch or ISO 8601 time', type=_timestamp)
+    query_parser.add_argument('--host', help='ip address which is source or destination', type=_address)
+    query_parser.add_argument('--flow', help='flow in any direction, e.g. tcp 10.0.0.1 51000 10.0.0.2 443',
+                              nargs=5, metavar=('PROTOCOL', 'ADDRESS', 'PORT', 'ADDRESS', 'PORT'))
+    query_parser.add_argument('-f', '--filter', help='filter expression matching records must also pass',
+                              type=filters.expression_argument, default='')
+
+    args = parser.parse_args()
+
+    if args.command == 'query' and args.flow is not None:
+        try:
+            args.flow = _flow(args.flow)
+        except ValueError as e:
+            parser.error(str(e))
+
+    return args
+
+
+def main():
+    args = _parse_args()
+
+    if args.command == 'build':
+        for filename in args.files:
+            print(f'{index_name(filename)}: {build(filename, block_size=args.block_size)} blocks')
+        return
+
+    if not os.path.exists(index_name(args.file)):
+        build(args.file)
+
+    index = PcapIndex(index_name(args.file))
+    blocks = index.find(args.start, args.end, args.host, args.flow)
+    count = extract(args.file, args.out, blocks, matcher(args.start, args.end, args.host, args.flow, args.filter))
+
+    print(f'Read blocks: {len(blocks)} of {len(index.blocks)}')
+    print(f'Extracted frames: {count}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import os
+import shlex
+import subprocess
+from dataclasses import dataclass
+from typing import Optional
+
+from saver import compress
+from saver.columnar import ColumnarSaver, ROW_GROUP_SIZE
+from saver.index import IndexedPcapSaver, IndexWriter, index_name, build as build_index
+from saver.pcap import PcapSaver, FLUSH_SIZE, FLUSH_INTERVAL, merge
+from saver.rotating import RotatingPcapSaver, make_template
+from saver.saver import Saver
+
+PCAP = 'pcap'
+COLUMNAR = 'columnar'
+FORMATS = [PCAP, COLUMNAR]
+
+
+@dataclass(frozen=True)
+class OutputOptions:
+    # Where and how captured frames are saved, frames are not saved when filename is empty.
+    # Pcap file is compressed when its name ends with .gz, .xz or .zst, rotated when any of rotate_* is set
+    # and indexed (see saver.index) when index is set. post_rotate is command run with name of each finished file.
+    filename: str = ''
+    format: str = PCAP
+    nanoseconds: bool = False
+    flush_size: int = FLUSH_SIZE
+    flush_interval: float = FLUSH_INTERVAL
+    compress_level: Optional[int] = None
+    rotate_size: int = 0
+    rotate_interval: float = 0
+    rotate_count: int = 0
+    keep: int = 0
+    post_rotate: str = ''
+    row_group_size: int = ROW_GROUP_SIZE
+    index: bool = False
+
+    @property
+    def rotating(self):
+        return bool(self.filename) and self.__rotation_set()
+
+    def validate(self):
+        codec = compress.codec_of(self.filename)
+
+        if self.format not in FORMATS:
+            raise ValueError(f'Unknown output format: {self.format}')
+        if codec is not None and not compress.supported(codec):
+            raise ValueError(f'zstandard package is needed to write {codec} files')
+        if self.index and (not self.filename or codec is not None or self.format == COLUMNAR):
+            raise ValueError('only plain pcap output can be indexed')
+        if self.index and self.__rotation_set():
+            raise ValueError('rotated files are not indexed while capturing, '
+                             'use --post-rotate "python -m saver.index build" instead')
+        if self.format == COLUMNAR and self.__rotation_set():
+            raise ValueError('columnar output can not be rotated')
+
+    def __rotation_set(self):
+        return bool(self.rotate_size or self.rotate_interval or self.rotate_count)
+
+
+def create_saver(options: OutputOptions, filename=None, snaplen=0, sharded=False) -> Saver:
+    # filename replaces the one of options for shards of several workers (see shard_names),
+    # sharded files are not indexed, merge_shards indexes the merged one
+    filename = options.filename if filename is None else filename
+
+    if options.format == COLUMNAR:
+        return ColumnarSaver(filename, row_group_size=options.row_group_size)
+
+    if options.rotating:
+        return RotatingPcapSaver(make_template(filename), max_size=options.rotate_size,
+                                 interval=options.rotate_interval, max_packets=options.rotate_count,
+                                 keep=options.keep, on_close=_post_rotate_hook(options.post_rotate),
+                                 nanoseconds=options.nanoseconds, flush_size=options.flush_size,
+                                 flush_interval=options.flush_interval, snaplen=snaplen,
+                                 compress_level=options.compress_level)
+
+    saver = PcapSaver(filename, nanoseconds=options.nanoseconds, flush_size=options.flush_size,
+                      flush_interval=options.flush_interval, snaplen=snaplen, compress_level=options.compress_level)
+
+    if options.index and not sharded:
+        return IndexedPcapSaver(saver, IndexWriter(index_name(filename)))
+
+    return saver
+
+
+def shard_names(options: OutputOptions, count):
+    # files of count workers: rotated and columnar ones are kept per worker, plain pcap ones are merged
+    if not options.filename:
+        return [''] * count
+
+    if options.rotating:
+        root, ext = compress.split_extension(make_template(options.filename))
+    else:
+        root, ext = compress.split_extension(options.filename)
+
+    if options.rotating or options.format == COLUMNAR:
+        return [f'{root}-w{i}{ext}' for i in range(count)]
+
+    # compression extension stays last, so shards are compressed like the merged file
+    return [f'{root}.{i}{ext}' for i in range(count)]
+
+
+def merge_shards(options: OutputOptions, shards):
+    # merges pcap shards into the file of options, removes them and indexes the result,
+    # shards which were not created, e.g. by failed workers, are skipped
+    shards = [shard for shard in shards if os.path.exists(shard)]
+
+    if not options.filename or options.rotating or options.format != PCAP or not shards:
+        return
+
+    merge(shards, options.filename, nanoseconds=options.nanoseconds)
+
+    for shard in shards:
+        os.remove(shard)
+
+    if options.index:
+        build_index(options.filename)
+
+
+def _post_rotate_hook(post_rotate):
+    if post_rotate == '':
+        return None
+
+    command = shlex.split(post_rotate)
+
+    return lambda filename: subprocess.run(command + [filename])
@@ -1,12 +1,17 @@
+import contextlib
+import heapq
+import mmap
 import time
 import struct
 
+from saver import compress
 from saver.saver import Saver
 
 GLOBAL_HEADER_FMT = '@ I H H i I I I '
 LOCAL_HEADER_FMT = '@ I I I I'
 
 MAGICAL_NUMBER = 2712847316
+NANO_MAGICAL_NUMBER = 2712812621
 MJ_VERN_NUMBER = 2
 MI_VERN_NUMBER = 4
 LOCAL_CORECTIN = 0
@@ -14,16 +19,54 @@ ACCUR_TIMSTAMP = 0
 MAX_LENGTH_CAP = 65535
 DATA_LINK_TYPE = 1
 
+FLUSH_SIZE = 1 << 20
+FLUSH_INTERVAL = 1.0
+
+_LOCAL_HEADER = struct.Struct(LOCAL_HEADER_FMT)
+_GLOBAL_HEADER_SIZE = struct.calcsize(GLOBAL_HEADER_FMT)
+_BATCH_SIZE = 64
+
+
+def write_all(file, data):
+    # unbuffered files may write only part of data, e.g. when interrupted by signal, to a pipe or almost full disk
+    with memoryview(data) as view:
+        written = file.write(view)
+
+        while written < len(view):
+            with view[written:] as rest:
+                written += file.write(rest)
+
+    return written
+
 
 class PcapSaver(Saver):
-    def __init__(self, filename):
+    # snaplen is written to the global header and records longer than it are cut,
+    # orig_len given to save is the length of the frame on the wire when package was cut before.
+    # Files named *.gz, *.xz or *.zst are compressed by the background thread (see compress.CompressedFile),
+    # it gets the buffered records on each flush.
+
+    def __init__(self, filename, nanoseconds=False, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 snaplen=0, compress_level=None):
+        self.__nanoseconds = nanoseconds
+        self.__snaplen = snaplen if 0 < snaplen < MAX_LENGTH_CAP else MAX_LENGTH_CAP
+        self.__flush_size = flush_size
+        self.__flush_interval = flush_interval
+        self.__buffer = bytearray()
+        self.__last_flush = time.monotonic()
+        self.__size = 0
+        self.__count = 0
+
         if filename == '' or filename is None:
             self.__file = None
+        elif compress.codec_of(filename) is not None:
+            self.__file = compress.CompressedFile(filename, level=compress_level)
         else:
-            self.__file = open(filename, 'wb')
-            self.__file.write(
-                struct.pack(GLOBAL_HEADER_FMT, MAGICAL_NUMBER, MJ_VERN_NUMBER, MI_VERN_NUMBER,
-                            LOCAL_CORECTIN, ACCUR_TIMSTAMP, MAX_LENGTH_CAP, DATA_LINK_TYPE))
+            self.__file = open(filename, 'wb', buffering=0)
+
+        if self.__file is not None:
+            self.__size = write_all(self.__file, struct.pack(
+                GLOBAL_HEADER_FMT, NANO_MAGICAL_NUMBER if nanoseconds else MAGICAL_NUMBER, MJ_VERN_NUMBER,
+                MI_VERN_NUMBER, LOCAL_CORECTIN, ACCUR_TIMSTAMP, self.__snaplen, DATA_LINK_TYPE))
 
     def __enter__(self):
         return self
@@ -35,17 +78,260 @@ class PcapSaver(Saver):
     def fileobj(self):
         return self.__file
 
+    @property
+    def nanoseconds(self):
+        return self.__nanoseconds
+
+    @property
+    def snaplen(self):
+        return self.__snaplen
+
+    @property
+    def size(self):
+        # bytes saved so far, including ones still buffered
+        return self.__size
+
+    @property
+    def count(self):
+        return self.__count
+
     def close(self):
         if self.__file is not None:
-            self.fileobj.flush()
+            self.flush()
             self.__file.close()
 
-    def save(self, package):
+    def flush(self):
+        if self.__buffer:
+            write_all(self.__file, self.__buffer)
+            self.__buffer.clear()
+
+        self.__last_flush = time.monotonic()
+
+    def flush_if_due(self):
+        if self.__buffer and time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+    def save(self, package, timestamp=None, orig_len=None):
         if self.__file is None:
             return
 
-        ts_sec, ts_usec = map(int, str(time.time()).split('.'))
-        size = len(package)
+        if timestamp is None:
+            timestamp = time.time_ns()
+
+        ts_sec, ts_nsec = divmod(timestamp, 1000000000)
+        length = len(package)
+        size = min(length, self.__snaplen)
+        orig_len = length if orig_len is None else max(orig_len, length)
+
+        self.__buffer += _LOCAL_HEADER.pack(ts_sec, ts_nsec if self.__nanoseconds else ts_nsec // 1000,
+                                            size, orig_len)
+        self.__buffer += package if size == length else package[:size]
+        self.__size += _LOCAL_HEADER.size + size
+        self.__count += 1
+
+        if len(self.__buffer) >= self.__flush_size or time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+
+class PcapReader:
+    # Reads pcap files of both byte orders with microsecond or nanosecond timestamps.
+    # Plain file is memory mapped and records are returned as memoryviews into it,
+    # so they stay valid only while the reader is open.
+    # Compressed file (gzip, xz or zstd, recognized by its content) is decompressed while it is read
+    # and records are returned as bytes.
+    # Besides iteration it has the same recv_next/recv_batch interface as raw frame generators,
+    # they raise EOFError when there are no records left.
+    # offset is the position of the next record, plain files may be seeked to offsets of records.
+
+    def __init__(self, filename):
+        self.__file = open(filename, 'rb')
+        self.__map = None
+        self.__view = None
+
+        try:
+            self.__stream = compress.open_decompressed(self.__file)
+        except Exception:
+            self.__file.close()
+            raise
+
+        if self.__stream is not None:
+            header = self.__stream.read(_GLOBAL_HEADER_SIZE)
+        elif self.__file.seek(0, 2) >= _GLOBAL_HEADER_SIZE:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__map)
+            header = self.__map
+        else:
+            header = b''
+
+        if len(header) < _GLOBAL_HEADER_SIZE:
+            self.close()
+            raise ValueError(f'{filename} is not a pcap file')
+
+        for order in '<>':
+            magic, = struct.unpack_from(order + 'I', header)
+
+            if magic in (MAGICAL_NUMBER, NANO_MAGICAL_NUMBER):
+                break
+        else:
+            self.close()
+            raise ValueError(f'{filename} is not a pcap file')
+
+        self.__local_header = struct.Struct(order + LOCAL_HEADER_FMT[1:])
+        self.__nanoseconds = magic == NANO_MAGICAL_NUMBER
+        self.__snaplen, self.__link_type = struct.unpack_from(order + 'I I', header, 16)
+        self.__offset = _GLOBAL_HEADER_SIZE
+        self.__timestamp = None
+        self.__timestamps = []
+        self.__orig_len = None
+        self.__orig_lens = []
+        self.__count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        # yields (timestamp in nanoseconds, record data, original length of the frame)
+        while True:
+            try:
+                package = self.recv_next()
+            except EOFError:
+                return
+
+            yield self.__timestamp, package, self.__orig_len
+
+    @property
+    def nanoseconds(self):
+        return self.__nanoseconds
+
+    @property
+    def snaplen(self):
+        return self.__snaplen
+
+    @property
+    def link_type(self):
+        return self.__link_type
+
+    @property
+    def timestamp(self):
+        return self.__timestamp
+
+    @property
+    def timestamps(self):
+        return self.__timestamps
+
+    @property
+    def orig_len(self):
+        return self.__orig_len
+
+    @property
+    def orig_lens(self):
+        return self.__orig_lens
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def offset(self):
+        return self.__offset
+
+    @property
+    def seekable(self):
+        return self.__stream is None
+
+    def seek(self, offset):
+        if not self.seekable:
+            raise ValueError('compressed pcap files can not be seeked')
+
+        self.__offset = max(offset, _GLOBAL_HEADER_SIZE)
+
+    def recv_next(self):
+        if self.__stream is not None:
+            return self.__recv_stream()
+
+        offset = self.__offset
+        header = self.__local_header
+
+        if offset + header.size > len(self.__map):
+            raise EOFError
+
+        ts_sec, ts_frac, incl_len, orig_len = header.unpack_from(self.__map, offset)
+        offset += header.size
+
+        if offset + incl_len > len(self.__map):
+            raise EOFError
+
+        self.__offset = offset + incl_len
+        self.__set_record(ts_sec, ts_frac, orig_len)
+
+        return self.__view[offset:offset + incl_len]
+
+    def __recv_stream(self):
+        header = self.__local_header
+        data = self.__stream.read(header.size)
+
+        if len(data) < header.size:
+            raise EOFError
+
+        ts_sec, ts_frac, incl_len, orig_len = header.unpack(data)
+        package = self.__stream.read(incl_len)
+
+        if len(package) < incl_len:
+            raise EOFError
+
+        self.__offset += header.size + incl_len
+        self.__set_record(ts_sec, ts_frac, orig_len)
+
+        return package
+
+    def __set_record(self, ts_sec, ts_frac, orig_len):
+        self.__timestamp = ts_sec * 1000000000 + (ts_frac if self.__nanoseconds else ts_frac * 1000)
+        self.__orig_len = orig_len
+        self.__count += 1
+
+    def recv_batch(self, n=_BATCH_SIZE):
+        batch = []
+        timestamps = []
+        orig_lens = []
+
+        try:
+            for _ in range(n):
+                batch.append(self.recv_next())
+                timestamps.append(self.__timestamp)
+                orig_lens.append(self.__orig_len)
+        except EOFError:
+            if not batch:
+                raise
+
+        self.__timestamps = timestamps
+        self.__orig_lens = orig_lens
+
+        return batch
+
+    def close(self):
+        if self.__stream is not None:
+            self.__stream.close()
+
+        if self.__map is not None:
+            self.__view.release()
+
+            try:
+                self.__map.close()
+            except BufferError:
+                pass  # records are still referenced, mapping is released along with them
+
+        self.__file.close()
+
+
+def merge(filenames, filename, nanoseconds=False):
+    # merges pcap files written by this saver into one ordered by timestamp
+    with contextlib.ExitStack() as stack:
+        readers = [stack.enter_context(PcapReader(name)) for name in filenames]
+        snaplen = max((reader.snaplen for reader in readers), default=0)
+        s = stack.enter_context(PcapSaver(filename, nanoseconds=nanoseconds, snaplen=snaplen))
 
-        self.__file.write(struct.pack(LOCAL_HEADER_FMT, ts_sec, ts_usec, size, size))
-        self.__file.write(package)
+        for timestamp, package, orig_len in heapq.merge(*readers, key=lambda record: record[0]):
+            s.save(package, timestamp, orig_len)
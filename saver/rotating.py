@@ -0,0 +1,203 @@
+import collections
+import os
+import queue
+import threading
+import time
+import traceback
+
+from saver import compress
+from saver.pcap import PcapSaver, FLUSH_SIZE, FLUSH_INTERVAL
+from saver.saver import Saver
+
+
+def make_template(filename):
+    # capture.pcap -> capture-{index:04}.pcap, templates given explicitly are kept as is
+    if '{' in filename:
+        return filename
+
+    root, ext = compress.split_extension(filename)
+
+    return f'{root}-{{index:04}}{ext}'
+
+
+def _hidden(filename):
+    # name of the file prepared in advance, extension is kept so compression is chosen by it
+    directory, name = os.path.split(filename)
+
+    return os.path.join(directory, '.' + name)
+
+
+class RotatingPcapSaver(Saver):
+    # Writes pcap files one after another, starting the next one when current exceeds
+    # max_size bytes, max_packets packets or gets older than interval seconds.
+    # Template is formatted with index of the file and time it was started, e.g. 'cap-{index}-{time}.pcap'.
+    # When keep is set only the last keep files, including the current one, are left on disk.
+    # Opening, fsync, closing, removing and on_close hook are done by the background thread.
+    # Next file is opened in advance under hidden name and renamed when it is started.
+    # When the thread fails to open it, the file is opened on rotation, which raises the error if it persists.
+
+    def __init__(self, template, max_size=0, interval=0, max_packets=0, keep=0, on_close=None,
+                 nanoseconds=False, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, snaplen=0,
+                 compress_level=None):
+        self.__template = template
+        self.__max_size = max_size
+        self.__interval = interval
+        self.__max_packets = max_packets
+        self.__keep = keep
+        self.__on_close = on_close
+        self.__nanoseconds = nanoseconds
+        self.__flush_size = flush_size
+        self.__flush_interval = flush_interval
+        self.__snaplen = snaplen
+        self.__compress_level = compress_level
+
+        self.__index = 0
+        self.__closed_files = collections.deque()
+        self.__tasks = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__prepared = threading.Condition(self.__lock)
+        self.__next = None
+        self.__failed = None  # index of the file the thread failed to open
+        self.__worker = threading.Thread(target=self.__work, name='pcap-rotation', daemon=True)
+        self.__worker.start()
+
+        self.__filename = self.__name(self.__next_index())
+        self.__current = self.__open(self.__filename)
+        self.__opened = time.monotonic()
+        self.__tasks.put(self.__prepare_next)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def filename(self):
+        return self.__filename
+
+    def save(self, package, timestamp=None, orig_len=None):
+        if self.__needs_rotation():
+            self.rotate()
+
+        self.__current.save(package, timestamp, orig_len)
+
+    def flush_if_due(self):
+        self.__current.flush_if_due()
+
+    def rotate(self):
+        # next file is opened in advance right after the previous rotation, so usually there is no wait here
+        with self.__prepared:
+            while self.__next is None and self.__failed is None:
+                self.__prepared.wait()
+
+            prepared, failed = self.__next, self.__failed
+            self.__next = self.__failed = None
+
+        try:
+            if prepared is None:
+                filename = self.__name(failed)
+                current = self.__open(filename)
+            else:
+                index, current, hidden = prepared
+                filename = self.__name(index)
+                os.rename(hidden, filename)
+        except Exception:
+            # current file goes on and the next rotation tries again
+            with self.__lock:
+                self.__next, self.__failed = prepared, failed
+            raise
+
+        finished = self.__current, self.__filename
+        self.__current, self.__filename = current, filename
+        self.__opened = time.monotonic()
+
+        self.__tasks.put(self.__prepare_next)
+        self.__tasks.put(lambda: self.__finish(*finished, self.__keep - 1))
+
+    def close(self):
+        if self.__worker is None:
+            return
+
+        self.__tasks.put(lambda: self.__finish(self.__current, self.__filename, self.__keep))
+        self.__tasks.put(None)
+        self.__worker.join()
+        self.__worker = None
+
+        with self.__lock:
+            if self.__next is not None:
+                index, saver, hidden = self.__next
+                saver.close()
+                os.remove(hidden)
+
+    def __needs_rotation(self):
+        current = self.__current
+
+        return self.__max_size and current.size >= self.__max_size or \
+            self.__max_packets and current.count >= self.__max_packets or \
+            self.__interval and time.monotonic() - self.__opened >= self.__interval
+
+    def __next_index(self):
+        with self.__lock:
+            index = self.__index
+            self.__index += 1
+
+        return index
+
+    def __name(self, index):
+        return self.__template.format(index=index, time=time.strftime('%Y%m%d-%H%M%S'))
+
+    def __open(self, filename):
+        return PcapSaver(filename, nanoseconds=self.__nanoseconds,
+                         flush_size=self.__flush_size, flush_interval=self.__flush_interval,
+                         snaplen=self.__snaplen, compress_level=self.__compress_level)
+
+    def __prepare_next(self):
+        index = self.__next_index()
+
+        try:
+            hidden = _hidden(self.__name(index))
+            prepared = index, self.__open(hidden), hidden
+        except Exception:
+            with self.__prepared:
+                self.__failed = index
+                self.__prepared.notify()
+            raise
+
+        with self.__prepared:
+            self.__next = prepared
+            self.__prepared.notify()
+
+    def __finish(self, saver, filename, kept):
+        # synced after closing, so trailer of compressed file is on disk too
+        saver.close()
+        _sync(filename)
+
+        if self.__on_close is not None:
+            self.__on_close(filename)
+
+        self.__closed_files.append(filename)
+
+        while self.__keep and len(self.__closed_files) > kept:
+            os.remove(self.__closed_files.popleft())
+
+    def __work(self):
+        while True:
+            task = self.__tasks.get()
+
+            if task is None:
+                return
+
+            try:
+                task()
+            except Exception:
+                traceback.print_exc()
+
+
+def _sync(filename):
+    fd = os.open(filename, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -3,5 +3,9 @@ from abc import abstractmethod
 
 class Saver:
     @abstractmethod
-    def save(self, package):
+    def save(self, package, timestamp=None, orig_len=None):
         raise NotImplementedError
+
+    def flush_if_due(self):
+        # writes buffered frames which wait longer than the saver allows, called while no frames arrive
+        pass
@@ -1,9 +1,106 @@
 import argparse
+import contextlib
 import errno
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
 import saver.pcap
+from network import bpf, filters
+from network.frames import Frame, LinkFrame, InternetFrame, TransportFrame
 from network.gen import FrameGenerator
-from network.parsers import EthernetFrameParser, Ipv6FrameParser, Ipv4FrameParser, TcpFrameParser, UdpFrameParser
-from network.raw import RawFrameGenerator
+from network.instrument import MeasuredParser, MeasuredReceiver, measured_filter
+from network.flows import FlowTable
+from network.reassembly import FragmentReassembler, StreamReassembler, FRAGMENT_MEMORY, STREAM_MEMORY, STREAMS_MEMORY
+from network.sampling import CountSampler, FlowSampler, AdaptiveSampler, drop_rate, queue_fill, MAX_RATIO, \
+    DROP_RATE_HIGH, DROP_RATE_LOW, QUEUE_HIGH, QUEUE_LOW
+from network.compact import CompactEthernetFrameParser
+from network.lazy import LazyEthernetFrameParser
+from network.stats import TrafficStatistics
+from network.render import ConsoleWriter, FrameRenderer
+from network.parsers import FrameParser, EthernetFrameParser, Ipv6FrameParser, Ipv4FrameParser, TcpFrameParser, \
+    UdpFrameParser
+from network.raw import RawFrameGenerator, RingFrameGenerator, FANOUT_HASH, FANOUT_LB, FANOUT_CPU
+from saver.output import OutputOptions, create_saver, shard_names, merge_shards, FORMATS, PCAP
+from saver.saver import Saver
+from tools.metrics import Metrics, MetricsExporter, SamplingProfiler, DUMP_INTERVAL
+from tools.pipeline import BoundedQueue, Stage, OVERFLOW_POLICIES, BLOCK
+
+_FANOUT_MODES = {'hash': FANOUT_HASH, 'lb': FANOUT_LB, 'cpu': FANOUT_CPU}
+
+# sampling profiler attributes time to the innermost method of these classes
+_PROFILED_CLASSES = (FrameParser, Frame, LinkFrame, InternetFrame, TransportFrame, FrameRenderer, ConsoleWriter,
+                     Saver, FlowTable, TrafficStatistics, FragmentReassembler, StreamReassembler, RawFrameGenerator,
+                     saver.pcap.PcapReader)
+
+
+@dataclass(frozen=True)
+class SnifferOptions:
+    # what is captured, how it is processed and shown, output says where frames are saved
+    interface: str = ''
+    filter: str = ''
+    read: str = ''
+    max_frames: int = -1
+    snaplen: int = 0
+    batch: int = 64
+    quiet: bool = False
+    payload: Optional[int] = None
+    headers_only: bool = False
+    compact: bool = False
+    flows: bool = False
+    flow_timeout: float = 60.0
+    max_flows: int = 1000000
+    defragment: bool = False
+    fragment_memory: int = FRAGMENT_MEMORY
+    streams: bool = False
+    stream_timeout: float = 120.0
+    stream_memory: int = STREAM_MEMORY
+    streams_memory: int = STREAMS_MEMORY
+    stats: bool = False
+    stats_interval: float = 10.0
+    top: int = 10
+    lazy: bool = False
+    compact_frames: bool = False
+    reuse_frames: bool = False
+    workers: int = 1
+    fanout: str = 'hash'
+    pipeline: bool = False
+    queue_size: int = 4096
+    overflow: str = BLOCK
+    ring: bool = False
+    block_size: int = 1 << 22
+    block_count: int = 64
+    instrument: bool = False
+    metrics: str = ''
+    metrics_interval: float = DUMP_INTERVAL
+    profile: bool = False
+    sample: int = 1
+    sample_flows: bool = False
+    adaptive_sampling: bool = False
+    max_sample: int = MAX_RATIO
+    output: OutputOptions = field(default_factory=OutputOptions)
+
+    @property
+    def instrumented(self):
+        return self.instrument or bool(self.metrics) or self.profile
+
+    @property
+    def sharded(self):
+        # capture is split between worker processes, each with its own output file
+        return self.workers > 1 and not self.read
+
+    def validate(self):
+        if self.sample < 1 or self.max_sample < 1:
+            raise ValueError('sampling ratio must be positive')
+        if self.adaptive_sampling and self.read:
+            raise ValueError('adaptive sampling needs live capture')
+        if self.snaplen and (self.defragment or self.streams):
+            raise ValueError('reassembly needs whole frames, --snaplen cannot be used with --defragment or --streams')
+
+        self.output.validate()
 
 
 def _parse_args():
@@ -14,73 +111,501 @@ def _parse_args():
                     'Please note: it is necessary to run it with superuser privileges. '
                     'To stop sniffer use keyboard interruption (Ctrl+C)')
 
-    parser.add_argument('-f', '--filter', help='filter for traffic', type=str,
-                        choices=['tcp', 'udp', 'ipv4', 'ipv6'], default='')
-    parser.add_argument('-o', '--out', help='file to save traffic in pcap format')
+    parser.add_argument('-f', '--filter', help='filter expression for traffic, '
+                                                'e.g. "tcp and dst port 443 and src net 10.0.0.0/8 and not syn"',
+                        type=filters.expression_argument, default='')
+    parser.add_argument('-o', '--out', help='file to save traffic in pcap format, '
+                                             'compressed when it ends with .gz, .xz or .zst')
+    parser.add_argument('--compress-level', help='compression level of compressed pcap files', type=int)
+    parser.add_argument('--format', help='format of output file: pcap or columnar header fields '
+                                         '(timestamps, lengths, addresses, ports, tcp flags)',
+                        choices=FORMATS, default=PCAP)
+    parser.add_argument('--row-group-size', help='number of frames in each row group of columnar file',
+                        default=OutputOptions.row_group_size, type=int)
+    parser.add_argument('--index', help='write sidecar index of pcap file next to it while capturing, '
+                                        'see python -m saver.index query', action='store_true')
+    parser.add_argument('-r', '--read', help='read frames from pcap file instead of capturing them', default='')
     parser.add_argument('-i', '--interface', help='name of interface to capture traffic', default='')
     parser.add_argument('-n', '--number', help='maximum number of caught frames', default=-1, type=int)
+    parser.add_argument('-s', '--snaplen', help='number of bytes captured from each frame, 0 means whole frame',
+                        default=0, type=int)
+    parser.add_argument('--nanoseconds', help='save pcap with nanosecond timestamps', action='store_true')
+    parser.add_argument('--flush-size', help='number of buffered bytes written to pcap at once',
+                        default=saver.pcap.FLUSH_SIZE, type=int)
+    parser.add_argument('--flush-interval', help='maximum number of seconds pcap records stay buffered',
+                        default=saver.pcap.FLUSH_INTERVAL, type=float)
+    parser.add_argument('--rotate-size', help='start new pcap file after this number of bytes', default=0, type=int)
+    parser.add_argument('--rotate-interval', help='start new pcap file after this number of seconds',
+                        default=0, type=float)
+    parser.add_argument('--rotate-count', help='start new pcap file after this number of frames', default=0, type=int)
+    parser.add_argument('--keep', help='number of last pcap files kept on disk while rotating, 0 keeps all',
+                        default=0, type=int)
+    parser.add_argument('--post-rotate', help='command run with name of each finished pcap file', default='')
+    parser.add_argument('-b', '--batch', help='number of frames received per call', default=64, type=int)
+    parser.add_argument('-q', '--quiet', help='do not print caught frames', action='store_true')
+    parser.add_argument('--payload', help='number of payload bytes in printed hex dumps, all by default', type=int)
+    parser.add_argument('--headers-only', help='print frames without payload', action='store_true')
+    parser.add_argument('--compact', help='print one line per frame', action='store_true')
+    parser.add_argument('--flows', help='print flow records instead of frames', action='store_true')
+    parser.add_argument('--flow-timeout', help='number of idle seconds after which flow is finished',
+                        default=60.0, type=float)
+    parser.add_argument('--max-flows', help='maximum number of tracked flows', default=1000000, type=int)
+    parser.add_argument('--defragment', help='rebuild fragmented ip datagrams before filtering and output',
+                        action='store_true')
+    parser.add_argument('--fragment-memory', help='maximum number of bytes of buffered fragments',
+                        default=FRAGMENT_MEMORY, type=int)
+    parser.add_argument('--streams', help='reassemble tcp streams and print stream records instead of frames',
+                        action='store_true')
+    parser.add_argument('--stream-timeout', help='number of idle seconds after which stream is finished',
+                        default=120.0, type=float)
+    parser.add_argument('--stream-memory', help='maximum number of out of order bytes buffered per stream',
+                        default=STREAM_MEMORY, type=int)
+    parser.add_argument('--streams-memory', help='maximum number of out of order bytes buffered by all streams',
+                        default=STREAMS_MEMORY, type=int)
+    parser.add_argument('--sample', help='keep 1 of every SAMPLE frames', default=1, type=int)
+    parser.add_argument('--sample-flows', help='keep all frames of 1 of every SAMPLE flows instead',
+                        action='store_true')
+    parser.add_argument('--adaptive-sampling', help='raise sampling ratio while kernel drops frames '
+                                                    'or pipeline queues fill up and lower it when load subsides',
+                        action='store_true')
+    parser.add_argument('--max-sample', help='maximum sampling ratio of adaptive sampling',
+                        default=MAX_RATIO, type=int)
+    parser.add_argument('--stats', help='print periodic traffic statistics instead of frames', action='store_true')
+    parser.add_argument('--stats-interval', help='number of seconds in statistics window', default=10.0, type=float)
+    parser.add_argument('--top', help='number of top addresses and ports in statistics', default=10, type=int)
+    parser.add_argument('--lazy', help='decode frame fields only when they are used', action='store_true')
+    parser.add_argument('--compact-frames', help='keep frames in compact objects sharing one buffer',
+                        action='store_true')
+    parser.add_argument('--reuse-frames', help='reuse compact frame objects and received buffers between batches',
+                        action='store_true')
+    parser.add_argument('-w', '--workers', help='number of capturing processes', default=1, type=int)
+    parser.add_argument('--fanout', help='how traffic is spread between workers', type=str,
+                        choices=list(_FANOUT_MODES), default='hash')
+    parser.add_argument('-p', '--pipeline', help='run capture, decoding and output in separate threads',
+                        action='store_true')
+    parser.add_argument('--queue-size', help='capacity of queues between pipeline stages', default=4096, type=int)
+    parser.add_argument('--overflow', help='what pipeline does when queue is full', type=str,
+                        choices=OVERFLOW_POLICIES, default=BLOCK)
+    parser.add_argument('--ring', help='capture through memory mapped TPACKET_V3 ring', action='store_true')
+    parser.add_argument('--block-size', help='size of ring block in bytes', default=1 << 22, type=int)
+    parser.add_argument('--block-count', help='number of ring blocks', default=64, type=int)
+    parser.add_argument('--instrument', help='measure time of capture stages and count packets, bytes, '
+                                             'parse failures, filtered frames and kernel drops; '
+                                             'metrics are written to stderr on SIGUSR1 and at exit; '
+                                             'with several workers each of them keeps and writes its own metrics, '
+                                             'SIGUSR1 sent to the sniffer is passed to all of them',
+                        action='store_true')
+    parser.add_argument('--metrics', help='file where metrics are written in Prometheus text format, '
+                                          'turns instrumentation on; with several workers each writes '
+                                          'its own file METRICS.N, where N is the number of the worker',
+                        default='')
+    parser.add_argument('--metrics-interval', help='number of seconds between writes of metrics file',
+                        default=DUMP_INTERVAL, type=float)
+    parser.add_argument('--profile', help='sample cpu time of the capture loop by parser and frame classes, '
+                                          'turns instrumentation on', action='store_true')
+
+    args = parser.parse_args()
+    options = SnifferOptions(
+        interface=args.interface, filter=args.filter, read=args.read, max_frames=args.number, snaplen=args.snaplen,
+        batch=args.batch, quiet=args.quiet, payload=args.payload, headers_only=args.headers_only,
+        compact=args.compact, flows=args.flows, flow_timeout=args.flow_timeout, max_flows=args.max_flows,
+        defragment=args.defragment, fragment_memory=args.fragment_memory, streams=args.streams,
+        stream_timeout=args.stream_timeout, stream_memory=args.stream_memory, streams_memory=args.streams_memory,
+        stats=args.stats, stats_interval=args.stats_interval, top=args.top, lazy=args.lazy,
+        compact_frames=args.compact_frames, reuse_frames=args.reuse_frames, workers=args.workers,
+        fanout=args.fanout, pipeline=args.pipeline, queue_size=args.queue_size, overflow=args.overflow,
+        ring=args.ring, block_size=args.block_size, block_count=args.block_count, instrument=args.instrument,
+        metrics=args.metrics, metrics_interval=args.metrics_interval, profile=args.profile, sample=args.sample,
+        sample_flows=args.sample_flows, adaptive_sampling=args.adaptive_sampling, max_sample=args.max_sample,
+        output=OutputOptions(
+            filename=args.out or '', format=args.format, nanoseconds=args.nanoseconds, flush_size=args.flush_size,
+            flush_interval=args.flush_interval, compress_level=args.compress_level,
+            rotate_size=args.rotate_size, rotate_interval=args.rotate_interval, rotate_count=args.rotate_count,
+            keep=args.keep, post_rotate=args.post_rotate, row_group_size=args.row_group_size, index=args.index))
 
-    return parser.parse_args()
+    try:
+        options.validate()
+    except ValueError as e:
+        parser.error(str(e))
+
+    return options
 
 
 class Sniffer:
-    def __init__(self, interface='', filter_='', out='', max_frames=-1):
-        self.__interface = interface
-        self.__filter = filter_
-        self.__out = out
-        self.__max_frames = max_frames
+    def __init__(self, options: SnifferOptions):
+        self.__options = options
 
     def run(self):
-        count = 0
+        counts = [0]
+        drops = [0]
 
         try:
-            with saver.pcap.PcapSaver(self.__out) as s:
-                tcp = TcpFrameParser()
-                udp = UdpFrameParser()
-                ipv4 = Ipv4FrameParser(tcp, udp)
-                ipv6 = Ipv6FrameParser(tcp, udp)
-                ethernet = EthernetFrameParser(ipv4, ipv6)
-
-                gen = FrameGenerator(RawFrameGenerator(interface=self.__interface), ethernet)
-
-                while self.__max_frames == -1 or count < self.__max_frames:
-                    frame = gen.get_next()
-
-                    if not self._frame_completes_to_filter(frame):
-                        continue
-
-                    s.save(frame.raw)
-                    print(f'Frame #{count}:')
-                    print(frame.get_description())
-                    print('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>')
+            if self.__options.sharded:
+                counts = multiprocessing.RawArray('q', self.__options.workers)
+                drops = multiprocessing.RawArray('q', self.__options.workers)
+                self._run_workers(counts, drops)
+            else:
+                self._capture(self.__options.output.filename, counts, drops, 0)
 
-                    count += 1
+            if self.__options.read:
+                print(f'Caught frames: {sum(counts)}')
 
+        except FileNotFoundError as e:
+            print(f'No such file: {e.filename}')
         except PermissionError:
             print('Permission denied')
             print('Please, make sure you run me with superuser privileges (use sudo or su)')
         except KeyboardInterrupt:
             print('\nStopped')
-            print(f'Caught frames: {count}')
+            print(f'Caught frames: {sum(counts)}')
+            print(f'Dropped by kernel: {sum(drops)}')
         except OSError as e:
             if e.errno == errno.ENODEV:
                 print('No such interface')
             else:
                 raise
 
-    def _frame_completes_to_filter(self, frame):
-        if self.__filter == '':
-            return True
+    def _run_workers(self, counts, drops):
+        group_id = os.getpid()
+        shards = shard_names(self.__options.output, self.__options.workers)
+        workers = [multiprocessing.Process(target=self._work, args=(shards[i], counts, drops, i, group_id))
+                   for i in range(self.__options.workers)]
 
-        return frame.internet_frame.protocol == self.__filter or \
-            frame.internet_frame.transport_frame.protocol == self.__filter
+        for worker in workers:
+            worker.start()
 
+        # metrics are kept by the workers, so they get SIGUSR1 sent to the parent, which must survive it
+        previous_handler = signal.signal(signal.SIGUSR1, _forward_signal(workers) if self.__options.instrumented
+                                         else signal.SIG_IGN)
 
-def main():
-    args = _parse_args()
-    sniffer = Sniffer(interface=args.interface, filter_=args.filter, out=args.out, max_frames=args.number)
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # workers are stopped and their shards merged before interruption is reported
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+            for worker in workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signal.SIGINT)
+            for worker in workers:
+                worker.join()
+
+            raise
+        finally:
+            signal.signal(signal.SIGUSR1, previous_handler)
+
+            # worker which failed, e.g. on bind, has printed its error, shards of the others are kept
+            for i, worker in enumerate(workers):
+                if worker.exitcode:
+                    print(f'Worker {i} failed with exit code {worker.exitcode}')
+
+            merge_shards(self.__options.output, shards)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    def _work(self, out, counts, drops, index, group_id):
+        signal.signal(signal.SIGINT, _interrupt_once)
+
+        try:
+            self._capture(out, counts, drops, index, group_id)
+        except KeyboardInterrupt:
+            pass
+
+    def _capture(self, out, counts, drops, index, group_id=None):
+        with create_saver(self.__options.output, out, self.__options.snaplen, self.__options.sharded) as s:
+            raw = self._open_receiver(group_id)
+
+            try:
+                self._process(raw, s, out, counts, index)
+            except EOFError:
+                pass
+            finally:
+                if self.__options.read:
+                    raw.close()
+                else:
+                    drops[index] = raw.get_statistics()[1]
+
+    def _open_receiver(self, group_id):
+        raw = self._create_raw_generator()
+
+        if not self.__options.read:
+            raw.attach_filter(bpf.compile_filter(self.__options.filter, self.__options.snaplen))
+        if group_id is not None:
+            raw.join_fanout(group_id, _FANOUT_MODES[self.__options.fanout])
+
+        return raw
+
+    def _process(self, raw, s, out, counts, index):
+        # decodes, samples and filters received frames and gives them to the outputs until enough are caught
+        ethernet = self._create_parser()
+        raw_filter = None if self.__options.filter == '' else filters.compile_predicate(self.__options.filter)
+        metrics = Metrics() if self.__options.instrumented else None
+        if metrics is not None:
+            raw = MeasuredReceiver(raw, metrics)
+            ethernet = MeasuredParser(ethernet, metrics)
+            raw_filter = None if raw_filter is None else measured_filter(raw_filter, metrics)
+        defragmenter = FragmentReassembler(max_memory=self.__options.fragment_memory) \
+            if self.__options.defragment else None
+        sampler = self._create_sampler()
+        if metrics is not None and sampler is not None:
+            metrics.gauge('sampling_ratio', lambda: sampler.ratio, 'current sampling ratio')
+            metrics.gauge('sampling_estimated_frames', lambda: sampler.estimate, 'frames estimated from sampled ones')
+
+        flows = self._create_flow_table()
+        streams = self._create_stream_reassembler()
+        statistics = TrafficStatistics(top=self.__options.top) if self.__options.stats else None
+        console = ConsoleWriter()
+        outputs = self._create_outputs(out, s, flows, streams, statistics, sampler, console)
+        flush_console = console.flush
+        if metrics is not None:
+            outputs = [(name, metrics.timed(name, output)) for name, output in outputs]
+            flush_console = metrics.timed('print', console.flush)
+
+        try:
+            with self._instrumentation(metrics, index):
+                if self.__options.pipeline:
+                    self._run_pipeline(raw, ethernet, raw_filter, defragmenter, sampler, outputs, counts, index,
+                                       console, s)
+                    return
+
+                gen = FrameGenerator(raw, ethernet, raw_filter, defragmenter,
+                                     self._adapt(sampler, lambda: drop_rate(raw.get_statistics),
+                                                 DROP_RATE_HIGH, DROP_RATE_LOW))
+
+                while not self._enough_frames(counts):
+                    for frame in gen.get_batch(self.__options.batch):
+                        if self._enough_frames(counts):
+                            break
+
+                        for name, output in outputs:
+                            output(frame)
+
+                        counts[index] += 1
+
+                    flush_console()
+                    s.flush_if_due()
+        finally:
+            console.close()
+            if flows is not None:
+                flows.flush()
+            if streams is not None:
+                streams.flush()
+            if statistics is not None and statistics.start is not None:
+                print(statistics.get_description())
+            if sampler is not None:
+                print(sampler.get_description())
+
+    def _instrumentation(self, metrics, index):
+        # exports metrics and runs the profiler while frames are captured
+        stack = contextlib.ExitStack()
+
+        if metrics is None:
+            return stack
+
+        filename = self.__options.metrics
+
+        if filename and self.__options.sharded:
+            filename = f'{filename}.{index}'
+
+        stack.enter_context(MetricsExporter(metrics, filename, self.__options.metrics_interval))
+
+        if self.__options.profile:
+            stack.enter_context(SamplingProfiler(metrics, _PROFILED_CLASSES))
+
+        return stack
+
+    def _create_flow_table(self):
+        if not self.__options.flows:
+            return None
+
+        return FlowTable(timeout=self.__options.flow_timeout, max_flows=self.__options.max_flows,
+                         on_evict=lambda flow: print(flow.get_description()))
+
+    def _create_stream_reassembler(self):
+        if not self.__options.streams:
+            return None
 
-    sniffer.run()
+        return StreamReassembler(on_close=lambda stream: print(stream.get_description()),
+                                 timeout=self.__options.stream_timeout, max_stream_memory=self.__options.stream_memory,
+                                 max_memory=self.__options.streams_memory)
+
+    def _create_sampler(self):
+        if self.__options.sample == 1 and not self.__options.adaptive_sampling:
+            return None
+
+        sampler_class = FlowSampler if self.__options.sample_flows else CountSampler
+
+        def on_change(timestamp, ratio):
+            print(f'Sampling 1/{ratio} since {timestamp / 1e9:.6f}')
+
+        return sampler_class(self.__options.sample, on_change=on_change)
+
+    def _adapt(self, sampler, create_load, high, low):
+        # sampler which follows load created by create_load when adaptive sampling is on
+        if sampler is None or not self.__options.adaptive_sampling:
+            return sampler
+
+        return AdaptiveSampler(sampler, create_load(), high, low, max_ratio=self.__options.max_sample)
+
+    def _create_outputs(self, out, s, flows, streams, statistics, sampler, console):
+        outputs = []
+
+        if out:
+            outputs.append(('pcap', lambda frame: s.save(frame.raw, frame.timestamp, frame.orig_len)))
+        if flows is not None:
+            outputs.append(('flows', flows.update))
+        if streams is not None:
+            outputs.append(('streams', lambda frame: streams.update(frame.raw, frame.timestamp)))
+        if statistics is not None:
+            outputs.append(('stats', self._create_statistics_output(statistics, sampler)))
+        if flows is None and streams is None and statistics is None and not self.__options.quiet:
+            outputs.append(('console', self._create_printer(console)))
+
+        return outputs
+
+    def _create_statistics_output(self, statistics, sampler):
+        # sampled frames are counted ratio times, so statistics estimate the whole traffic
+        interval = int(self.__options.stats_interval * 1e9)
+
+        def update(frame):
+            timestamp = frame.timestamp if frame.timestamp is not None else time.time_ns()
+
+            if statistics.start is not None and timestamp - statistics.start >= interval:
+                print(statistics.get_description())
+                statistics.clear()
+
+            statistics.update(frame.raw, timestamp, frame.orig_len, 1 if sampler is None else sampler.ratio)
+
+        return update
+
+    def _create_printer(self, console):
+        payload = 0 if self.__options.headers_only else self.__options.payload
+        renderer = FrameRenderer(payload=payload, compact=self.__options.compact)
+
+        return lambda frame: console.write(renderer.render(frame))
+
+    def _run_pipeline(self, raw, ethernet, raw_filter, defragmenter, sampler, outputs, counts, index, console, s):
+        # capture thread only receives frames, so slow output does not stall the socket
+        def capture():
+            try:
+                return bytes(raw.recv_next()), raw.timestamp, raw.orig_len
+            except EOFError:
+                raise StopIteration
+
+        def decode(item):
+            if self._enough_frames(counts):
+                raise StopIteration
+
+            package, timestamp, orig_len = item
+
+            if defragmenter is not None:
+                datagram = defragmenter.feed(package, timestamp)
+                if datagram is None:
+                    return None
+                if datagram is not package:
+                    package, orig_len = datagram, None
+
+            if sampler is not None and not sampler.keep(package, timestamp):
+                return None
+
+            if raw_filter is not None and not raw_filter(package):
+                return None
+
+            frame = ethernet.parse(package)
+
+            if frame is None:
+                return None
+
+            frame.timestamp = timestamp
+            frame.orig_len = orig_len
+            counts[index] += 1
+
+            return frame
+
+        decode_queue = BoundedQueue(self.__options.queue_size, self.__options.overflow)
+        # saver is used only by the pcap stage, which also flushes it while no frames arrive
+        output_stages = [Stage(name, output, BoundedQueue(self.__options.queue_size, self.__options.overflow),
+                               on_idle=s.flush_if_due if name == 'pcap' else None,
+                               idle_timeout=self.__options.output.flush_interval)
+                         for name, output in outputs]
+        # decode stage samples by the fill of queues rather than kernel drops, they fill up first
+        queues = [decode_queue] + [stage.input_queue for stage in output_stages]
+        sampler = self._adapt(sampler, lambda: queue_fill(queues), QUEUE_HIGH, QUEUE_LOW)
+
+        stages = [Stage('capture', capture, None, [decode_queue]),
+                  Stage('decode', decode, decode_queue, [stage.input_queue for stage in output_stages])]
+        stages += output_stages
+
+        for stage in stages:
+            stage.start()
+
+        try:
+            for stage in stages[1:]:
+                stage.join()
+        finally:
+            decode_queue.close()
+
+            for stage in stages[1:]:
+                stage.join()
+            console.flush()
+            for stage in stages:
+                print(stage.get_description())
+
+    def _enough_frames(self, counts):
+        return self.__options.max_frames != -1 and sum(counts) >= self.__options.max_frames
+
+    def _create_parser(self):
+        if self.__options.compact_frames or self.__options.reuse_frames:
+            # pooled frame is valid until the next batch, so not in pipeline where frames wait in queues
+            pool_size = self.__options.batch if self.__options.reuse_frames and not self.__options.pipeline else 0
+
+            return CompactEthernetFrameParser(pool_size=pool_size)
+
+        # statistics need only raw bytes, so lazy frames cost them almost nothing
+        if self.__options.lazy or self.__options.stats:
+            return LazyEthernetFrameParser()
+
+        tcp = TcpFrameParser()
+        udp = UdpFrameParser()
+        ipv4 = Ipv4FrameParser(tcp, udp)
+        ipv6 = Ipv6FrameParser(tcp, udp)
+
+        return EthernetFrameParser(ipv4, ipv6)
+
+    def _create_raw_generator(self):
+        if self.__options.read:
+            return saver.pcap.PcapReader(self.__options.read)
+
+        # receiving stops for a while on a quiet link, so saved frames do not stay buffered longer than promised
+        timeout = self.__options.output.flush_interval if self.__options.output.filename else None
+
+        if self.__options.ring:
+            return RingFrameGenerator(interface=self.__options.interface, block_size=self.__options.block_size,
+                                      block_count=self.__options.block_count, snaplen=self.__options.snaplen,
+                                      timeout=timeout)
+
+        return RawFrameGenerator(interface=self.__options.interface, snaplen=self.__options.snaplen, timeout=timeout)
+
+
+def _forward_signal(workers):
+    def forward(signum, frame):
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signum)
+            except ProcessLookupError:
+                pass  # worker has already finished
+
+    return forward
+
+
+def _interrupt_once(signum, frame):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    raise KeyboardInterrupt
+
+
+def main():
+    Sniffer(_parse_args()).run()
 
 
 if __name__ == '__main__':
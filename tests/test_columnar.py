@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from bench import synth
+from network.classifier import FrameClassifier
+from saver.columnar import COLUMNS, ColumnarReader, ColumnarSaver
+
+_START = 1500000000 * 1000000000
+_IPV4_MAPPED = b'\x00' * 10 + b'\xff\xff'
+
+
+def _records(n=1000, seed=0):
+    rnd = random.Random(seed)
+    frames = synth.make_frames(n, seed)
+    frames.append(synth.ethernet(0x0800, synth.ipv4(6, synth.tcp(51000, 443, flags=0x12))))
+
+    return [(_START + i * 1000 + rnd.randrange(1000), frame, len(frame) + rnd.choice((0, 0, 100)))
+            for i, frame in enumerate(frames)]
+
+
+def _expected(records):
+    # columns computed from the frames independently of the saver
+    classifier = FrameClassifier()
+    rows = []
+
+    for timestamp, frame, orig_len in records:
+        frame_class = classifier.classify(frame)
+
+        def address(value):
+            if value is None:
+                return bytes(16)
+            return _IPV4_MAPPED + value if len(value) == 4 else value
+
+        rows.append({
+            'timestamp': timestamp,
+            'length': orig_len,
+            'captured': len(frame),
+            'dst_mac': frame[0:6].ljust(6, b'\x00'),
+            'src_mac': frame[6:12].ljust(6, b'\x00'),
+            'ethertype': 0 if frame_class is None else frame_class.ethertype,
+            'protocol': frame_class and frame_class.protocol or 0,
+            'src': address(frame_class and frame_class.src),
+            'dst': address(frame_class and frame_class.dst),
+            'src_port': frame_class and frame_class.src_port or 0,
+            'dst_port': frame_class and frame_class.dst_port or 0,
+            'tcp_flags': frame_class and frame_class.flags or 0,
+        })
+
+    return {name: [row[name] for row in rows] for name, code in COLUMNS}
+
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('row_group_size', [1, 100, 65536])
+def test_round_trip(tmp_path, compress, row_group_size):
+    filename = str(tmp_path / 'frames.col')
+    records = _records()
+
+    with ColumnarSaver(filename, row_group_size=row_group_size, compress=compress) as s:
+        for timestamp, frame, orig_len in records:
+            s.save(frame, timestamp, orig_len)
+
+    with ColumnarReader(filename) as reader:
+        assert reader.columns == [name for name, code in COLUMNS]
+        assert reader.rows == len(records)
+        assert reader.row_groups == -(-len(records) // row_group_size)
+
+        assert {name: list(values) for name, values in reader.read().items()} == _expected(records)
+
+
+def test_read_some_columns_and_row_groups(tmp_path):
+    filename = str(tmp_path / 'frames.col')
+    records = _records()
+
+    with ColumnarSaver(filename, row_group_size=100) as s:
+        for timestamp, frame, orig_len in records:
+            s.save(frame, timestamp, orig_len)
+
+    expected = _expected(records)
+
+    with ColumnarReader(filename) as reader:
+        columns = reader.read(['dst_port', 'src'], row_groups=[3, 10])
+
+        assert list(columns) == ['dst_port', 'src']
+        assert list(columns['dst_port']) == expected['dst_port'][300:400] + expected['dst_port'][1000:]
+        assert columns['src'] == expected['src'][300:400] + expected['src'][1000:]
+
+        with pytest.raises(ValueError):
+            reader.read(['no_such_column'])
+
+
+def test_empty_file(tmp_path):
+    filename = str(tmp_path / 'frames.col')
+
+    with ColumnarSaver(filename):
+        pass
+
+    with ColumnarReader(filename) as reader:
+        assert reader.rows == 0
+        assert list(reader.read()['timestamp']) == []
+
+
+def test_not_columnar(tmp_path):
+    filename = tmp_path / 'frames.col'
+    filename.write_bytes(b'not a columnar file, but long enough for the trailer')
+
+    with pytest.raises(ValueError):
+        ColumnarReader(str(filename))
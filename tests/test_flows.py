@@ -0,0 +1,175 @@
+from bench import synth
+from network.flows import FlowTable, NEW, SYN_SENT, SYN_RECEIVED, ESTABLISHED, CLOSING, CLOSED, RESET
+from network.parsers import EthernetFrameParser, Ipv4FrameParser, Ipv6FrameParser, TcpFrameParser, UdpFrameParser
+
+_IPV4_TYPE = 0x0800
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_CLIENT = b'\x0a\x00\x00\x01'
+_SERVER = b'\x0a\x00\x00\x02'
+
+_SYN = 0x02
+_RST = 0x04
+_PSH = 0x08
+_ACK = 0x10
+_SYN_ACK = 0x12
+_FIN_ACK = 0x11
+
+_SECOND = 1000000000
+
+
+def _parse(package, timestamp):
+    tcp = TcpFrameParser()
+    udp = UdpFrameParser()
+    frame = EthernetFrameParser(Ipv4FrameParser(tcp, udp), Ipv6FrameParser(tcp, udp)).parse(package)
+    frame.timestamp = timestamp
+
+    return frame
+
+
+def _tcp(flags, timestamp, reply=False, client_port=51000):
+    src, dst = (_SERVER, _CLIENT) if reply else (_CLIENT, _SERVER)
+    src_port, dst_port = (443, client_port) if reply else (client_port, 443)
+
+    return _parse(synth.ethernet(_IPV4_TYPE, synth.ipv4(_TCP_TYPE, synth.tcp(src_port, dst_port, flags=flags),
+                                                        src=src, dst=dst)), timestamp)
+
+
+def _udp(port, timestamp, reply=False):
+    src, dst = (_SERVER, _CLIENT) if reply else (_CLIENT, _SERVER)
+    src_port, dst_port = (53, port) if reply else (port, 53)
+
+    return _parse(synth.ethernet(_IPV4_TYPE, synth.ipv4(_UDP_TYPE, synth.udp(src_port, dst_port, b'x' * 10),
+                                                        src=src, dst=dst)), timestamp)
+
+
+def test_both_directions_are_one_flow():
+    table = FlowTable()
+    request = _udp(5353, 0)
+    flow = table.update(request)
+    reply = _udp(5353, _SECOND // 2, reply=True)
+
+    assert table.update(reply) is flow
+    assert len(table) == 1
+    assert flow.state is None
+    assert (flow.src_port, flow.dst_port) == (5353, 53)
+    assert flow.packets == 2 and flow.forward_packets == 1
+    assert flow.bytes == request.orig_len + reply.orig_len
+    assert flow.forward_bytes == request.orig_len
+    assert flow.duration == 0.5
+
+
+def test_tcp_handshake_and_close():
+    table = FlowTable()
+    flow = table.update(_tcp(_SYN, 0))
+    states = [flow.state]
+
+    for i, (flags, reply) in enumerate([(_SYN_ACK, True), (_ACK, False), (_ACK, True),
+                                        (_FIN_ACK, False), (_ACK, True), (_FIN_ACK, True)]):
+        assert table.update(_tcp(flags, i + 1, reply)) is flow
+        states.append(flow.state)
+
+    assert states == [SYN_SENT, SYN_RECEIVED, ESTABLISHED, ESTABLISHED, CLOSING, CLOSING, CLOSED]
+
+
+def test_tcp_midstream_and_reset():
+    # connection seen from the middle has no handshake, the first ack establishes it
+    table = FlowTable()
+    flow = table.update(_tcp(_PSH, 0))
+
+    assert flow.state == NEW
+    assert table.update(_tcp(_ACK, 1, reply=True)).state == ESTABLISHED
+    assert table.update(_tcp(_RST, 2)).state == RESET
+    assert table.update(_tcp(_ACK, 3, reply=True)).state == RESET
+
+
+def test_idle_flows_expire():
+    evicted = []
+    table = FlowTable(timeout=10, on_evict=evicted.append)
+    first = table.update(_udp(1000, 0))
+    second = table.update(_udp(2000, 5 * _SECOND))
+
+    table.expire(10 * _SECOND - 1)
+    assert evicted == []
+
+    table.expire(10 * _SECOND)
+    assert evicted == [first]
+
+    table.update(_udp(2000, 12 * _SECOND, reply=True))
+    table.expire(20 * _SECOND)
+    assert evicted == [first]
+    assert list(table) == [second]
+
+    table.expire(22 * _SECOND)
+    assert evicted == [first, second]
+    assert len(table) == 0
+    assert table.evicted == 2
+
+
+def test_closed_flows_expire_sooner():
+    evicted = []
+    table = FlowTable(timeout=60, closed_timeout=5, on_evict=evicted.append)
+    active = table.update(_udp(1000, 0))
+    closed = table.update(_tcp(_SYN, 0))
+    table.update(_tcp(_RST, _SECOND, reply=True))
+
+    table.expire(6 * _SECOND)
+
+    assert evicted == [closed]
+    assert list(table) == [active]
+
+
+def test_expiry_runs_from_update():
+    evicted = []
+    table = FlowTable(timeout=1, closed_timeout=1, on_evict=evicted.append)
+    first = table.update(_udp(1000, 0))
+    table.update(_udp(2000, _SECOND // 2))
+
+    assert evicted == []
+
+    table.update(_udp(3000, 2 * _SECOND))
+
+    assert evicted[0] is first
+    assert len(evicted) == 2
+    assert len(table) == 1
+
+
+def test_capacity_evicts_least_recently_seen():
+    evicted = []
+    table = FlowTable(max_flows=2, on_evict=evicted.append)
+    first = table.update(_udp(1000, 0))
+    second = table.update(_udp(2000, 1))
+    table.update(_udp(1000, 2, reply=True))
+
+    third = table.update(_udp(3000, 3))
+
+    assert evicted == [second]
+    assert list(table) == [first, third]
+
+
+def test_capacity_evicts_closed_flows_first():
+    evicted = []
+    table = FlowTable(max_flows=2, on_evict=evicted.append)
+    table.update(_udp(1000, 0))
+    closed = table.update(_tcp(_SYN, 1))
+    table.update(_tcp(_RST, 2, reply=True))
+
+    table.update(_udp(3000, 3))
+
+    assert evicted == [closed]
+    assert len(table) == 2
+
+
+def test_flush_evicts_everything():
+    evicted = []
+    table = FlowTable(on_evict=evicted.append)
+    flows = [table.update(_udp(port, port)) for port in (1000, 2000, 3000)]
+    flows.append(table.update(_tcp(_SYN, 0)))
+    table.update(_tcp(_RST, 1))
+
+    table.flush()
+
+    assert len(table) == 0
+    assert sorted(map(id, evicted)) == sorted(map(id, flows))
+    assert table.evicted == 4
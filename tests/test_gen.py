@@ -0,0 +1,192 @@
+import asyncio
+import socket
+
+import pytest
+
+from bench import synth
+from network.gen import AsyncFrameGenerator, FrameGenerator
+from network.parsers import EthernetFrameParser, Ipv4FrameParser, Ipv6FrameParser, TcpFrameParser, UdpFrameParser
+from network.reassembly import FragmentReassembler
+from network.sampling import CountSampler
+
+
+class _SocketRaw:
+    # raw generator reading datagrams of a socket pair, so no superuser rights are needed
+    def __init__(self, conn):
+        self.socket = conn
+        self.timestamp = None
+        self.orig_len = None
+        self.count = 0
+
+    def recv_next(self):
+        package = self.socket.recv(65535)
+        self.count += 1
+        self.timestamp = self.count
+        self.orig_len = len(package)
+
+        return package
+
+
+class _BatchRaw:
+    # raw generator returning given batches, lengths on the wire are made longer to tell them from snapped ones
+    def __init__(self, *batches):
+        self.batches = list(batches)
+        self.timestamps = []
+        self.orig_lens = []
+
+    def recv_batch(self, n):
+        packages = self.batches.pop(0)[:n]
+        self.timestamps = [1000 + i for i in range(len(packages))]
+        self.orig_lens = [len(package) + 100 for package in packages]
+
+        return packages
+
+
+def _parser():
+    tcp = TcpFrameParser()
+    udp = UdpFrameParser()
+
+    return EthernetFrameParser(Ipv4FrameParser(tcp, udp), Ipv6FrameParser(tcp, udp))
+
+
+def _frame(port):
+    return synth.ethernet(0x0800, synth.ipv4(17, synth.udp(5353, port, b'x' * 10)))
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    yield a, b
+
+    a.close()
+    b.close()
+
+
+def test_cancelled_wait_stops_reading(pair):
+    receiver, sender = pair
+    raw = _SocketRaw(receiver)
+
+    async def run():
+        frames = AsyncFrameGenerator(raw, _parser())
+        waiting = asyncio.ensure_future(frames.__anext__())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        # socket is not read while nobody waits, the frame stays in the kernel
+        sender.send(_frame(53))
+        await asyncio.sleep(0.05)
+        assert raw.count == 0
+        assert frames.pending == 0
+
+        # the next wait reads it again
+        frame = await asyncio.wait_for(frames.__anext__(), 1)
+        assert frame.raw == _frame(53)
+        assert raw.count == 1
+
+        frames.close()
+
+    asyncio.run(run())
+
+
+def test_close_ends_iteration(pair):
+    receiver, sender = pair
+
+    async def run():
+        frames = AsyncFrameGenerator(_SocketRaw(receiver), _parser())
+        sender.send(_frame(53))
+        sender.send(_frame(80))
+        received = [await frames.__anext__(), await frames.__anext__()]
+        frames.close()
+
+        assert [frame.raw for frame in received] == [_frame(53), _frame(80)]
+
+        with pytest.raises(StopAsyncIteration):
+            await frames.__anext__()
+
+    asyncio.run(run())
+
+
+def test_fragments_are_reassembled(pair):
+    receiver, sender = pair
+    segment = synth.udp(5353, 53, bytes(range(256)) * 8)
+
+    async def run():
+        frames = AsyncFrameGenerator(_SocketRaw(receiver), _parser(), defragmenter=FragmentReassembler())
+        sender.send(synth.ethernet(0x0800, synth.ipv4(17, segment[1024:], identifier=1, flags_offset=128)))
+        sender.send(_frame(80))
+        sender.send(synth.ethernet(0x0800, synth.ipv4(17, segment[:1024], identifier=1, flags_offset=0x2000)))
+        received = [await frames.__anext__(), await frames.__anext__()]
+        frames.close()
+
+        # whole frames keep their length, rebuilt datagram is a frame of its own
+        assert received[0].raw == _frame(80)
+        assert received[0].orig_len == len(_frame(80))
+        assert bytes(received[1].raw[34:]) == segment
+        assert received[1].orig_len == len(received[1].raw) == 34 + len(segment)
+
+    asyncio.run(run())
+
+
+def test_sampled_frames(pair):
+    receiver, sender = pair
+    sampler = CountSampler(3)
+
+    async def run():
+        frames = AsyncFrameGenerator(_SocketRaw(receiver), _parser(), sampler=sampler)
+        for port in range(1, 10):
+            sender.send(_frame(port))
+        received = [await frames.__anext__() for _ in range(3)]
+        frames.close()
+
+        assert [frame.raw for frame in received] == [_frame(1), _frame(4), _frame(7)]
+
+    asyncio.run(run())
+    assert (sampler.seen, sampler.kept, sampler.estimate) == (9, 3, 9)
+
+
+def test_batch_keeps_timestamps_of_frames():
+    packages = [_frame(port) for port in range(1, 6)]
+    frames = FrameGenerator(_BatchRaw(packages, []), _parser(), raw_filter=lambda package: package != _frame(2))
+
+    received = frames.get_batch()
+
+    assert [frame.raw for frame in received] == [_frame(1), _frame(3), _frame(4), _frame(5)]
+    assert [frame.timestamp for frame in received] == [1000, 1002, 1003, 1004]
+    assert [frame.orig_len for frame in received] == [len(_frame(1)) + 100] * 4
+    assert frames.get_batch() == []
+
+
+def test_batch_of_fragments_and_sampled_frames():
+    segment = synth.udp(5353, 53, bytes(range(256)) * 8)
+    tail = synth.ethernet(0x0800, synth.ipv4(17, segment[1024:], identifier=1, flags_offset=128))
+    head = synth.ethernet(0x0800, synth.ipv4(17, segment[:1024], identifier=1, flags_offset=0x2000))
+    packages = [_frame(1), tail, _frame(2), _frame(3), head, _frame(4), _frame(5)]
+    frames = FrameGenerator(_BatchRaw(packages), _parser(), defragmenter=FragmentReassembler(),
+                            sampler=CountSampler(2))
+
+    received = frames.get_batch()
+
+    # whole frames 1, 2, 3, datagram, 4, 5 reach the sampler, which keeps every second of them
+    assert [frame.timestamp for frame in received] == [1000, 1003, 1005]
+    assert received[0].raw == _frame(1)
+    assert received[1].raw == _frame(3)
+    assert received[2].raw == _frame(4)
+    assert [frame.orig_len for frame in received] == [len(_frame(1)) + 100] * 3
+
+
+def test_batch_datagram_has_its_own_length():
+    segment = synth.udp(5353, 53, bytes(range(256)) * 8)
+    tail = synth.ethernet(0x0800, synth.ipv4(17, segment[1024:], identifier=1, flags_offset=128))
+    head = synth.ethernet(0x0800, synth.ipv4(17, segment[:1024], identifier=1, flags_offset=0x2000))
+    frames = FrameGenerator(_BatchRaw([tail, _frame(1), head]), _parser(), defragmenter=FragmentReassembler())
+
+    received = frames.get_batch()
+
+    assert [frame.timestamp for frame in received] == [1001, 1002]
+    assert received[0].orig_len == len(_frame(1)) + 100
+    assert bytes(received[1].raw[34:]) == segment
+    assert received[1].orig_len == 34 + len(segment)
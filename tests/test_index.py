@@ -0,0 +1,149 @@
+import random
+
+import pytest
+
+from bench import synth
+from saver.index import IndexWriter, IndexedPcapSaver, PcapIndex, build, extract, index_name, matcher, _flow
+from saver.pcap import PcapReader, PcapSaver
+
+_START = 1500000000 * 1000000000
+_STEP = 1000000
+_HOSTS = [bytes([10, 0, 0, i]) for i in range(1, 9)]
+_HOSTS6 = [b'\xfd' + bytes(14) + bytes([i]) for i in range(1, 5)]
+_PORTS = [53, 80, 443]
+
+
+def _frames(n=3000, seed=0):
+    # few hosts and ports, so queries match frames spread over many blocks
+    rnd = random.Random(seed)
+    frames = []
+
+    for _ in range(n):
+        payload = rnd.randbytes(rnd.randrange(200))
+        protocol = rnd.choice((6, 17))
+        segment = synth.tcp(rnd.randrange(1024, 1032), rnd.choice(_PORTS), payload) if protocol == 6 else \
+            synth.udp(rnd.randrange(1024, 1032), rnd.choice(_PORTS), payload)
+
+        if rnd.random() < 0.8:
+            frames.append(synth.ethernet(0x0800, synth.ipv4(protocol, segment, src=rnd.choice(_HOSTS),
+                                                            dst=rnd.choice(_HOSTS))))
+        else:
+            frames.append(synth.ethernet(0x86DD, synth.ipv6(protocol, segment, src=rnd.choice(_HOSTS6),
+                                                            dst=rnd.choice(_HOSTS6))))
+
+    frames.append(synth.ethernet(0x0806, bytes(28)))
+
+    return frames
+
+
+@pytest.fixture(scope='module')
+def indexed(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('index') / 'frames.pcap')
+    frames = _frames()
+
+    with PcapSaver(filename, nanoseconds=True, flush_size=1) as s:
+        for i, frame in enumerate(frames):
+            s.save(frame, _START + i * _STEP)
+
+    build(filename, block_size=8192)
+
+    return filename, frames
+
+
+def _brute_force(frames, match):
+    return [frame for i, frame in enumerate(frames) if match(_START + i * _STEP, frame)]
+
+
+def _query(tmp_path, filename, **query):
+    blocks = PcapIndex(index_name(filename)).find(query.get('start'), query.get('end'), query.get('host'),
+                                                  query.get('flow'))
+    out = str(tmp_path / 'out.pcap')
+    count = extract(filename, out, blocks, matcher(**query))
+
+    with PcapReader(out) as reader:
+        extracted = [bytes(package) for timestamp, package, orig_len in reader]
+
+    assert count == len(extracted)
+
+    return blocks, extracted
+
+
+_QUERIES = [
+    {},
+    {'start': _START + 500 * _STEP, 'end': _START + 520 * _STEP},
+    {'start': _START + 2990 * _STEP},
+    {'end': _START + 3 * _STEP},
+    {'start': _START + 10000 * _STEP},
+    {'host': _HOSTS[3]},
+    {'host': _HOSTS6[0]},
+    {'host': b'\x0a\x00\x00\x63'},
+    {'host': _HOSTS[0], 'start': _START + 1000 * _STEP, 'end': _START + 2000 * _STEP},
+    {'flow': (6, _HOSTS[4], 1029, _HOSTS[1], 443)},
+    {'flow': (17, _HOSTS[0], 80, _HOSTS[6], 1027)},  # reverse direction of the flow
+    {'flow': (17, _HOSTS[0], 80, _HOSTS[6], 1027), 'start': _START + 1500 * _STEP},
+    {'flow': (6, _HOSTS[1], 1025, _HOSTS[2], 53)},
+    {'flow': (6, _HOSTS6[1], 1025, _HOSTS6[1], 80), 'host': _HOSTS6[1]},
+    {'host': _HOSTS[5], 'filter_': 'udp and dst port 53'},
+]
+
+
+@pytest.mark.parametrize('query', _QUERIES)
+def test_query_matches_brute_force(tmp_path, indexed, query):
+    filename, frames = indexed
+    blocks, extracted = _query(tmp_path, filename, **query)
+
+    assert extracted == _brute_force(frames, matcher(**query))
+
+
+def test_query_reads_only_some_blocks(tmp_path, indexed):
+    filename, frames = indexed
+    index = PcapIndex(index_name(filename))
+    flow = (6, _HOSTS[4], 1029, _HOSTS[1], 443)
+
+    assert len(index.find(flow=flow)) < len(index.blocks) / 2
+    assert len(index.find(_START + 500 * _STEP, _START + 520 * _STEP)) <= 2
+    assert index.find(host=b'\x0a\x00\x00\x63') == []
+
+
+def test_blocks_cover_file(indexed):
+    filename, frames = indexed
+    blocks = PcapIndex(index_name(filename)).blocks
+
+    assert sum(block.count for block in blocks) == len(frames)
+    assert blocks[0].first == _START
+    assert blocks[-1].last == _START + (len(frames) - 1) * _STEP
+    assert all(a.end == b.offset for a, b in zip(blocks, blocks[1:]))
+
+
+def test_index_written_while_saving(tmp_path, indexed):
+    # index written along with the file is the same as the one built from it afterwards
+    filename, frames = indexed
+    saved = str(tmp_path / 'frames.pcap')
+
+    with IndexedPcapSaver(PcapSaver(saved, nanoseconds=True), IndexWriter(index_name(saved), 8192)) as s:
+        for i, frame in enumerate(frames):
+            s.save(frame, _START + i * _STEP)
+
+    with open(index_name(saved), 'rb') as written, open(index_name(filename), 'rb') as built:
+        assert written.read() == built.read()
+
+
+def test_compressed_files_are_not_indexed(tmp_path):
+    filename = str(tmp_path / 'frames.pcap.gz')
+
+    with PcapSaver(filename) as s:
+        s.save(_frames(1)[0], _START)
+
+    with pytest.raises(ValueError):
+        build(filename)
+
+
+def test_flow_argument():
+    assert _flow(['udp', '10.0.0.1', '53', 'fd00::2', '65535']) == \
+        (17, b'\x0a\x00\x00\x01', 53, b'\xfd' + bytes(14) + b'\x02', 65535)
+
+    for values in (['tcp', 'bogus', '1', '10.0.0.2', '2'], ['tcp', '10.0.0.1', '70000', '10.0.0.2', '2'],
+                   ['tcp', '10.0.0.1', '1', '10.0.0.2', '-1'], ['tcp', '10.0.0.1', 'x', '10.0.0.2', '2'],
+                   ['icmp', '10.0.0.1', '1', '10.0.0.2', '2']):
+        with pytest.raises(ValueError):
+            _flow(values)
@@ -0,0 +1,60 @@
+from bench import synth
+from saver.output import OutputOptions, create_saver, merge_shards, shard_names
+from saver.pcap import PcapReader
+
+_START = 1500000000 * 1000000000
+
+
+def test_shard_names():
+    assert shard_names(OutputOptions(), 2) == ['', '']
+    assert shard_names(OutputOptions('out.pcap'), 2) == ['out.0.pcap', 'out.1.pcap']
+    assert shard_names(OutputOptions('out.pcap.gz'), 2) == ['out.0.pcap.gz', 'out.1.pcap.gz']
+    assert shard_names(OutputOptions('out.col', format='columnar'), 2) == ['out-w0.col', 'out-w1.col']
+    assert shard_names(OutputOptions('out.pcap.xz', rotate_count=10), 2) == \
+        ['out-{index:04}-w0.pcap.xz', 'out-{index:04}-w1.pcap.xz']
+
+
+def test_compressed_shards_are_merged(tmp_path):
+    options = OutputOptions(str(tmp_path / 'out.pcap.gz'), nanoseconds=True)
+    shards = shard_names(options, 2)
+    frames = synth.make_frames(10)
+
+    for i, shard in enumerate(shards):
+        with create_saver(options, shard, sharded=True) as s:
+            for j in range(i, len(frames), 2):
+                s.save(frames[j], _START + j)
+
+        with open(shard, 'rb') as file:
+            assert file.read(2) == b'\x1f\x8b'
+
+    merge_shards(options, shards)
+
+    with PcapReader(options.filename) as reader:
+        assert [bytes(package) for timestamp, package, orig_len in reader] == frames
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['out.pcap.gz']
+
+
+def test_missing_shards_are_skipped(tmp_path):
+    options = OutputOptions(str(tmp_path / 'out.pcap'))
+    shards = shard_names(options, 3)
+    frames = synth.make_frames(4)
+
+    with create_saver(options, shards[1], sharded=True) as s:
+        for i, frame in enumerate(frames):
+            s.save(frame, _START + i)
+
+    merge_shards(options, shards)
+
+    with PcapReader(options.filename) as reader:
+        assert [bytes(package) for timestamp, package, orig_len in reader] == frames
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['out.pcap']
+
+
+def test_nothing_is_merged_without_shards(tmp_path):
+    options = OutputOptions(str(tmp_path / 'out.pcap'))
+
+    merge_shards(options, shard_names(options, 2))
+
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,151 @@
+import random
+import time
+
+import pytest
+
+from bench import synth
+from saver.pcap import PcapReader, PcapSaver, merge
+
+_START = 1500000000 * 1000000000
+
+
+def _records(n=500, seed=0):
+    # (timestamp, frame) with nanoseconds that do not fit microseconds
+    rnd = random.Random(seed)
+
+    return [(_START + i * 1000 + rnd.randrange(1000), frame) for i, frame in enumerate(synth.make_frames(n, seed))]
+
+
+def _read(filename):
+    with PcapReader(filename) as reader:
+        return [(timestamp, bytes(package), orig_len) for timestamp, package, orig_len in reader], reader
+
+
+@pytest.mark.parametrize('nanoseconds', [False, True])
+@pytest.mark.parametrize('extension', ['.pcap', '.pcap.gz', '.pcap.xz'])
+def test_round_trip(tmp_path, nanoseconds, extension):
+    filename = str(tmp_path / f'frames{extension}')
+    records = _records()
+
+    with PcapSaver(filename, nanoseconds=nanoseconds, flush_size=4096) as s:
+        for timestamp, frame in records:
+            s.save(frame, timestamp)
+
+    read, reader = _read(filename)
+
+    assert reader.nanoseconds == nanoseconds
+    assert reader.snaplen == 65535
+    assert reader.link_type == 1
+    assert reader.seekable == (extension == '.pcap')
+    assert read == [(timestamp if nanoseconds else timestamp // 1000 * 1000, frame, len(frame))
+                    for timestamp, frame in records]
+
+
+@pytest.mark.parametrize('extension', ['.pcap', '.pcap.gz'])
+def test_snaplen(tmp_path, extension):
+    filename = str(tmp_path / f'frames{extension}')
+    records = _records()
+
+    with PcapSaver(filename, nanoseconds=True, snaplen=96) as s:
+        for timestamp, frame in records:
+            s.save(frame, timestamp)
+        # frame which was cut before, e.g. by the kernel, keeps its length on the wire
+        s.save(records[0][1][:40], _START, orig_len=1514)
+
+    read, reader = _read(filename)
+
+    assert reader.snaplen == 96
+    assert read[:-1] == [(timestamp, frame[:96], len(frame)) for timestamp, frame in records]
+    assert read[-1] == (_START, records[0][1][:40], 1514)
+
+
+def test_compressed_file_is_compressed(tmp_path):
+    frames = [bytes(1000)] * 100
+
+    for extension in ('.pcap', '.pcap.gz', '.pcap.xz'):
+        with PcapSaver(str(tmp_path / f'frames{extension}')) as s:
+            for frame in frames:
+                s.save(frame, _START)
+
+    plain = (tmp_path / 'frames.pcap').stat().st_size
+
+    assert (tmp_path / 'frames.pcap.gz').stat().st_size < plain / 10
+    assert (tmp_path / 'frames.pcap.xz').stat().st_size < plain / 10
+
+
+def test_seek(tmp_path):
+    filename = str(tmp_path / 'frames.pcap')
+    records = _records(20)
+
+    with PcapSaver(filename, nanoseconds=True) as s:
+        offsets = []
+        for timestamp, frame in records:
+            offsets.append(s.size)
+            s.save(frame, timestamp)
+
+    with PcapReader(filename) as reader:
+        reader.seek(offsets[10])
+
+        assert bytes(reader.recv_next()) == records[10][1]
+        assert reader.timestamp == records[10][0]
+        assert reader.offset == offsets[11]
+
+
+def test_batches(tmp_path):
+    filename = str(tmp_path / 'frames.pcap')
+    records = _records(100)
+
+    with PcapSaver(filename, nanoseconds=True) as s:
+        for timestamp, frame in records:
+            s.save(frame, timestamp)
+
+    with PcapReader(filename) as reader:
+        batches = []
+        while True:
+            try:
+                batches.append(([bytes(package) for package in reader.recv_batch(64)], reader.timestamps))
+            except EOFError:
+                break
+
+    assert [len(batch) for batch, timestamps in batches] == [64, 36]
+    assert [frame for batch, timestamps in batches for frame in batch] == [frame for timestamp, frame in records]
+    assert [t for batch, timestamps in batches for t in timestamps] == [timestamp for timestamp, frame in records]
+
+
+def test_merge(tmp_path):
+    records = _records()
+    shards = [str(tmp_path / f'frames.pcap.{i}') for i in range(3)]
+
+    for i, shard in enumerate(shards):
+        with PcapSaver(shard, nanoseconds=True) as s:
+            for timestamp, frame in records[i::3]:
+                s.save(frame, timestamp)
+
+    merge(shards, str(tmp_path / 'frames.pcap'), nanoseconds=True)
+    read, reader = _read(str(tmp_path / 'frames.pcap'))
+
+    assert read == [(timestamp, frame, len(frame)) for timestamp, frame in sorted(records)]
+
+
+def test_not_pcap(tmp_path):
+    filename = tmp_path / 'frames.pcap'
+    filename.write_bytes(b'not a pcap file at all, but long enough')
+
+    with pytest.raises(ValueError):
+        PcapReader(str(filename))
+
+
+def test_flush_if_due(tmp_path):
+    filename = tmp_path / 'frames.pcap'
+    frame = synth.make_frames(1)[0]
+
+    with PcapSaver(str(filename), flush_interval=3600) as s:
+        s.save(frame, _START)
+        s.flush_if_due()
+        assert filename.stat().st_size == 24
+
+    with PcapSaver(str(filename), flush_interval=0.05) as s:
+        s.save(frame, _START)
+        time.sleep(0.05)
+        s.flush_if_due()
+        assert filename.stat().st_size == 24 + 16 + len(frame)
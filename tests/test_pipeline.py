@@ -0,0 +1,159 @@
+import threading
+
+import pytest
+
+from tools.pipeline import BoundedQueue, QueueClosed, Stage, BLOCK, DROP_NEWEST, DROP_OLDEST
+
+
+def test_get_batch_timeout():
+    queue = BoundedQueue(4)
+
+    assert queue.get_batch(timeout=0.01) == []
+
+    queue.put(1)
+    assert queue.get_batch(timeout=0.01) == [1]
+
+    queue.close()
+    with pytest.raises(QueueClosed):
+        queue.get_batch(timeout=0.01)
+
+
+def test_stage_calls_on_idle_in_its_thread():
+    queue = BoundedQueue(4)
+    handled = []
+    idle = threading.Event()
+    threads = set()
+
+    def on_idle():
+        threads.add(threading.current_thread().name)
+        idle.set()
+
+    stage = Stage('output', handled.append, queue, on_idle=on_idle, idle_timeout=0.01)
+    stage.start()
+    queue.put(1)
+
+    assert idle.wait(1)
+
+    queue.put(2)
+    queue.close()
+    stage.join(1)
+
+    assert handled == [1, 2]
+    assert threads == {'output'}
+
+
+def test_drop_newest():
+    queue = BoundedQueue(3, DROP_NEWEST)
+
+    assert [queue.put(i) for i in range(5)] == [True, True, True, False, False]
+    assert queue.drops == 2
+    assert queue.depth == queue.max_depth == 3
+    assert queue.get_batch() == [0, 1, 2]
+
+
+def test_drop_oldest():
+    queue = BoundedQueue(3, DROP_OLDEST)
+
+    assert all(queue.put(i) for i in range(5))
+    assert queue.drops == 2
+    assert queue.get_batch() == [2, 3, 4]
+
+
+def test_block_waits_for_room():
+    queue = BoundedQueue(2, BLOCK)
+    queue.put(0)
+    queue.put(1)
+    put = threading.Event()
+
+    def producer():
+        queue.put(2)
+        put.set()
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+
+    assert not put.wait(0.05)
+    assert queue.get_batch(1) == [0]
+    assert put.wait(1)
+    thread.join()
+
+    assert queue.drops == 0
+    assert queue.get_batch() == [1, 2]
+
+
+def test_get_batch_takes_at_most_n():
+    queue = BoundedQueue(10)
+    for i in range(5):
+        queue.put(i)
+
+    assert queue.get_batch(2) == [0, 1]
+    assert queue.get_batch(10) == [2, 3, 4]
+    assert queue.depth == 0
+    assert queue.max_depth == 5
+
+
+def test_close_drains_then_raises():
+    queue = BoundedQueue(4)
+    queue.put(1)
+    queue.close()
+
+    assert queue.closed
+    with pytest.raises(QueueClosed):
+        queue.put(2)
+    assert queue.get_batch() == [1]
+    with pytest.raises(QueueClosed):
+        queue.get_batch()
+
+
+def test_close_wakes_blocked_producer_and_consumer():
+    full = BoundedQueue(1)
+    full.put(0)
+    empty = BoundedQueue(1)
+    errors = []
+
+    def wait(call):
+        try:
+            call()
+        except QueueClosed:
+            errors.append(call)
+
+    threads = [threading.Thread(target=wait, args=(lambda: full.put(1),)),
+               threading.Thread(target=wait, args=(empty.get_batch,))]
+    for thread in threads:
+        thread.start()
+
+    full.close()
+    empty.close()
+    for thread in threads:
+        thread.join(1)
+
+    assert len(errors) == 2
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_bad_arguments():
+    with pytest.raises(ValueError):
+        BoundedQueue(0)
+    with pytest.raises(ValueError):
+        BoundedQueue(1, 'drop-random')
+
+
+def test_stages_pass_items_through():
+    first = BoundedQueue(2)
+    second = BoundedQueue(2)
+    received = []
+    items = iter(range(100))
+
+    def source():
+        return next(items)  # StopIteration finishes the stage and closes its outputs
+
+    stages = [Stage('source', source, None, [first]),
+              Stage('double', lambda item: item * 2, first, [second]),
+              Stage('sink', received.append, second)]
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join(5)
+
+    assert received == [i * 2 for i in range(100)]
+    assert [stage.processed for stage in stages] == [100, 100, 100]
@@ -0,0 +1,99 @@
+import socket
+import time
+
+import pytest
+
+from network import bpf
+from network.raw import RawFrameGenerator
+
+_PORT = 47001
+_SNAPLEN = 60
+_ORIG_LEN = 14 + 20 + 8 + 100  # ethernet, ipv4 and udp headers of 100 bytes of data
+
+
+@pytest.fixture
+def raw():
+    # capture on loopback needs superuser rights, filter keeps only datagrams sent by the test
+    try:
+        generator = RawFrameGenerator(interface='lo', snaplen=_SNAPLEN, timeout=0.05)
+    except PermissionError:
+        pytest.skip('capture needs superuser rights')
+
+    generator.attach_filter(bpf.compile_filter(f'udp and port {_PORT}', snaplen=_SNAPLEN))
+
+    yield generator
+
+    generator.close()
+
+
+@pytest.fixture
+def sender():
+    conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(*markers):
+        for marker in markers:
+            conn.sendto(bytes([marker]) * 100, ('127.0.0.1', _PORT))
+
+    yield send
+
+    conn.close()
+
+
+def _receive(raw, count):
+    # loopback shows each datagram twice, as sent and as received
+    packages, timestamps, orig_lens = [], [], []
+    deadline = time.monotonic() + 1
+
+    while len(packages) < 2 * count and time.monotonic() < deadline:
+        packages += [bytes(package) for package in raw.recv_batch()]
+        timestamps += raw.timestamps
+        orig_lens += raw.orig_lens
+
+    return packages, timestamps, orig_lens
+
+
+def test_batch_stops_when_nothing_is_ready(raw, sender):
+    sender(1, 2, 3)
+    started = time.monotonic()
+    packages, timestamps, orig_lens = _receive(raw, 3)
+
+    assert time.monotonic() - started < 0.5
+    assert [package[-1] for package in packages] == [1, 1, 2, 2, 3, 3]
+    assert all(len(package) == _SNAPLEN for package in packages)
+    assert orig_lens == [_ORIG_LEN] * 6
+    assert len(timestamps) == 6
+    assert timestamps == sorted(timestamps)
+    assert abs(timestamps[0] - time.time_ns()) < 10 ** 9
+
+
+def test_batch_is_cut_to_n(raw, sender):
+    sender(1, 2)
+    time.sleep(0.01)
+
+    assert len(raw.recv_batch(3)) == 3
+    assert len(raw.timestamps) == len(raw.orig_lens) == 3
+    assert len(raw.recv_batch(3)) == 1
+
+
+def test_pool_is_reused(raw, sender):
+    sender(1)
+    first = raw.recv_batch()
+    buffers = [package.obj for package in first]
+
+    assert first[0][-1] == 1
+
+    sender(2)
+    second = raw.recv_batch()
+
+    assert all(package.obj is buffer for package, buffer in zip(second, buffers))
+    assert first[0][-1] == 2  # views of the previous batch see the new frames
+
+
+def test_timeout_returns_empty_batch(raw, sender):
+    sender(1)
+    _receive(raw, 1)
+    started = time.monotonic()
+
+    assert raw.recv_batch() == []
+    assert raw.timestamps == raw.orig_lens == []
+    assert time.monotonic() - started >= 0.04
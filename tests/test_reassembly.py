@@ -0,0 +1,179 @@
+import random
+import struct
+
+import pytest
+
+from bench import synth
+from network.reassembly import FragmentReassembler, StreamReassembler
+
+_IPV4_TYPE = 0x0800
+_IPV6_TYPE = 0x86DD
+_UDP_TYPE = 17
+_TCP_TYPE = 6
+_IPV6_FRAGMENT_TYPE = 44
+
+_SYN = 0x02
+_ACK = 0x10
+_PSH_ACK = 0x18
+_FIN_ACK = 0x11
+
+# payload ranges of fragments: in order, overlapping and with one of them sent twice
+_PIECES = [(0, 1480), (1480, 2960), (2960, 3008)]
+_OVERLAPPING = [(0, 1000), (800, 1600), (1200, 2400), (2400, 2960), (2000, 3008)]
+_DUPLICATED = [(0, 1000), (1000, 2000), (1000, 2000), (2000, 3008)]
+
+
+def _segment():
+    return synth.udp(5353, 53, random.Random(0).randbytes(3000))
+
+
+def _ipv4_fragments(segment, pieces, identifier=7):
+    return [synth.ethernet(_IPV4_TYPE, synth.ipv4(_UDP_TYPE, segment[start:end], identifier=identifier,
+                                                  flags_offset=(0x2000 if end < len(segment) else 0) | start // 8))
+            for start, end in pieces]
+
+
+def _ipv6_fragments(segment, pieces, identifier=7):
+    return [synth.ethernet(_IPV6_TYPE, synth.ipv6(_IPV6_FRAGMENT_TYPE, struct.pack(
+        '! B x H I', _UDP_TYPE, start | (1 if end < len(segment) else 0), identifier) + segment[start:end]))
+        for start, end in pieces]
+
+
+def _without_checksum(frame):
+    return frame[:24] + frame[26:]
+
+
+def _reassemble(fragments):
+    reassembler = FragmentReassembler()
+    results = [reassembler.feed(fragment, i) for i, fragment in enumerate(fragments)]
+
+    return [result for result in results if result is not None]
+
+
+@pytest.mark.parametrize('pieces', [_PIECES, _OVERLAPPING, _DUPLICATED])
+@pytest.mark.parametrize('seed', range(5))
+def test_ipv4_fragments(pieces, seed):
+    segment = _segment()
+    fragments = _ipv4_fragments(segment, pieces)
+    random.Random(seed).shuffle(fragments)
+
+    results = _reassemble(fragments)
+    expected = synth.ethernet(_IPV4_TYPE, synth.ipv4(_UDP_TYPE, segment, identifier=7, flags_offset=0))
+
+    assert len(results) == 1
+    assert _without_checksum(results[0]) == _without_checksum(expected)
+    # checksum of the rebuilt header is valid, so sum of its words is all ones
+    words = sum(struct.unpack('! 10H', results[0][14:34]))
+    assert (words & 0xFFFF) + (words >> 16) == 0xFFFF
+
+
+@pytest.mark.parametrize('pieces', [_PIECES, _OVERLAPPING, _DUPLICATED])
+@pytest.mark.parametrize('seed', range(5))
+def test_ipv6_fragments(pieces, seed):
+    segment = _segment()
+    fragments = _ipv6_fragments(segment, pieces)
+    random.Random(seed).shuffle(fragments)
+
+    assert _reassemble(fragments) == [synth.ethernet(_IPV6_TYPE, synth.ipv6(_UDP_TYPE, segment))]
+
+
+def test_overlapping_fragment_keeps_earlier_bytes():
+    segment = _segment()
+    fragments = _ipv4_fragments(segment, [(0, 1600), (2400, 3008)])
+    forged = bytearray(segment)
+    forged[800:1600] = bytes(800)  # only the bytes received before differ
+    fragments.append(_ipv4_fragments(bytes(forged), [(800, 2400)])[0])
+
+    results = _reassemble(fragments)
+
+    assert len(results) == 1
+    assert results[0][34:] == segment
+
+
+def test_fragments_of_different_datagrams():
+    segment = _segment()
+    first = _ipv4_fragments(segment, _PIECES, identifier=1)
+    second = _ipv4_fragments(segment[::-1], _PIECES, identifier=2)
+    reassembler = FragmentReassembler()
+
+    assert reassembler.feed(first[0]) is None
+    assert reassembler.feed(second[2]) is None
+    assert reassembler.feed(second[0]) is None
+    assert reassembler.feed(first[2]) is None
+    assert reassembler.feed(second[1])[34:] == segment[::-1]
+    assert reassembler.feed(first[1])[34:] == segment
+    assert len(reassembler) == 0
+    assert reassembler.memory == 0
+
+
+def test_whole_datagrams_pass():
+    reassembler = FragmentReassembler()
+    frame = synth.ethernet(_IPV4_TYPE, synth.ipv4(_UDP_TYPE, _segment()))
+
+    assert reassembler.feed(frame) is frame
+    assert reassembler.reassembled == 0
+
+
+def _tcp(sequence, flags, payload=b''):
+    return synth.ethernet(_IPV4_TYPE, synth.ipv4(_TCP_TYPE, synth.tcp(51000, 443, payload, seq=sequence & 0xFFFFFFFF,
+                                                                     flags=flags)))
+
+
+def _stream(initial, data, order, size=100):
+    # frames of a stream starting at sequence initial: syn, data in segments of size sent in order, fin
+    segments = [_tcp(initial + 1 + start, _PSH_ACK, data[start:start + size]) for start in range(0, len(data), size)]
+
+    return [_tcp(initial, _SYN)] + [segments[i] for i in order(len(segments))] + \
+        [_tcp(initial + 1 + len(data), _FIN_ACK)]
+
+
+def _received(frames):
+    received = bytearray()
+    closed = []
+    reassembler = StreamReassembler(on_data=lambda stream, data: received.extend(data), on_close=closed.append)
+
+    for i, frame in enumerate(frames):
+        reassembler.update(frame, i)
+
+    return bytes(received), closed
+
+
+@pytest.mark.parametrize('initial', [0xFFFFFFFF, 0xFFFFFFFF - 50, 0xFFFFFFFF - 1000, 0x7FFFFFFF])
+@pytest.mark.parametrize('order', ['forward', 'reversed', 'shuffled'])
+def test_sequence_wrap(initial, order):
+    data = random.Random(initial).randbytes(2000)
+    orders = {'forward': range, 'reversed': lambda n: reversed(range(n)),
+              'shuffled': lambda n: random.Random(n).sample(range(n), n)}
+
+    received, closed = _received(_stream(initial, data, orders[order]))
+
+    assert received == data
+    assert len(closed) == 1
+    assert closed[0].bytes == len(data)
+    assert closed[0].gaps == 0
+
+
+def test_retransmission_across_wrap():
+    initial = 0xFFFFFFFF - 150
+    data = random.Random(0).randbytes(400)
+    frames = _stream(initial, data, range)
+    # segments which cross the wrap sent again with different bytes after they were passed, and an old one
+    frames.insert(4, _tcp(initial + 101, _PSH_ACK, bytes(200)))
+    frames.insert(5, _tcp(initial + 1, _PSH_ACK, bytes(100)))
+
+    received, closed = _received(frames)
+
+    assert received == data
+    assert closed[0].gaps == 0
+
+
+def test_segment_half_space_behind_is_old():
+    initial = 0x10
+    data = b'a' * 100
+    frames = _stream(initial, data, range)
+    frames.insert(2, _tcp(initial + 1 - 0x40000000, _ACK, b'b' * 100))
+
+    received, closed = _received(frames)
+
+    assert received == data
+    assert closed[0].gaps == 0
@@ -0,0 +1,174 @@
+import random
+
+import pytest
+
+from bench import synth
+from network.sampling import CountSampler, FlowSampler, AdaptiveSampler, drop_rate, queue_fill
+from tools.pipeline import BoundedQueue
+
+_IPV4_TYPE = 0x0800
+_ARP_TYPE = 0x0806
+_TCP_TYPE = 6
+_UDP_TYPE = 17
+
+_SECOND = 1000000000
+
+
+def _flows(n, seed=0):
+    # both directions of n random tcp and udp flows
+    rnd = random.Random(seed)
+    flows = []
+
+    for _ in range(n):
+        src, dst = rnd.randbytes(4), rnd.randbytes(4)
+        src_port, dst_port = rnd.randrange(1024, 65536), rnd.choice([53, 80, 443])
+
+        if rnd.random() < 0.5:
+            make = lambda a, b: synth.tcp(a, b, b'data')
+            protocol = _TCP_TYPE
+        else:
+            make = lambda a, b: synth.udp(a, b, b'data')
+            protocol = _UDP_TYPE
+
+        flows.append((synth.ethernet(_IPV4_TYPE, synth.ipv4(protocol, make(src_port, dst_port), src=src, dst=dst)),
+                      synth.ethernet(_IPV4_TYPE, synth.ipv4(protocol, make(dst_port, src_port), src=dst, dst=src))))
+
+    return flows
+
+
+def test_count_sampler_keeps_one_in_ratio():
+    sampler = CountSampler(4)
+    kept = [sampler.keep(b'') for _ in range(100)]
+
+    assert kept == [i % 4 == 0 for i in range(100)]
+    assert (sampler.seen, sampler.kept, sampler.estimate) == (100, 25, 100)
+
+
+def test_count_sampler_restarts_on_ratio_change():
+    changes = []
+    sampler = CountSampler(2, on_change=lambda *change: changes.append(change))
+    sampler.keep(b'')
+    sampler.set_ratio(3, 10)
+    kept = [sampler.keep(b'') for _ in range(6)]
+
+    assert kept == [True, False, False, True, False, False]
+    assert sampler.estimate == 2 + 2 * 3
+    assert sampler.changes == changes == [(10, 3)]
+
+    sampler.set_ratio(3, 20)
+    assert sampler.changes == [(10, 3)]
+
+
+def test_bad_ratio():
+    with pytest.raises(ValueError):
+        CountSampler(0)
+    with pytest.raises(ValueError):
+        CountSampler(2).set_ratio(0)
+
+
+@pytest.mark.parametrize('ratio', [2, 4, 16])
+def test_flow_sampler_keeps_both_directions(ratio):
+    sampler = FlowSampler(ratio)
+    flows = _flows(4000)
+    decisions = [(sampler.keep(forward), sampler.keep(reply), sampler.keep(forward)) for forward, reply in flows]
+    kept = sum(decision[0] for decision in decisions)
+
+    assert all(len(set(decision)) == 1 for decision in decisions)
+    assert abs(kept / len(flows) - 1 / ratio) < 3 * (1 / ratio / len(flows)) ** 0.5
+    assert sampler.estimate == 3 * kept * ratio
+
+
+def test_flow_sampler_ratios_are_nested():
+    flows = _flows(2000, seed=1)
+    kept = {ratio: {i for i, (forward, _) in enumerate(flows) if FlowSampler(ratio).keep(forward)}
+            for ratio in (2, 4, 8)}
+
+    assert kept[8] <= kept[4] <= kept[2]
+    assert kept[8] < kept[2]
+
+
+def test_flow_sampler_counts_non_ip_frames():
+    sampler = FlowSampler(3)
+    arp = synth.ethernet(_ARP_TYPE, bytes(28))
+
+    assert [sampler.keep(arp) for _ in range(6)] == [True, False, False, True, False, False]
+
+
+class _Load:
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+
+        return self.values.pop(0)
+
+
+def _feed(sampler, seconds):
+    # one package at the start of every second
+    for second in seconds:
+        sampler.keep(b'', second * _SECOND)
+
+
+def test_adaptive_sampler_raises_ratio_under_load():
+    load = _Load(0.5, 0.5, 0.5, 0.5, 0.5)
+    sampler = AdaptiveSampler(CountSampler(2), load, high=0.1, low=0.01, max_ratio=16)
+
+    _feed(sampler, range(5))
+
+    assert load.calls == 5
+    assert sampler.ratio == 16
+    assert sampler.changes == [(0, 4), (_SECOND, 8), (2 * _SECOND, 16)]
+
+
+def test_adaptive_sampler_checks_once_per_interval():
+    load = _Load(0.5, 0.5)
+    sampler = AdaptiveSampler(CountSampler(), load, high=0.1, low=0.01, interval=2)
+
+    for timestamp in range(0, 4 * _SECOND, _SECOND // 10):
+        sampler.keep(b'', timestamp)
+
+    assert load.calls == 2
+    assert sampler.ratio == 4
+
+
+def test_adaptive_sampler_lowers_ratio_after_settling():
+    load = _Load(0.5, 0.5, 0.0, 0.0, 0.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    sampler = AdaptiveSampler(CountSampler(), load, high=0.1, low=0.01, settle=3)
+
+    _feed(sampler, range(4))
+    assert sampler.ratio == 4
+
+    # load between thresholds resets the calm checks
+    _feed(sampler, range(4, 7))
+    assert sampler.ratio == 4
+
+    _feed(sampler, range(7, 12))
+    assert sampler.ratio == 1
+    assert sampler.changes[-2:] == [(7 * _SECOND, 2), (10 * _SECOND, 1)]
+
+
+def test_adaptive_sampler_passes_attributes_through():
+    inner = CountSampler(2)
+    sampler = AdaptiveSampler(inner, _Load(0.0), high=0.1, low=0.01)
+    sampler.keep(b'', 0)
+
+    assert sampler.seen == inner.seen == 1
+    assert 'CountSampler 1/2' in sampler.get_description()
+
+
+def test_drop_rate_is_per_call():
+    totals = iter([(100, 0), (200, 10), (200, 10), (300, 20)])
+    load = drop_rate(lambda: next(totals))
+
+    assert [load() for _ in range(4)] == [0.0, 0.1, 0.0, 0.1]
+
+
+def test_queue_fill_of_fullest_queue():
+    queues = [BoundedQueue(4), BoundedQueue(10)]
+    queues[0].put(1)
+    queues[1].put(1)
+    queues[1].put(2)
+
+    assert queue_fill(queues)() == 0.25
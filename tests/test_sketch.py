@@ -0,0 +1,75 @@
+import collections
+import random
+
+import pytest
+
+from tools.sketch import SpaceSaving
+
+
+def _skewed_stream(n, keys, seed):
+    # zipf-like: key i is drawn with weight 1 / (i + 1)
+    rnd = random.Random(seed)
+
+    return rnd.choices(range(keys), weights=[1 / (i + 1) for i in range(keys)], k=n)
+
+
+@pytest.mark.parametrize('capacity', [10, 50])
+@pytest.mark.parametrize('seed', range(3))
+def test_guarantees_on_skewed_stream(capacity, seed):
+    stream = _skewed_stream(20000, 1000, seed)
+    exact = collections.Counter(stream)
+    sketch = SpaceSaving(capacity)
+
+    for key in stream:
+        sketch.add(key)
+
+    counters = sketch.top(capacity)
+    minimum = min(count for _, count, _ in counters)
+    reported = {key for key, _, _ in counters}
+
+    assert len(sketch) == capacity
+    assert sketch.total == len(stream)
+    assert sum(count for _, count, _ in counters) == len(stream)
+
+    for key, count, error in counters:
+        assert exact[key] <= count <= exact[key] + minimum
+        assert count - error <= exact[key]
+        assert error <= minimum <= len(stream) / capacity
+
+    for key, frequency in exact.items():
+        if frequency > len(stream) / capacity:
+            assert key in reported
+
+
+def test_top_is_ordered_and_exact_below_capacity():
+    sketch = SpaceSaving(10)
+
+    for key, count in [('a', 3), ('b', 7), ('c', 5)]:
+        for _ in range(count):
+            sketch.add(key)
+
+    assert sketch.top(2) == [('b', 7, 0), ('c', 5, 0)]
+    assert len(sketch) == 3
+
+
+def test_new_key_takes_over_smallest_counter():
+    sketch = SpaceSaving(2)
+    sketch.add('a', 5)
+    sketch.add('b', 2)
+    sketch.add('b', 1)
+    sketch.add('c')
+
+    assert sketch.top() == [('a', 5, 0), ('c', 4, 3)]
+
+
+def test_clear_and_capacity():
+    sketch = SpaceSaving(2)
+    sketch.add('a')
+    sketch.clear()
+
+    assert len(sketch) == 0
+    assert sketch.total == 0
+    assert sketch.top() == []
+
+    with pytest.raises(ValueError):
+        SpaceSaving(0)
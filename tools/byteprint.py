@@ -1,3 +1,9 @@
+from functools import lru_cache
+
+# addresses repeat a lot in traffic, so their strings are cached
+ADDRESS_CACHE_SIZE = 4096
+
+
 def chunks(seq, chunk_size):
     for i in range(0, len(seq), chunk_size):
         yield seq[i: i + chunk_size]
@@ -8,16 +14,16 @@ def get_bytes_str(bytes_, max_length=None, sep=' '):
         return '0x' + hex(bytes_).lstrip('0x').upper()
 
     if max_length is None or len(bytes_) <= max_length:
-        return sep.join(map('{:02x}'.format, bytes_)).upper()
+        return bytes(bytes_).hex(sep).upper() if sep else bytes(bytes_).hex().upper()
 
-    return sep.join(map('{:02x}'.format, bytes_[0:max_length])).upper() + '...'
+    return get_bytes_str(bytes_[0:max_length], sep=sep) + '...'
 
 
 def to_mac_address(bytes_):
     if len(bytes_) != 6:
         raise ValueError('Invalid bytes amount for mac')
 
-    return ':'.join(map('{:02x}'.format, bytes_)).upper()
+    return _format_mac(bytes(bytes_))
 
 
 def to_hexed_int(val, length=None):
@@ -31,14 +37,29 @@ def to_ipv4_address(bytes_):
     if len(bytes_) != 4:
         raise ValueError('Invalid bytes amount for ipv4 address')
 
-    return '.'.join(map(str, bytes_))
+    return _format_ipv4(bytes(bytes_))
 
 
 def to_ipv6_address(bytes_):
     if len(bytes_) != 16:
         raise ValueError('Invalid bytes amount for ipv6 address')
 
-    return ':'.join(map(lambda x: get_bytes_str(x, sep='').zfill(4), chunks(bytes_, 2)))
+    return _format_ipv6(bytes(bytes_))
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _format_mac(bytes_):
+    return bytes_.hex(':').upper()
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _format_ipv4(bytes_):
+    return '%d.%d.%d.%d' % tuple(bytes_)
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _format_ipv6(bytes_):
+    return bytes_.hex(':', 2).upper()
 
 
 def to_binary(bytes_):
@@ -51,10 +72,12 @@ def to_binary(bytes_):
     raise ValueError
 
 
-def to_hex_dump(bytes_, rows=16, tab=''):
-    dump = ''
+def to_hex_dump(bytes_, rows=16, tab='', max_length=None):
+    # whole data is converted at once and cut into lines, max_length limits number of dumped bytes
+    if max_length is not None and len(bytes_) > max_length:
+        return to_hex_dump(bytes_[:max_length], rows, tab) + f'{tab}... {len(bytes_) - max_length} more bytes\n'
 
-    for chunk in chunks(bytes_, rows):
-        dump += f'{tab}{get_bytes_str(chunk)}\n'
+    dump = bytes(bytes_).hex(' ').upper()
+    width = rows * 3
 
-    return dump
+    return ''.join([f'{tab}{dump[i:i + width - 1]}\n' for i in range(0, len(dump), width)])
@@ -0,0 +1,237 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+PREFIX = 'sniffer'
+DUMP_INTERVAL = 10.0
+SAMPLE_INTERVAL = 0.001
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, n=1):
+        self.value += n
+
+
+class Timer:
+    # number of measured calls and their total time in nanoseconds
+    __slots__ = ('count', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def add(self, nanoseconds):
+        self.count += 1
+        self.total += nanoseconds
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels)) + '}'
+
+
+class Metrics:
+    # Registry of counters, stage timers and gauges (functions read on export) with Prometheus text export.
+    # Names are given without prefix and _total suffix, labels as keyword arguments.
+    # Instruments are created on first use and kept, so hot paths should get them once and keep the reference.
+
+    def __init__(self, prefix=PREFIX):
+        self.__prefix = prefix
+        self.__counters = {}
+        self.__timers = {}
+        self.__gauges = {}
+        self.__help = {}
+
+    def counter(self, name, help_='', **labels) -> Counter:
+        return self.__get(self.__counters, Counter, name, help_, labels)
+
+    def timer(self, stage) -> Timer:
+        return self.__get(self.__timers, Timer, 'stage', 'time spent in stage', {'stage': stage})
+
+    def gauge(self, name, function, help_='', **labels):
+        self.__gauges[name, tuple(labels.items())] = function
+        self.__help.setdefault(name, help_)
+
+    def timed(self, stage, func):
+        timer = self.timer(stage)
+        clock = time.perf_counter_ns
+
+        def measured(*args):
+            start = clock()
+
+            try:
+                return func(*args)
+            finally:
+                timer.add(clock() - start)
+
+        return measured
+
+    def to_prometheus(self):
+        lines = []
+        prefix = self.__prefix
+
+        for name, series in _group(self.__counters).items():
+            full = f'{prefix}_{name}_total'
+            lines += [f'# HELP {full} {self.__help[name]}', f'# TYPE {full} counter']
+            lines += [f'{full}{_labels(labels)} {counter.value}' for labels, counter in series]
+
+        for name, series in _group(self.__timers).items():
+            seconds, calls = f'{prefix}_{name}_seconds_total', f'{prefix}_{name}_calls_total'
+            lines += [f'# HELP {seconds} {self.__help[name]}', f'# TYPE {seconds} counter']
+            lines += [f'{seconds}{_labels(labels)} {timer.total / 1e9:.9f}' for labels, timer in series]
+            lines += [f'# HELP {calls} number of measured calls', f'# TYPE {calls} counter']
+            lines += [f'{calls}{_labels(labels)} {timer.count}' for labels, timer in series]
+
+        for name, series in _group(self.__gauges).items():
+            full = f'{prefix}_{name}'
+            lines += [f'# HELP {full} {self.__help[name]}', f'# TYPE {full} gauge']
+            lines += [f'{full}{_labels(labels)} {function()}' for labels, function in series]
+
+        return '\n'.join(lines) + '\n'
+
+    def __get(self, instruments, factory, name, help_, labels):
+        key = name, tuple(labels.items())
+        instrument = instruments.get(key)
+
+        if instrument is None:
+            instrument = instruments[key] = factory()
+            self.__help.setdefault(name, help_)
+
+        return instrument
+
+
+def _group(instruments):
+    groups = {}
+
+    for (name, labels), instrument in instruments.items():
+        groups.setdefault(name, []).append((labels, instrument))
+
+    return groups
+
+
+class MetricsExporter:
+    # Writes metrics every interval seconds to the file, replacing it at once, and on SIGUSR1.
+    # Without file they are written to stderr on SIGUSR1 and on stop. The signal handler is set only in the main thread.
+
+    def __init__(self, metrics: Metrics, filename=None, interval=DUMP_INTERVAL):
+        self.__metrics = metrics
+        self.__filename = filename
+        self.__interval = interval
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.__previous_handler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        if self.__filename and self.__interval > 0:
+            self.__thread = threading.Thread(target=self.__work, name='metrics-export', daemon=True)
+            self.__thread.start()
+
+        if threading.current_thread() is threading.main_thread():
+            self.__previous_handler = signal.signal(signal.SIGUSR1, lambda signum, frame: self.dump())
+
+    def stop(self):
+        # the last state is always written, to stderr when there is no file
+        self.__stopped.set()
+
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+        if self.__previous_handler is not None:
+            signal.signal(signal.SIGUSR1, self.__previous_handler)
+            self.__previous_handler = None
+
+        self.dump()
+
+    def dump(self):
+        text = self.__metrics.to_prometheus()
+
+        if not self.__filename:
+            sys.stderr.write(text)
+            return
+
+        temporary = f'{self.__filename}.tmp'
+
+        with open(temporary, 'w') as file:
+            file.write(text)
+
+        os.replace(temporary, self.__filename)
+
+    def __work(self):
+        while not self.__stopped.wait(self.__interval):
+            self.dump()
+
+
+class SamplingProfiler:
+    # Every interval seconds of CPU time of the process (ITIMER_PROF) looks at the stack of the main thread
+    # and counts the sample for the class of the innermost method whose self is instance of one of classes,
+    # or for 'other'. Samples are counted in metrics as profile_samples with class label.
+    # Signal handlers run in the main thread, so only work done there is attributed to classes.
+
+    def __init__(self, metrics: Metrics, classes, interval=SAMPLE_INTERVAL):
+        self.__metrics = metrics
+        self.__classes = tuple(classes)
+        self.__interval = interval
+        self.__samples = {}
+        self.__previous_handler = None
+        self.__running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        self.__previous_handler = signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.__interval, self.__interval)
+        self.__running = True
+
+    def stop(self):
+        if not self.__running:
+            return
+
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL if self.__previous_handler is None else self.__previous_handler)
+        self.__running = False
+
+    def __sample(self, signum, frame):
+        name = 'other'
+
+        while frame is not None:
+            code = frame.f_code
+
+            if code.co_argcount and code.co_varnames[0] == 'self':
+                owner = frame.f_locals.get('self')
+
+                if isinstance(owner, self.__classes):
+                    name = type(owner).__name__
+                    break
+
+            frame = frame.f_back
+
+        counter = self.__samples.get(name)
+
+        if counter is None:
+            counter = self.__samples[name] = self.__metrics.counter('profile_samples',
+                                                                    f'cpu time samples of {self.__interval}s',
+                                                                    **{'class': name})
+
+        counter.add()
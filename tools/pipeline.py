@@ -0,0 +1,159 @@
+import collections
+import threading
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+OVERFLOW_POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST]
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class BoundedQueue:
+    def __init__(self, capacity, policy=BLOCK):
+        if capacity <= 0:
+            raise ValueError('Queue capacity must be positive')
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+
+        self.__items = collections.deque()
+        self.__capacity = capacity
+        self.__policy = policy
+        self.__closed = False
+        self.__drops = 0
+        self.__max_depth = 0
+        self.__lock = threading.Lock()
+        self.__not_empty = threading.Condition(self.__lock)
+        self.__not_full = threading.Condition(self.__lock)
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def policy(self):
+        return self.__policy
+
+    @property
+    def depth(self):
+        return len(self.__items)
+
+    @property
+    def max_depth(self):
+        return self.__max_depth
+
+    @property
+    def drops(self):
+        return self.__drops
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    def put(self, item):
+        with self.__lock:
+            if self.__closed:
+                raise QueueClosed
+
+            if len(self.__items) >= self.__capacity:
+                if self.__policy == DROP_NEWEST:
+                    self.__drops += 1
+                    return False
+
+                if self.__policy == DROP_OLDEST:
+                    self.__items.popleft()
+                    self.__drops += 1
+                else:
+                    while len(self.__items) >= self.__capacity and not self.__closed:
+                        self.__not_full.wait()
+
+                    if self.__closed:
+                        raise QueueClosed
+
+            self.__items.append(item)
+            self.__max_depth = max(self.__max_depth, len(self.__items))
+            self.__not_empty.notify()
+
+            return True
+
+    def get_batch(self, n=64, timeout=None):
+        # waits for at least one item, raises QueueClosed once the queue is closed and drained,
+        # returns empty batch when nothing is put within timeout seconds
+        with self.__lock:
+            while not self.__items:
+                if self.__closed:
+                    raise QueueClosed
+
+                if not self.__not_empty.wait(timeout) and not self.__items:
+                    return []
+
+            items = self.__items
+            batch = [items.popleft() for _ in range(min(n, len(items)))]
+            self.__not_full.notify_all()
+
+            return batch
+
+    def close(self):
+        with self.__lock:
+            self.__closed = True
+            self.__not_empty.notify_all()
+            self.__not_full.notify_all()
+
+
+class Stage(threading.Thread):
+    # calls handler for every item of the input queue, or repeatedly when there is no input,
+    # and puts each result which is not None into all output queues;
+    # handler raises StopIteration to finish the stage, outputs are closed when it finishes.
+    # on_idle is called in the stage thread when no input arrives for idle_timeout seconds.
+
+    def __init__(self, name, handler, input_queue: BoundedQueue = None, output_queues=(), on_idle=None,
+                 idle_timeout=None):
+        super().__init__(name=name, daemon=True)
+        self.__handler = handler
+        self.__input = input_queue
+        self.__outputs = list(output_queues)
+        self.__on_idle = on_idle
+        self.__idle_timeout = None if on_idle is None else idle_timeout
+        self.__processed = 0
+
+    @property
+    def input_queue(self):
+        return self.__input
+
+    @property
+    def processed(self):
+        return self.__processed
+
+    def run(self):
+        handler = self.__handler
+        outputs = self.__outputs
+
+        try:
+            while True:
+                items = [None] if self.__input is None else self.__input.get_batch(timeout=self.__idle_timeout)
+
+                if not items:
+                    self.__on_idle()
+
+                for item in items:
+                    result = handler() if self.__input is None else handler(item)
+                    self.__processed += 1
+
+                    if result is not None:
+                        for output in outputs:
+                            output.put(result)
+        except (QueueClosed, StopIteration):
+            pass
+        finally:
+            for output in outputs:
+                output.close()
+
+    def get_description(self):
+        if self.__input is None:
+            return f'{self.name}: processed {self.__processed}'
+
+        return f'{self.name}: processed {self.__processed}, ' \
+               f'queue depth {self.__input.depth} (max {self.__input.max_depth} of {self.__input.capacity}), ' \
+               f'dropped {self.__input.drops}'
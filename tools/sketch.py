@@ -0,0 +1,76 @@
+import heapq
+
+
+class SpaceSaving:
+    # Space-Saving heavy hitters: keeps at most capacity counters, a new key takes over the counter
+    # of the smallest one and inherits its count as possible overestimation (error).
+    # Any key with true count above total / capacity is guaranteed to be kept.
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError('Capacity must be positive')
+
+        self.__capacity = capacity
+        self.__counts = {}
+        self.__errors = {}
+        self.__heap = []  # (count when pushed, key), counts only grow so stale entries are fixed on pop
+        self.__total = 0
+
+    def __len__(self):
+        return len(self.__counts)
+
+    @property
+    def capacity(self):
+        return self.__capacity
+
+    @property
+    def total(self):
+        return self.__total
+
+    def add(self, key, weight=1):
+        counts = self.__counts
+        self.__total += weight
+
+        if key in counts:
+            counts[key] += weight
+            return
+
+        if len(counts) < self.__capacity:
+            counts[key] = weight
+            self.__errors[key] = 0
+            heapq.heappush(self.__heap, (weight, key))
+            return
+
+        minimum, victim = self.__pop_minimum()
+        del counts[victim]
+        del self.__errors[victim]
+
+        counts[key] = minimum + weight
+        self.__errors[key] = minimum
+        heapq.heappush(self.__heap, (minimum + weight, key))
+
+    def top(self, n=10):
+        # list of (key, estimated count, maximum overestimation)
+        keys = heapq.nlargest(n, self.__counts, key=self.__counts.__getitem__)
+
+        return [(key, self.__counts[key], self.__errors[key]) for key in keys]
+
+    def clear(self):
+        self.__counts.clear()
+        self.__errors.clear()
+        self.__heap.clear()
+        self.__total = 0
+
+    def __pop_minimum(self):
+        heap = self.__heap
+        counts = self.__counts
+
+        while True:
+            count, key = heap[0]
+            current = counts[key]
+
+            if current == count:
+                heapq.heappop(heap)
+                return count, key
+
+            heapq.heapreplace(heap, (current, key))